@@ -0,0 +1,271 @@
+# Streaming export/import of history archives.
+#
+# An archive is a gzip-compressed file of newline-delimited JSON records:
+#
+#   {"format": "macs-clipboard-archive", "version": 1, ...}   header, always first
+#   {"kind": "image", "digest": ..., "data": <base64 PNG>}    before the first item using it
+#   {"kind": "blob", "digest": ..., "text": ..., "last": ...} large text, in chunks
+#   {"kind": "item", "item": {...}}                           one history item
+#
+# Rich formats of an item (HTML, RTF, file lists) are blobs too. Items refer
+# to their image/blobs by digest, so a record never holds more than
+# one image or one chunk of text, and import never needs the whole archive in
+# memory. Import skips anything whose content is already in the history.
+import gzip
+import io
+import json
+import os
+from datetime import datetime
+import blob_store
+import classify
+import history_core
+
+ARCHIVE_FORMAT = "macs-clipboard-archive"
+ARCHIVE_VERSION = 1
+ARCHIVE_EXTENSION = ".clipz"
+# Items are merged into the history this many at a time
+IMPORT_BATCH = 500
+
+# Function to only pass on progress when the whole percentage changes
+def _throttled(progress):
+    if progress is None:
+        return None
+    last = [-1]
+    def report(done, total):
+        percent = done * 100 // max(total, 1)
+        if percent != last[0]:
+            last[0] = percent
+            progress(done, total)
+    return report
+
+def _write_record(file, record):
+    file.write(json.dumps(record, separators=(',', ':')))
+    file.write("\n")
+
+# Function to write a text blob as chunk records
+def _write_blob(file, digest):
+    chunks = blob_store.iter_text(digest)
+    chunk = next(chunks, "")
+    for following in chunks:
+        _write_record(file, {'kind': 'blob', 'digest': digest, 'text': chunk, 'last': False})
+        chunk = following
+    _write_record(file, {'kind': 'blob', 'digest': digest, 'text': chunk, 'last': True})
+
+# Function to write history items to an archive
+def export_archive(path, history, progress=None):
+    """progress(done, total) is called as items are written; returns the number of items"""
+    progress = _throttled(progress)
+    tmp_path = f"{path}.tmp"
+    written_images = set()
+    written_blobs = set()
+    total = len(history)
+    with gzip.open(tmp_path, "wt", encoding="utf-8", errors="surrogatepass", compresslevel=6) as file:
+        _write_record(file, {
+            'format': ARCHIVE_FORMAT,
+            'version': ARCHIVE_VERSION,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'items': total
+        })
+        for done, item in enumerate(history, 1):
+            record = dict(item)
+            if record.get('type', 'text') == 'image':
+                digest = history_core.content_hash(item)
+                if digest not in written_images:
+                    _write_record(file, {'kind': 'image', 'digest': digest, 'data': record['image_data']})
+                    written_images.add(digest)
+                del record['image_data']
+                record['image'] = digest
+            elif record.get('blob'):
+                if blob_store.has_blob(record['blob']):
+                    if record['blob'] not in written_blobs:
+                        _write_blob(file, record['blob'])
+                        written_blobs.add(record['blob'])
+                else:
+                    # Blob went missing; keep what we have (the preview) as plain text
+                    print(f"Blob {record['blob']} is missing, exporting its preview only")
+                    del record['blob']
+                    record.pop('size', None)
+            if record.get('formats'):
+                record['formats'] = {name: digest for name, digest in record['formats'].items()
+                                     if blob_store.has_blob(digest)}
+                for digest in record['formats'].values():
+                    if digest not in written_blobs:
+                        _write_blob(file, digest)
+                        written_blobs.add(digest)
+            _write_record(file, {'kind': 'item', 'item': record})
+            if progress:
+                progress(done, total)
+    os.replace(tmp_path, path)
+    return total
+
+# Function to read an archive one record at a time
+def _read_records(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+# Function to check an image or blob record has what importing it needs
+def _record_ok(record, field):
+    return isinstance(record.get('digest'), str) and isinstance(record.get(field), str)
+
+# Function to yield the text of a blob whose first record has been read already
+def _blob_chunks(first, records):
+    yield first['text']
+    record = first
+    while not record.get('last'):
+        record = next(records, None)
+        if (not isinstance(record, dict) or record.get('kind') != 'blob'
+                or record.get('digest') != first['digest'] or not _record_ok(record, 'text')):
+            raise ValueError("archive has an incomplete text blob")
+        yield record['text']
+
+# Function to skip the rest of a blob we already have
+def _skip_blob(first, records):
+    for chunk in _blob_chunks(first, records):
+        pass
+
+# Function to merge an archive into a history
+def import_archive(path, history, max_history=history_core.MAX_HISTORY, progress=None):
+    """Return (new_history, stats); history itself is not modified.
+
+    progress(done_bytes, total_bytes) is called as the compressed file is read.
+    """
+    progress = _throttled(progress)
+    seen = {history_core.content_hash(item) for item in history}
+    ids = {item.get('id') for item in history}
+    old_ids = set(ids)
+    stats = {'items': 0, 'duplicates': 0, 'images': 0, 'blobs': 0, 'skipped': 0}
+    pending_images = {}  # digest -> base64 data, until the item using it arrives
+    broken_blobs = set()  # digests of blobs cut short; the rest of their chunks are ignored
+    batch = []
+    merged = list(history)
+    total_bytes = os.path.getsize(path)
+
+    with open(path, "rb") as raw:
+        text = io.TextIOWrapper(gzip.GzipFile(fileobj=raw), encoding="utf-8", errors="surrogatepass")
+        records = _read_records(text)
+        header = next(records, None)
+        if not header or header.get('format') != ARCHIVE_FORMAT:
+            raise ValueError("not a clipboard history archive")
+        if header.get('version', 0) > ARCHIVE_VERSION:
+            raise ValueError(f"archive version {header['version']} is newer than this app")
+
+        for record in records:
+            if not isinstance(record, dict):
+                stats['skipped'] += 1
+                continue
+            kind = record.get('kind')
+            if kind == 'image':
+                if not _record_ok(record, 'data'):
+                    stats['skipped'] += 1
+                elif record['digest'] not in seen:
+                    pending_images[record['digest']] = record['data']
+            elif kind == 'blob':
+                if not _record_ok(record, 'text') or record['digest'] in broken_blobs:
+                    stats['skipped'] += 1
+                    continue
+                try:
+                    if record['digest'] in seen or blob_store.has_blob(record['digest']):
+                        _skip_blob(record, records)
+                    else:
+                        # Only stored once every chunk arrived; items using it keep their preview
+                        blob_store.put_chunks(_blob_chunks(record, records), record['digest'])
+                        stats['blobs'] += 1
+                except ValueError:
+                    broken_blobs.add(record['digest'])
+                    stats['skipped'] += 1
+            elif kind == 'item':
+                item = record.get('item')
+                if not isinstance(item, dict):
+                    stats['skipped'] += 1
+                    continue
+                if 'image' in item:
+                    digest = item.pop('image')
+                    if digest in seen:
+                        stats['duplicates'] += 1
+                        continue
+                    if digest not in pending_images:
+                        stats['skipped'] += 1
+                        continue
+                    item['image_data'] = pending_images.pop(digest)
+                    stats['images'] += 1
+                elif item.get('blob') and not blob_store.has_blob(item['blob']):
+                    # Exported without its blob; keep the preview as plain text
+                    del item['blob']
+                    item.pop('size', None)
+                if item.get('formats'):
+                    item['formats'] = {name: format_digest for name, format_digest in item['formats'].items()
+                                       if blob_store.has_blob(format_digest)}
+                # One bad record shouldn't cost the rest of the archive
+                if history_core.item_problem(item) or 'timestamp' not in item:
+                    stats['skipped'] += 1
+                    continue
+                digest = history_core.content_hash(item)
+                if digest in seen:
+                    stats['duplicates'] += 1
+                    continue
+                seen.add(digest)
+                if not item.get('id') or item['id'] in ids:
+                    item['id'] = history_core.new_item_id()
+                ids.add(item['id'])
+                # Archives from before items had a kind; we're off the Tk thread already
+                classify.kind_of(item)
+                batch.append(item)
+                stats['items'] += 1
+                if len(batch) >= IMPORT_BATCH:
+                    merged = history_core.merge_items(merged, batch, max_history)
+                    batch = []
+            if progress:
+                progress(raw.tell(), total_bytes)
+
+    if batch:
+        merged = history_core.merge_items(merged, batch, max_history)
+    # Older items can fall off the end when the history is full
+    kept = sum(1 for item in merged if item.get('id') not in old_ids)
+    stats['trimmed'] = stats['items'] - kept
+    stats['items'] = kept
+    return merged, stats
+
+# Function to describe an import's stats for the user
+def import_summary(stats):
+    summary = f"Imported {stats['items']} items ({stats['duplicates']} duplicates"
+    if stats['skipped']:
+        summary += f", {stats['skipped']} unreadable"
+    summary += " skipped"
+    if stats.get('trimmed'):
+        summary += f", {stats['trimmed']} older than the history limit"
+    return summary + ")"
+
+# Function to run --export/--import from the command line
+def run_cli(argv, max_history=history_core.MAX_HISTORY):
+    def show_progress(done, total):
+        print(f"\r{done * 100 // max(total, 1):3d}%", end="", flush=True)
+
+    option = '--export' if '--export' in argv else '--import'
+    position = argv.index(option) + 1
+    if position >= len(argv):
+        print(f"Usage: clipboard_manager.py {option} <file>")
+        return 2
+    path = argv[position]
+
+    if option == '--export':
+        history = history_core.load_history_file()
+        count = export_archive(path, history, show_progress)
+        print(f"\nExported {count} items to {path}")
+        return 0
+
+    # Only the writer may change the history file
+    if not history_core.acquire_writer_lock('import'):
+        owner = history_core.read_writer_lock() or {}
+        print(f"The history is in use by the {owner.get('role', 'clipboard manager')} "
+              f"(pid {owner.get('pid', '?')}); import from its Settings window or stop it first")
+        return 1
+    try:
+        history = history_core.load_history_file()
+        history, stats = import_archive(path, history, max_history, show_progress)
+        history_core.save_history_file(history)
+    finally:
+        history_core.release_writer_lock()
+    print(f"\n{import_summary(stats)}")
+    return 0
@@ -0,0 +1,89 @@
+"""Measure how long copying an image item back to the clipboard takes.
+
+For screenshots of several sizes this times:
+  * old      - base64 decode, PIL decode, convert to RGB, encode BMP (the old double-click path)
+  * prepare  - clipboard_writer.prepare, i.e. a cache miss (base64 decode; plus the DIB on Windows)
+  * cached   - clipboard_writer.payload_for on a prepared item (pinned/recent items)
+  * write    - clipboard_writer.copy_item end to end (only with --write; needs a clipboard)
+
+    python benchmarks/bench_copy.py
+    python benchmarks/bench_copy.py --sizes 1920x1080 5120x2880 --write
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+import capture
+import clipboard_writer
+import history_core
+from bench_history import measure, summarize
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Function to draw something that compresses like a real screenshot
+def make_screenshot(width, height, seed=3):
+    rng = random.Random(seed)
+    img = Image.new('RGB', (width, height), '#f5f6f7')
+    draw = ImageDraw.Draw(img)
+    for _ in range(60):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.rectangle([x, y, x + rng.randint(50, width // 3), y + rng.randint(20, height // 4)],
+                       fill=tuple(rng.randrange(256) for _ in range(3)))
+    for line in range(0, height, 18):
+        draw.text((10, line), "clipboard manager screenshot line %d" % line, fill='black')
+    # A photo-like corner, which is what makes real screenshots big
+    corner = Image.frombytes('RGB', (width // 4, height // 4), rng.randbytes(width // 4 * (height // 4) * 3))
+    img.paste(corner, (width - corner.width, height - corner.height))
+    return img
+
+def old_copy_path(item):
+    img = capture.base64_to_image(item['image_data'])
+    output = io.BytesIO()
+    img.convert('RGB').save(output, 'BMP')
+    return output.getvalue()[14:]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark copying image items back to the clipboard")
+    parser.add_argument("--sizes", nargs="+", default=["1920x1080", "3840x2160", "5120x2880"])
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds per operation")
+    parser.add_argument("--write", action="store_true", help="also time the real clipboard write")
+    parser.add_argument("--label", default="local")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        width, height = (int(v) for v in size.lower().split("x"))
+        item = history_core.make_image_item(capture.image_to_base64(make_screenshot(width, height)))
+        row = {'size': size, 'png_bytes': len(item['image_data']) * 3 // 4, 'ops': {}}
+
+        row['ops']['old'] = summarize(measure(lambda: old_copy_path(item), budget=args.budget))
+        row['ops']['prepare'] = summarize(measure(lambda: clipboard_writer.prepare(item), budget=args.budget))
+        clipboard_writer.payload_for(item)
+        row['ops']['cached'] = summarize(measure(lambda: clipboard_writer.payload_for(item), budget=args.budget))
+        if args.write:
+            row['ops']['write'] = summarize(measure(lambda: clipboard_writer.copy_item(item), budget=args.budget))
+        clipboard_writer.forget(item['id'])
+        results.append(row)
+
+        print(f"== {size} ({row['png_bytes'] / 1e6:.1f} MB PNG)")
+        for name, summary in row['ops'].items():
+            print(f"{name:<10}{summary['p50_ms']:>12.3f} ms p50{summary['p95_ms']:>12.3f} ms p95")
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"copy-{args.label}-{datetime.now():%Y%m%d-%H%M%S}.json")
+        with open(path, "w") as file:
+            json.dump({'label': args.label, 'created': datetime.now().isoformat(timespec='seconds'),
+                       'platform': sys.platform, 'sizes': results}, file, indent=2)
+        print(f"Saved results to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Headless benchmarks for the clipboard history engine.
+
+Builds synthetic histories (mixed text sizes, images and pinned items) and
+times the operations in history_core without needing a display:
+
+    python benchmarks/bench_history.py
+    python benchmarks/bench_history.py --sizes 100 10000 1000000 --label my-change
+    python benchmarks/bench_history.py --compare benchmarks/results/old.json
+
+Every run is written to benchmarks/results/<label>-<timestamp>.json so two
+versions can be compared with --compare.
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import history_core
+import fuzzy_search
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Text sizes in characters and how often each shows up
+TEXT_SIZES = [(20, 0.5), (400, 0.35), (8000, 0.14), (200000, 0.01)]
+WORDS = ["lorem", "ipsum", "clipboard", "manager", "http://example.com", "def", "return",
+         "import", "error", "value", "json", "image", "pinned", "search", "token"]
+
+# Function to build a random text of roughly the requested length
+def make_text(rng, length):
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:length]
+
+# Function to build a synthetic history
+def make_history(size, image_ratio, pin_ratio, image_bytes, seed):
+    rng = random.Random(seed)
+    sizes, weights = zip(*TEXT_SIZES)
+    # Reuse a small pool of payloads so 1M-item histories fit in memory
+    texts = {length: [make_text(rng, length) for _ in range(16)] for length in sizes}
+    image_data = [base64.b64encode(rng.randbytes(image_bytes)).decode() for _ in range(4)]
+
+    history = []
+    now = time.time()
+    for i in range(size):
+        timestamp = now - i
+        if rng.random() < image_ratio:
+            item = history_core.make_image_item(rng.choice(image_data),
+                                                rng.choice(texts[20]) if rng.random() < 0.5 else "",
+                                                timestamp)
+        else:
+            length = rng.choices(sizes, weights)[0]
+            # Unique suffix so dedupe has to scan the whole history
+            item = history_core.make_text_item(f"{rng.choice(texts[length])} #{i}", timestamp)
+        item['pinned'] = rng.random() < pin_ratio
+        history.append(item)
+    return history
+
+# Function to time one operation
+def measure(func, min_runs=3, max_runs=200, budget=2.0):
+    """Run func until max_runs or the time budget is used up, return latencies in seconds"""
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_runs:
+        t0 = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - t0)
+        if len(latencies) >= min_runs and time.perf_counter() - started > budget:
+            break
+    return latencies
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(latencies, items_per_run=1):
+    total = sum(latencies)
+    return {
+        'runs': len(latencies),
+        'throughput_per_s': (len(latencies) * items_per_run) / total if total else 0.0,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+# Function to run every operation against one history size
+def bench_size(size, args):
+    rng = random.Random(args.seed + size)
+    tracemalloc.start()
+    history = make_history(size, args.image_ratio, args.pin_ratio, args.image_bytes, args.seed)
+    _, build_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results = {'size': size, 'build_peak_mb': build_peak / 1024 / 1024, 'ops': {}}
+    search_terms = ["clipboard", "#1", "no-such-text", "error"]
+    visible_count = len(history_core.visible_items(history))
+    budget = args.budget
+
+    # Capture: dedupe check + insert + trim on a copy, like check_clipboard does
+    counter = [0]
+    def capture():
+        counter[0] += 1
+        text = f"new clip {counter[0]}"
+        working = list(history)
+        if not history_core.is_duplicate_text(working, text):
+            history_core.add_item(working, history_core.make_text_item(text), max_history=size)
+    results['ops']['capture'] = measure(capture, budget=budget)
+
+    results['ops']['sort'] = measure(lambda: history_core.sorted_history(history), budget=budget)
+
+    def search():
+        history_core.visible_items(history, rng.choice(search_terms))
+    results['ops']['search'] = measure(search, budget=budget)
+
+    fuzzy_terms = ["clpbrd", "managr", "no-such-text", "imprt json"]
+    def fuzzy():
+        fuzzy_search.fuzzy_search(history, rng.choice(fuzzy_terms))
+    results['ops']['fuzzy_search'] = measure(fuzzy, budget=budget)
+
+    def render():
+        for item in history_core.visible_items(history):
+            history_core.display_line(item)
+    results['ops']['render'] = measure(render, budget=budget)
+
+    def render_uncached():
+        for item in history_core.visible_items(history):
+            history_core.format_display_line(item)
+    results['ops']['render_uncached'] = measure(render_uncached, budget=budget)
+
+    def lookup():
+        history_core.get_actual_index(history, rng.randrange(visible_count))
+    results['ops']['get_actual_index'] = measure(lookup, budget=budget)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "clipboard_history.json")
+        results['ops']['save'] = measure(lambda: history_core.save_history_file(history, path),
+                                         max_runs=20, budget=budget)
+        results['file_mb'] = os.path.getsize(path) / 1024 / 1024
+
+        tracemalloc.start()
+        results['ops']['load'] = measure(lambda: history_core.load_history_file(path),
+                                         max_runs=20, budget=budget)
+        _, load_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results['load_peak_mb'] = load_peak / 1024 / 1024
+
+    results['ops'] = {name: summarize(latencies) for name, latencies in results['ops'].items()}
+    return results
+
+# Function to get a label for this version of the code
+def default_label():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if out.returncode == 0 and out.stdout.strip():
+            return out.stdout.strip()
+    except OSError:
+        pass
+    return "local"
+
+def print_results(run):
+    for size_result in run['sizes']:
+        print(f"\n== {size_result['size']} items  (file {size_result['file_mb']:.1f} MB, "
+              f"build peak {size_result['build_peak_mb']:.1f} MB, "
+              f"load peak {size_result['load_peak_mb']:.1f} MB)")
+        print(f"{'operation':<18}{'ops/s':>12}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+        for name, stats in size_result['ops'].items():
+            print(f"{name:<18}{stats['throughput_per_s']:>12.1f}{stats['p50_ms']:>12.3f}"
+                  f"{stats['p95_ms']:>12.3f}{stats['p99_ms']:>12.3f}")
+
+# Function to compare this run with an older result file
+def compare(run, baseline_path, threshold):
+    with open(baseline_path, "r") as file:
+        baseline = json.load(file)
+    old_sizes = {r['size']: r for r in baseline['sizes']}
+    regressions = 0
+    print(f"\nComparing against {baseline['label']} ({baseline['created']}), p50 latency:")
+    for size_result in run['sizes']:
+        old = old_sizes.get(size_result['size'])
+        if not old:
+            continue
+        for name, stats in size_result['ops'].items():
+            old_stats = old['ops'].get(name)
+            if not old_stats or not old_stats['p50_ms']:
+                continue
+            change = (stats['p50_ms'] - old_stats['p50_ms']) / old_stats['p50_ms']
+            flag = ""
+            if change > threshold:
+                flag = "  <-- REGRESSION"
+                regressions += 1
+            print(f"  {size_result['size']:>8} {name:<18}{old_stats['p50_ms']:>10.3f} -> "
+                  f"{stats['p50_ms']:>10.3f} ms ({change:+.0%}){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the clipboard history engine")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--image-ratio", type=float, default=0.1)
+    parser.add_argument("--pin-ratio", type=float, default=0.05)
+    parser.add_argument("--image-bytes", type=int, default=2048,
+                        help="size of each synthetic image payload before base64")
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds per operation")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--label", default=None, help="name for this run (default: git commit)")
+    parser.add_argument("--compare", default=None, help="older result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown that counts as a regression (0.2 = 20%%)")
+    parser.add_argument("--no-save", action="store_true", help="don't write a result file")
+    args = parser.parse_args()
+
+    run = {
+        'label': args.label or default_label(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {key: value for key, value in vars(args).items()
+                   if key not in ('compare', 'no_save', 'label')},
+        'sizes': [],
+    }
+    for size in args.sizes:
+        print(f"Benchmarking {size} items...", file=sys.stderr)
+        run['sizes'].append(bench_size(size, args))
+
+    print_results(run)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(RESULTS_DIR, f"{run['label']}-{stamp}.json")
+        with open(path, "w") as file:
+            json.dump(run, file, indent=2)
+        print(f"\nSaved results to {path}")
+
+    if args.compare:
+        regressions = compare(run, args.compare, args.threshold)
+        if regressions:
+            print(f"\n{regressions} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Measure how much OCR time the preprocessing/gating/cache stage saves.
+
+For every image in a corpus this runs:
+  * baseline - pytesseract.image_to_string on the full-resolution image (the old path)
+  * pipeline - ocr.extract_text with an empty cache (gate + preprocess + Tesseract)
+  * repeat   - ocr.extract_text again for the same image (cache hit)
+
+    python benchmarks/bench_ocr.py --corpus path/to/images
+    python benchmarks/bench_ocr.py            # uses generated sample images
+
+Tesseract runs as a child process, so CPU time is read from os.times() child
+counters (not available on Windows, where only wall time is reported).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+import pytesseract
+import capture  # sets the bundled tesseract path
+import ocr
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+# Function to build a small corpus when none is given
+def sample_images(seed=7):
+    rng = random.Random(seed)
+    images = {}
+
+    # Document-like screenshot: lots of text lines
+    doc = Image.new('RGB', (1600, 1000), 'white')
+    draw = ImageDraw.Draw(doc)
+    for line in range(40):
+        words = " ".join(rng.choice(["invoice", "total", "clipboard", "manager", "python",
+                                     "error", "line", "value", "status", "report"])
+                         for _ in range(12))
+        draw.text((40, 20 + line * 24), words, fill='black')
+    images['document.png'] = doc
+
+    # Small text crop
+    crop = Image.new('RGB', (400, 30), '#f0f0f0')
+    ImageDraw.Draw(crop).text((5, 8), "Order #12345 shipped to 221B Baker St", fill='#202020')
+    images['text_crop.png'] = crop
+
+    # Photo-like image: smooth noise, no text
+    photo = Image.new('RGB', (1920, 1080))
+    photo.putdata([(int(128 + 100 * ((x / 1920) - 0.5) + rng.randint(-30, 30)),
+                    int(90 + 80 * (y / 1080) + rng.randint(-30, 30)),
+                    rng.randint(60, 200))
+                   for y in range(1080) for x in range(1920)])
+    images['photo.png'] = photo
+
+    # Flat UI screenshot: big colored panels, no text
+    ui = Image.new('RGB', (1920, 1080), '#ecf0f1')
+    ui_draw = ImageDraw.Draw(ui)
+    for _ in range(12):
+        x, y = rng.randint(0, 1700), rng.randint(0, 900)
+        ui_draw.rectangle([x, y, x + rng.randint(100, 400), y + rng.randint(40, 200)],
+                          fill=rng.choice(['#3498db', '#2c3e50', '#e74c3c', '#95a5a6']))
+    images['ui_panels.png'] = ui
+    return images
+
+def load_corpus(path):
+    images = {}
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with Image.open(os.path.join(path, name)) as img:
+                images[name] = img.copy()
+    return images
+
+def child_cpu():
+    times = os.times()
+    return times.children_user + times.children_system
+
+# Function to time one call: (wall seconds, child cpu seconds, result)
+def timed(func, *args):
+    cpu = child_cpu()
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, child_cpu() - cpu, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the OCR stage")
+    parser.add_argument("--corpus", help="directory of sample images (default: generated)")
+    parser.add_argument("--label", default="local")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    images = load_corpus(args.corpus) if args.corpus else sample_images()
+    if not images:
+        sys.exit("No images found")
+
+    # Keep the benchmark's cache away from the real one
+    ocr.OCR_CACHE_FILE = os.path.join(tempfile.mkdtemp(), "ocr_cache.json")
+
+    rows = []
+    for name, img in images.items():
+        key = ocr.fingerprint(capture.image_to_base64(img))
+        base_wall, base_cpu, base_text = timed(lambda: pytesseract.image_to_string(img).strip())
+        gate_wall, _, likelihood = timed(ocr.text_likelihood, img)
+        pipe_wall, pipe_cpu, pipe_text = timed(ocr.extract_text, img, key)
+        repeat_wall, repeat_cpu, _ = timed(ocr.extract_text, img, key)
+        rows.append({
+            'image': name,
+            'size': list(img.size),
+            'likelihood': likelihood,
+            'gated': likelihood < ocr.TEXT_LIKELIHOOD_THRESHOLD,
+            'baseline_s': base_wall, 'baseline_cpu_s': base_cpu,
+            'pipeline_s': pipe_wall, 'pipeline_cpu_s': pipe_cpu,
+            'repeat_s': repeat_wall, 'repeat_cpu_s': repeat_cpu,
+            'gate_s': gate_wall,
+            'baseline_chars': len(base_text), 'pipeline_chars': len(pipe_text)
+        })
+
+    print(f"{'image':<24}{'size':>12}{'text?':>8}{'baseline s':>12}{'pipeline s':>12}"
+          f"{'repeat s':>10}{'chars old/new':>16}")
+    for row in rows:
+        size = f"{row['size'][0]}x{row['size'][1]}"
+        print(f"{row['image'][:23]:<24}{size:>12}{'no' if row['gated'] else 'yes':>8}"
+              f"{row['baseline_s']:>12.3f}{row['pipeline_s']:>12.3f}{row['repeat_s']:>10.4f}"
+              f"{row['baseline_chars']:>8}/{row['pipeline_chars']:<7}")
+
+    count = len(rows)
+    baseline_cpu = sum(r['baseline_cpu_s'] for r in rows)
+    pipeline_cpu = sum(r['pipeline_cpu_s'] for r in rows)
+    baseline_wall = sum(r['baseline_s'] for r in rows)
+    pipeline_wall = sum(r['pipeline_s'] for r in rows)
+    print(f"\nPer capture: wall {baseline_wall / count:.3f}s -> {pipeline_wall / count:.3f}s, "
+          f"Tesseract CPU {baseline_cpu / count:.3f}s -> {pipeline_cpu / count:.3f}s "
+          f"(saved {(baseline_cpu - pipeline_cpu) / count:.3f}s CPU per capture)")
+    print(f"Gated (skipped) {sum(r['gated'] for r in rows)} of {count} images; "
+          f"repeat captures are served from cache in {sum(r['repeat_s'] for r in rows) / count * 1000:.2f} ms")
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"ocr-{args.label}-{datetime.now():%Y%m%d-%H%M%S}.json")
+        with open(path, "w") as file:
+            json.dump({'label': args.label, 'created': datetime.now().isoformat(timespec='seconds'),
+                       'images': rows}, file, indent=2)
+        print(f"Saved results to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Measure how long a URL preview screenshot takes and how big it is.
+
+Serves a test page from a local HTTP server (web fonts, a video, images and an
+analytics-style beacon, each with an artificial delay, so no internet is needed)
+and times:
+  * old       - new browser per capture, network idle + 1 s, 1280x720 PNG (the old path)
+  * fast-cold - new browser per capture, url_preview 'fast' mode
+  * fast-warm - 'fast' mode with an already running browser (what the preview worker does)
+
+    python benchmarks/bench_screenshot.py
+    python benchmarks/bench_screenshot.py --runs 10 --url https://example.com
+
+Needs Playwright's Chromium (python -m playwright install chromium).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playwright.sync_api import sync_playwright
+import url_preview
+from bench_history import summarize
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+TEST_PAGE = """<!DOCTYPE html>
+<html><head><title>Screenshot benchmark</title>
+<meta name="description" content="A page with the usual slow extras">
+<style>
+@font-face { font-family: Slow; src: url(/font.woff2?delay=1500) format('woff2'); }
+body { font-family: Slow, sans-serif; margin: 40px; background: #f4f4f8; }
+.card { display: inline-block; width: 280px; margin: 10px; padding: 10px; background: white; }
+</style>
+<script src="/app.js?delay=200"></script>
+</head><body>
+<h1>Clipboard manager screenshot benchmark</h1>
+<video src="/clip.mp4?delay=3000" autoplay muted width="640"></video>
+%s
+<script>
+// Analytics-style beacons keep the network busy long after the page is usable
+// (their responses are read: Chrome only counts a fetch as finished once its body is)
+setTimeout(function () { fetch('/beacon?delay=2500').then(function (r) { return r.text(); }); }, 100);
+setTimeout(function () { fetch('/beacon?delay=2500').then(function (r) { return r.text(); }); }, 600);
+</script>
+</body></html>
+""" % "\n".join(f'<div class="card"><img src="/img.svg?delay=300&n={n}" width="260" height="120">'
+                f'<p>Card {n}: some text that wraps onto a second line.</p></div>' for n in range(12))
+
+CONTENT_TYPES = {
+    '/': 'text/html',
+    '/app.js': 'application/javascript',
+    '/font.woff2': 'font/woff2',
+    '/clip.mp4': 'video/mp4',
+    '/img.svg': 'image/svg+xml',
+    '/beacon': 'application/json'
+}
+
+class TestPageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path not in CONTENT_TYPES:
+            self.send_error(404)
+            return
+        delay = int(parse_qs(parsed.query).get('delay', ['0'])[0])
+        time.sleep(delay / 1000)
+        if parsed.path == '/':
+            body = TEST_PAGE.encode()
+        elif parsed.path == '/img.svg':
+            body = (b'<svg xmlns="http://www.w3.org/2000/svg" width="260" height="120">'
+                    b'<rect width="260" height="120" fill="#7a9cc6"/></svg>')
+        elif parsed.path == '/app.js':
+            body = b'document.documentElement.dataset.ready = "1";'
+        elif parsed.path == '/beacon':
+            body = b'{}'
+        else:
+            body = b'\0' * 64 * 1024
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPES[parsed.path])
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Fast mode aborts fonts and media it doesn't need
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), TestPageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run_mode(playwright, url, mode, runs, reuse_browser, output_dir):
+    latencies = []
+    sizes = []
+    browser = playwright.chromium.launch(headless=True) if reuse_browser else None
+    for run in range(runs):
+        path = os.path.join(output_dir, f"{mode}-{reuse_browser}-{run}{url_preview.SCREENSHOT_EXTENSIONS[mode]}")
+        started = time.perf_counter()
+        if reuse_browser:
+            url_preview.take_screenshot(browser, url, path, mode)
+        else:
+            fresh = playwright.chromium.launch(headless=True)
+            try:
+                url_preview.take_screenshot(fresh, url, path, mode)
+            finally:
+                fresh.close()
+        latencies.append(time.perf_counter() - started)
+        sizes.append(os.path.getsize(path))
+    if browser is not None:
+        browser.close()
+    summary = summarize(latencies)
+    summary['mean_bytes'] = sum(sizes) / len(sizes)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark URL preview screenshots")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--url", help="capture this URL instead of the local test page")
+    parser.add_argument("--label", default="local")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = start_server()
+        url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir, sync_playwright() as playwright:
+        # (name, screenshot mode, reuse the browser)
+        for name, mode, reuse in (('old', 'full', False), ('fast-cold', 'fast', False), ('fast-warm', 'fast', True)):
+            results[name] = run_mode(playwright, url, mode, args.runs, reuse, output_dir)
+            print(f"{name:<10}{results[name]['p50_ms']:>10.0f} ms p50{results[name]['p95_ms']:>10.0f} ms p95"
+                  f"{results[name]['mean_bytes'] / 1024:>10.1f} KB")
+    if server is not None:
+        server.shutdown()
+
+    old = results['old']['p50_ms']
+    for name in ('fast-cold', 'fast-warm'):
+        print(f"{name}: {old / max(results[name]['p50_ms'], 1e-9):.1f}x faster than old (p50)")
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"screenshot-{args.label}-{datetime.now():%Y%m%d-%H%M%S}.json")
+        with open(path, "w") as file:
+            json.dump({'label': args.label, 'created': datetime.now().isoformat(timespec='seconds'),
+                       'platform': sys.platform, 'url': args.url or 'local test page', 'modes': results},
+                      file, indent=2)
+        print(f"Saved results to {path}")
+
+if __name__ == "__main__":
+    main()
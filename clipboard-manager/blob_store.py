@@ -0,0 +1,67 @@
+# Out-of-line storage for large clipboard payloads.
+#
+# Big text clips are written once, gzip-compressed, to clip_blobs/<sha256>.txt.gz
+# and the history only keeps a short preview plus the digest. Blobs are
+# content-addressed, so copying the same log twice stores it once.
+import gzip
+import hashlib
+import os
+
+BLOB_DIR = "clip_blobs"
+CHUNK_CHARS = 1024 * 1024
+
+def text_digest(text):
+    return hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+def blob_path(digest):
+    return os.path.join(BLOB_DIR, f"{digest}.txt.gz")
+
+def has_blob(digest):
+    return os.path.exists(blob_path(digest))
+
+# Function to store a text blob and return its digest
+def put_text(text, digest=None):
+    digest = digest or text_digest(text)
+    path = blob_path(digest)
+    if os.path.exists(path):
+        return digest
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", errors="surrogatepass", compresslevel=6) as file:
+        for start in range(0, len(text), CHUNK_CHARS):
+            file.write(text[start:start + CHUNK_CHARS])
+    os.replace(tmp_path, path)
+    return digest
+
+# Function to store a blob from an iterable of text chunks (e.g. while reading an archive)
+def put_chunks(chunks, digest):
+    path = blob_path(digest)
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", errors="surrogatepass", compresslevel=6) as file:
+            for chunk in chunks:
+                file.write(chunk)
+    except BaseException:
+        # chunks can fail part way (e.g. a cut-short archive); don't leave half a blob behind
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return digest
+
+# Function to open a blob for streaming reads (text mode)
+def open_text(digest):
+    return gzip.open(blob_path(digest), "rt", encoding="utf-8", errors="surrogatepass")
+
+def read_text(digest):
+    with open_text(digest) as file:
+        return file.read()
+
+# Function to yield a blob in chunks without loading it all at once
+def iter_text(digest, chunk_chars=CHUNK_CHARS):
+    with open_text(digest) as file:
+        while True:
+            chunk = file.read(chunk_chars)
+            if not chunk:
+                return
+            yield chunk
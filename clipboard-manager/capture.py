@@ -0,0 +1,280 @@
+# Clipboard capture pipeline without any GUI.
+#
+# Reads the clipboard, runs OCR on new images, dedupes text and adds new items
+# to a history list. The Tk window and the headless daemon both drive this.
+import base64
+import io
+import os
+import sys
+from PIL import Image
+import pytesseract
+import clipboard_backend
+import history_core
+import blob_store
+import ocr
+import neardup
+import classify
+
+# Get the correct path whether running as script or exe
+if getattr(sys, 'frozen', False):
+    # Running as compiled exe
+    base_path = sys._MEIPASS
+else:
+    # Running as script
+    base_path = os.path.dirname(os.path.abspath(__file__))
+
+tesseract_path = os.path.join(base_path, 'tesseract', 'tesseract.exe')
+pytesseract.pytesseract.tesseract_cmd = tesseract_path
+
+# Text longer than this (in characters) is stored compressed, out of line
+LARGE_TEXT_THRESHOLD = 64 * 1024
+# Text longer than this is not captured at all
+MAX_CAPTURE_SIZE = 50 * 1024 * 1024
+# Replace older near-copies (same text up to whitespace/tracking parameters/small edits)
+NEAR_DUPLICATES = False
+# How many of the 64 SimHash bits two texts may differ in and still count as copies
+NEAR_DUPLICATE_DISTANCE = 6
+# Keep the HTML/RTF/file-list versions of a copy next to its plain text
+RICH_FORMATS = True
+# At most this many characters of rich formats are stored per item
+FORMAT_BUDGET = 2 * 1024 * 1024
+# Also read HTML/RTF whose size can't be checked before reading it (X11)
+UNSIZED_FORMATS = False
+
+# Function to apply the capture settings from window_settings.json
+def configure(settings):
+    global LARGE_TEXT_THRESHOLD, MAX_CAPTURE_SIZE, NEAR_DUPLICATES, NEAR_DUPLICATE_DISTANCE, RICH_FORMATS, FORMAT_BUDGET
+    global UNSIZED_FORMATS
+    LARGE_TEXT_THRESHOLD = int(settings.get('large_text_threshold', LARGE_TEXT_THRESHOLD))
+    MAX_CAPTURE_SIZE = int(settings.get('max_capture_size', MAX_CAPTURE_SIZE))
+    NEAR_DUPLICATES = bool(settings.get('near_duplicates', NEAR_DUPLICATES))
+    NEAR_DUPLICATE_DISTANCE = min(16, max(0, int(settings.get('near_duplicate_distance', NEAR_DUPLICATE_DISTANCE))))
+    RICH_FORMATS = bool(settings.get('rich_formats', RICH_FORMATS))
+    FORMAT_BUDGET = int(settings.get('format_budget', FORMAT_BUDGET))
+    UNSIZED_FORMATS = bool(settings.get('unsized_formats', UNSIZED_FORMATS))
+
+def capture_settings():
+    return {'large_text_threshold': LARGE_TEXT_THRESHOLD, 'max_capture_size': MAX_CAPTURE_SIZE,
+            'near_duplicates': NEAR_DUPLICATES, 'near_duplicate_distance': NEAR_DUPLICATE_DISTANCE,
+            'rich_formats': RICH_FORMATS, 'format_budget': FORMAT_BUDGET, 'unsized_formats': UNSIZED_FORMATS}
+
+def image_to_base64(image):
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+def base64_to_image(base64_string):
+    image_data = base64.b64decode(base64_string)
+    return Image.open(io.BytesIO(image_data))
+
+# Function to summarize a text cheaply so we don't have to keep huge strings around
+def text_signature(text):
+    return (len(text), hash(text))
+
+# Function to create the "what did we see last" state for one capture loop
+def new_capture_state(history=None, backend=None):
+    """backend is a clipboard_backend reader; the pyperclip/ImageGrab one if None"""
+    # near_index is built on first use (see collapse_near_copy)
+    state = {'last_signature': None, 'last_clipboard_image': None, 'near_index': None,
+             'backend': backend or clipboard_backend.SystemClipboard(), 'last_marker': None}
+    if history and history[0].get('type', 'text') == 'text' and not history[0].get('blob'):
+        state['last_signature'] = text_signature(history[0]['text'])
+    return state
+
+# Function to note text we put on the clipboard ourselves so it isn't re-captured
+def remember_text(state, text):
+    state['last_signature'] = text_signature(text)
+
+# Function to note an image we put on the clipboard ourselves so it isn't re-captured
+def remember_image(state, image_data):
+    # Decoded lazily on the next image poll, so copying stays instant
+    state['last_clipboard_image'] = None
+    state['pending_image_data'] = image_data
+
+# Function to drop an older near-copy of a new text item from the history
+def collapse_near_copy(state, history, item):
+    index = state.get('near_index')
+    # Rebuild when the distance changed or trimmed items have piled up in the index
+    if (index is None or index['max_distance'] != NEAR_DUPLICATE_DISTANCE
+            or len(index['items']) > 2 * len(history) + 100):
+        index = state['near_index'] = neardup.build_index(history, NEAR_DUPLICATE_DISTANCE)
+
+    text_sketch = neardup.sketch(item['text'])
+    old = neardup.find(index, text_sketch)
+    if old is not None:
+        neardup.remove(index, old['id'])
+        if any(x is old for x in history):
+            item['pinned'] = old.get('pinned', False)
+            history = [x for x in history if x is not old]
+    neardup.add(index, item, text_sketch)
+    return history
+
+# Function to hand a new item to the background classifier
+def _classify(state, item):
+    classify.submit([item], state.get('on_classified'))
+    return item
+
+# Function to list the rich formats on the clipboard ([] for readers that can't)
+def formats_on_offer(backend):
+    if not RICH_FORMATS or not hasattr(backend, 'available_formats'):
+        return []
+    try:
+        return backend.available_formats()
+    except Exception as e:
+        print(f"Couldn't list clipboard formats: {e}")
+        return []
+
+# Function to get the size of a rich format on the clipboard without reading it (None if unknown)
+def format_size(backend, name):
+    if not hasattr(backend, 'format_size'):
+        return None
+    try:
+        return backend.format_size(name)
+    except Exception as e:
+        print(f"Couldn't check the size of the {name} version of the clipboard: {e}")
+        return None
+
+# Function to store rich formats of an item in the blob store (deduplicated by content)
+def store_formats(state, item, names, marker=None, unsized=False):
+    """Formats whose size can't be checked first are left unread unless unsized (or the
+    unsized_formats setting) is set; with the clipboard's marker they can still be fetched
+    with fetch_format() while the clipboard holds this copy"""
+    budget = FORMAT_BUDGET - sum(item.get('format_sizes', {}).values())
+    stored = {}
+    unread = []
+    for name in names:
+        # Check the size first: reading transfers and decodes all of it, on the Tk thread in the window
+        size = format_size(state['backend'], name)
+        if size is None and not (unsized or UNSIZED_FORMATS) and name != 'files':
+            # File lists are small and needed for file copies; HTML/RTF can be anything
+            unread.append(name)
+            continue
+        if size is not None and size > budget:
+            print(f"Skipped the {name} version of the clipboard ({size} characters, over the format budget)")
+            continue
+        try:
+            data = state['backend'].read_format(name)
+        except Exception as e:
+            print(f"Couldn't read the {name} version of the clipboard: {e}")
+            continue
+        if not data:
+            continue
+        if len(data) > budget:
+            print(f"Skipped the {name} version of the clipboard ({len(data)} characters, over the format budget)")
+            continue
+        budget -= len(data)
+        stored[name] = blob_store.put_text(data)
+        item.setdefault('format_sizes', {})[name] = len(data)
+    if stored:
+        item.setdefault('formats', {}).update(stored)
+    if unread and marker is not None:
+        state['unread_formats'] = (item, unread, marker)
+    return stored
+
+# Function to read a format store_formats() left unread, if the clipboard still holds that copy
+def fetch_format(state, item, name):
+    """For Copy As: returns True if the format is stored on the item now"""
+    if name in item.get('formats', {}):
+        return True
+    unread = state.get('unread_formats')
+    if not unread or unread[0] is not item or name not in unread[1]:
+        return False
+    if state['backend'].change_marker() != unread[2]:
+        state.pop('unread_formats')
+        return False  # Something else was copied since
+    unread[1].remove(name)
+    if not store_formats(state, item, [name], unsized=True):
+        return False
+    if state.get('on_formats'):
+        state['on_formats'](item)
+    return True
+
+# Function to note the rich formats of a new item; they're read on the next poll
+def _note_formats(state, item, marker, formats):
+    if formats:
+        # Kept even for the ones that aren't read, so Copy As can tell they were there
+        item['formats_offered'] = list(formats)
+    wanted = [name for name in formats if name not in item.get('formats', {})]
+    if not wanted:
+        return item
+    if marker is None:
+        # Can't tell later whether the clipboard still holds this copy, so read them now
+        store_formats(state, item, wanted)
+    else:
+        state['pending_formats'] = (item, wanted, marker)
+    return item
+
+# Function to read the formats noted on the last poll, if the clipboard still holds that copy
+def _fetch_pending_formats(state, marker):
+    item, names, pending_marker = state.pop('pending_formats')
+    if marker != pending_marker:
+        return  # Copied over already; the plain text is all we get
+    if store_formats(state, item, names, marker) and state.get('on_formats'):
+        state['on_formats'](item)
+
+# Function to check the clipboard once
+def poll_clipboard(state, history, max_history=history_core.MAX_HISTORY):
+    """Return (history, new_item); new_item is None when nothing new was captured
+
+    New items get item['kind'] on a background thread; state['on_classified']
+    (if set) is called from that thread when they have it. Rich formats (HTML,
+    RTF, copied files) are read on the poll after the capture, so the capture
+    itself stays as fast as plain text; state['on_formats'] (if set) is called
+    with the item when they were stored, so it can be saved again.
+    """
+    backend = state['backend']
+    # Nothing to read if the backend can tell the clipboard hasn't changed
+    marker = backend.change_marker()
+    if state.get('pending_formats'):
+        _fetch_pending_formats(state, marker)
+    if marker is not None:
+        if marker == state['last_marker']:
+            return history, None
+        state['last_marker'] = marker
+
+    try:
+        img = backend.grab_image()
+        if img and state.get('pending_image_data'):
+            state['last_clipboard_image'] = base64_to_image(state.pop('pending_image_data'))
+        if img and img != state['last_clipboard_image']:
+            state['last_clipboard_image'] = img
+            image_data = image_to_base64(img)
+            ocr_text = ocr.extract_text(img, ocr.fingerprint(image_data))
+            item = history_core.make_image_item(image_data, ocr_text)
+            item['kind'] = 'image'
+            _note_formats(state, item, marker, formats_on_offer(backend))
+            return history_core.add_item(history, item, max_history), item
+    except:
+        pass
+
+    current = backend.paste_text()
+    formats = formats_on_offer(backend)
+    files = None
+    if not current.strip() and 'files' in formats:
+        # Copied files (Explorer, file managers) often come without plain text; keep their paths
+        files = current = backend.read_format('files') or ""
+    signature = text_signature(current)
+
+    if signature != state['last_signature'] and current.strip():
+        state['last_signature'] = signature
+
+        if len(current) > MAX_CAPTURE_SIZE:
+            print(f"Skipped clipboard text of {len(current)} characters (max {MAX_CAPTURE_SIZE})")
+        elif len(current) > LARGE_TEXT_THRESHOLD:
+            digest = blob_store.text_digest(current)
+            if not history_core.is_duplicate_blob(history, digest):
+                blob_store.put_text(current, digest)
+                item = history_core.make_large_text_item(current, digest)
+                _note_formats(state, item, marker, formats)
+                return history_core.add_item(history, item, max_history), _classify(state, item)
+        elif not history_core.is_duplicate_text(history, current):
+            item = history_core.make_text_item(current)
+            if files:
+                item['formats'] = {'files': blob_store.put_text(files)}
+                item['format_sizes'] = {'files': len(files)}
+            if NEAR_DUPLICATES:
+                history = collapse_near_copy(state, history, item)
+            _note_formats(state, item, marker, formats)
+            return history_core.add_item(history, item, max_history), _classify(state, item)
+
+    return history, None
@@ -0,0 +1,116 @@
+# Content kinds for captured items.
+#
+# Every item is classified once, on a background thread, and the result is
+# stored on the item as item['kind'] (saved with the history), so previews,
+# double-click and the kind filter never have to re-inspect the text.
+import json
+import queue
+import re
+import threading
+
+KINDS = ('url', 'email', 'color', 'path', 'json', 'code', 'text', 'image')
+# Only this much of a text is looked at
+CLASSIFY_CHARS = 4096
+# JSON is only parsed up to this size
+MAX_JSON_CHARS = 1024 * 1024
+
+EMAIL_PATTERN = re.compile(r'^(mailto:)?[\w.+-]+@[\w-]+(\.[\w-]+)+$', re.IGNORECASE)
+COLOR_PATTERN = re.compile(r'^(#[0-9a-f]{3,4}|#[0-9a-f]{6}|#[0-9a-f]{8}'
+                           r'|(rgb|rgba|hsl|hsla)\(\s*[\d.%]+\s*(,\s*[\d.%]+\s*){2,3}\))$', re.IGNORECASE)
+PATH_PATTERN = re.compile(r'^([a-z]:[\\/]|\\\\[^\\\s]+\\|~?/|\.{1,2}[\\/])[^<>|"*?\n]*$', re.IGNORECASE)
+CODE_PATTERN = re.compile(r'^\s*(def |class |import |from \S+ import |function\b|const |let |var |#include'
+                          r'|public |private |package |fn |func |SELECT |INSERT |UPDATE |<\?php|<!DOCTYPE|<html)'
+                          r'|[;{}]\s*$|=>|^\s*(if|for|while)\s*\(', re.MULTILINE)
+
+# Function to check if a text looks like a URL (also "example.com" without a scheme)
+def is_url(text):
+    text = text.strip().lower()
+    # Check for URL patterns (http://, https://, www., or domain.extension format)
+    if text.startswith(('http://', 'https://', 'www.', 'ftp://')):
+        return True
+    # Check if it looks like a domain (has a dot and no spaces)
+    if '.' in text and ' ' not in text and len(text.split('.')) >= 2:
+        # Make sure it has a valid TLD-like ending
+        parts = text.split('.')
+        if len(parts[-1]) >= 2:  # TLD should be at least 2 characters
+            return True
+    return False
+
+def _looks_like_json(text):
+    stripped = text.strip()
+    if len(stripped) > MAX_JSON_CHARS or not stripped or stripped[0] not in '{[' or stripped[-1] not in '}]':
+        return False
+    try:
+        json.loads(stripped)
+        return True
+    except ValueError:
+        return False
+
+def _looks_like_code(head):
+    lines = [line for line in head.splitlines() if line.strip()]
+    if not lines:
+        return False
+    hits = len(CODE_PATTERN.findall(head))
+    indented = sum(1 for line in lines if line.startswith(('    ', '\t')))
+    return hits >= 2 or (hits >= 1 and len(lines) <= 2) or (len(lines) >= 3 and indented / len(lines) > 0.3 and hits >= 1)
+
+# Function to work out the kind of a text
+def classify_text(text, full_text=True):
+    """full_text=False when text is only a preview (large items), which skips the JSON parse"""
+    stripped = text.strip()
+    head = stripped[:CLASSIFY_CHARS]
+    single_line = '\n' not in head
+    if single_line and EMAIL_PATTERN.match(head):
+        return 'email'
+    if single_line and COLOR_PATTERN.match(head):
+        return 'color'
+    if single_line and PATH_PATTERN.match(head) and not head.startswith('//'):
+        return 'path'
+    if single_line and len(stripped) < 2048 and is_url(head):
+        return 'url'
+    if full_text and _looks_like_json(stripped):
+        return 'json'
+    if _looks_like_code(head):
+        return 'code'
+    return 'text'
+
+# Function to work out the kind of an item
+def classify_item(item):
+    if item.get('type', 'text') == 'image':
+        return 'image'
+    return classify_text(item.get('text', ''), full_text=not item.get('blob'))
+
+# Function to get an item's kind, classifying it now if the background stage hasn't yet
+def kind_of(item):
+    kind = item.get('kind')
+    if kind is None:
+        kind = item['kind'] = classify_item(item)
+    return kind
+
+# Background stage: items waiting to be classified, and who to tell when they are
+_queue = queue.Queue()
+_worker = None
+
+def _run():
+    while True:
+        items, on_done = _queue.get()
+        done = []
+        for item in items:
+            if 'kind' not in item:
+                try:
+                    item['kind'] = classify_item(item)
+                except Exception as e:
+                    print(f"Couldn't classify item: {e}")
+                    item['kind'] = 'text'
+                done.append(item)
+        if done and on_done:
+            on_done(done)
+
+# Function to classify items on the background thread
+def submit(items, on_done=None):
+    """on_done(items) is called from the background thread with the items that got a kind"""
+    global _worker
+    if _worker is None:
+        _worker = threading.Thread(target=_run, daemon=True)
+        _worker.start()
+    _queue.put((list(items), on_done))
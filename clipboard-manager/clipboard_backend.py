@@ -0,0 +1,250 @@
+# Clipboard readers used by the capture loop.
+#
+# On Linux pyperclip and ImageGrab start an xclip/xsel/wl-paste process for
+# every read, which with a 500 ms poll means several process spawns a second.
+# TkClipboard reads through the X connection Tk already has open instead:
+#
+#   * TARGETS tells us which formats the owner offers, so we only ask for an
+#     image when there is one and never convert formats we don't need
+#   * TIMESTAMP (when offered) changes whenever something new is copied, so an
+#     unchanged clipboard costs two tiny requests and no data transfer
+#
+# Everywhere else (or when Tk can't reach a display) the pyperclip/ImageGrab
+# reader is used; on Windows it skips unchanged clipboards via the clipboard
+# sequence number.
+#
+# Both can also list and read the rich formats an app put on the clipboard next
+# to the plain text (HTML, RTF, copied files); see available_formats() and
+# read_format(). Listing is cheap, reading is left to the capture loop to do
+# later and only within its size budget. format_size() tells that size without
+# reading the data where the platform can (Windows); X11 can't, it only tells
+# by sending everything.
+import io
+import sys
+import tkinter
+from urllib.parse import unquote, urlparse
+import pyperclip
+from PIL import Image, ImageGrab
+
+TEXT_TARGETS = ('UTF8_STRING', 'text/plain;charset=utf-8', 'STRING', 'TEXT')
+# Targets Tk converts to text itself; anything else comes back as hex bytes
+TK_TEXT_TARGETS = ('UTF8_STRING', 'STRING', 'TEXT', 'COMPOUND_TEXT')
+IMAGE_TARGETS = ('image/png', 'image/bmp', 'image/x-bmp', 'image/jpeg', 'image/gif', 'image/tiff')
+# Rich formats by the name items store them under, and the X11 targets that carry them
+RICH_TARGETS = {
+    'html': ('text/html',),
+    'rtf': ('text/rtf', 'application/rtf', 'text/richtext'),
+    'files': ('x-special/gnome-copied-files', 'text/uri-list')
+}
+WINDOWS_FORMAT_NAMES = {'html': "HTML Format", 'rtf': "Rich Text Format"}
+
+# Function to turn a file:// URI list (or GNOME's copied-files list) into one path per line
+def uris_to_paths(text):
+    paths = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('file://'):
+            paths.append(unquote(urlparse(line).path))
+    return "\n".join(paths)
+
+# Function to get the HTML out of Windows' "HTML Format" (a header with byte offsets, then the page)
+def html_from_cf_html(data):
+    header = data[:512].decode('ascii', errors='replace')
+    offsets = {}
+    for line in header.splitlines():
+        key, _, value = line.partition(':')
+        if value.strip().isdigit():
+            offsets[key] = int(value)
+    start, end = offsets.get('StartHTML', -1), offsets.get('EndHTML', -1)
+    if start < 0:
+        start, end = offsets.get('StartFragment', 0), offsets.get('EndFragment', len(data))
+    return data[start:end if end > 0 else len(data)].decode('utf-8', errors='replace')
+
+# Function to decode a binary selection Tk handed back as space-separated hex bytes ("0x89 0x50 ...")
+def selection_bytes(data):
+    if isinstance(data, str) and not data.startswith('0x'):
+        return data.encode('utf-8', errors='surrogateescape')
+    text = " ".join(map(str, data)) if isinstance(data, tuple) else str(data)
+    try:
+        # bytes.fromhex skips the spaces between bytes; far faster than a token at a time
+        return bytes.fromhex(text.replace('0x', ''))
+    except ValueError:
+        # Tokens without a leading zero ("0x5")
+        return bytes(int(token, 16) for token in text.split())
+
+# Function to get the size in bytes of a format on the (open) Windows clipboard without copying it
+def _windows_format_size(clipboard_format):
+    import ctypes
+    from ctypes import wintypes
+    # Own instances, so the argtypes set here don't change anyone else's
+    user32 = ctypes.WinDLL('user32')
+    kernel32 = ctypes.WinDLL('kernel32')
+    user32.GetClipboardData.argtypes = [wintypes.UINT]
+    user32.GetClipboardData.restype = wintypes.HANDLE
+    kernel32.GlobalSize.argtypes = [wintypes.HGLOBAL]
+    kernel32.GlobalSize.restype = ctypes.c_size_t
+    handle = user32.GetClipboardData(clipboard_format)
+    return kernel32.GlobalSize(handle) if handle else 0
+
+def _decode_text(raw):
+    # Browsers put text/html on the X clipboard as UTF-16 with a byte order mark
+    if raw.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return raw.decode('utf-16', errors='replace')
+    return raw.decode('utf-8', errors='replace').rstrip('\x00')
+
+class SystemClipboard:
+    """pyperclip for text, Pillow's ImageGrab for images"""
+    name = 'system'
+
+    def change_marker(self):
+        """Return a value that changes when the clipboard does, or None if we can't tell"""
+        if sys.platform == 'win32':
+            import ctypes
+            return ctypes.windll.user32.GetClipboardSequenceNumber()
+        return None
+
+    def grab_image(self):
+        return ImageGrab.grabclipboard()
+
+    def paste_text(self):
+        return pyperclip.paste()
+
+    def available_formats(self):
+        """Rich formats on the clipboard (only Windows can tell cheaply)"""
+        if sys.platform != 'win32':
+            return []
+        import win32clipboard
+        formats = [name for name, format_name in WINDOWS_FORMAT_NAMES.items()
+                   if win32clipboard.IsClipboardFormatAvailable(win32clipboard.RegisterClipboardFormat(format_name))]
+        if win32clipboard.IsClipboardFormatAvailable(win32clipboard.CF_HDROP):
+            formats.append('files')
+        return formats
+
+    def format_size(self, name):
+        """Roughly how many characters read_format(name) would return, or None if we can't tell"""
+        if sys.platform != 'win32':
+            return None
+        import win32clipboard
+        if name == 'files':
+            clipboard_format = win32clipboard.CF_HDROP
+        else:
+            clipboard_format = win32clipboard.RegisterClipboardFormat(WINDOWS_FORMAT_NAMES[name])
+        win32clipboard.OpenClipboard()
+        try:
+            if not win32clipboard.IsClipboardFormatAvailable(clipboard_format):
+                return 0
+            size = _windows_format_size(clipboard_format)
+        finally:
+            win32clipboard.CloseClipboard()
+        # File lists are UTF-16, HTML (UTF-8) and RTF are about a byte per character
+        return size // 2 if name == 'files' else size
+
+    def read_format(self, name):
+        """Return one rich format as text (files as one path per line), or None"""
+        if sys.platform != 'win32':
+            return None
+        import win32clipboard
+        win32clipboard.OpenClipboard()
+        try:
+            if name == 'files':
+                if not win32clipboard.IsClipboardFormatAvailable(win32clipboard.CF_HDROP):
+                    return None
+                return "\n".join(win32clipboard.GetClipboardData(win32clipboard.CF_HDROP))
+            clipboard_format = win32clipboard.RegisterClipboardFormat(WINDOWS_FORMAT_NAMES[name])
+            if not win32clipboard.IsClipboardFormatAvailable(clipboard_format):
+                return None
+            data = win32clipboard.GetClipboardData(clipboard_format)
+        finally:
+            win32clipboard.CloseClipboard()
+        if name == 'html':
+            return html_from_cf_html(data)
+        return data.rstrip(b'\x00').decode('latin-1')
+
+class TkClipboard:
+    """Reads the X11 CLIPBOARD selection in-process through a Tk window"""
+    name = 'tk'
+
+    def __init__(self, tk_root):
+        self.root = tk_root
+        self.targets = ()
+
+    def _get(self, target):
+        return self.root.selection_get(selection='CLIPBOARD', type=target)
+
+    def _read_targets(self):
+        try:
+            targets = self._get('TARGETS')
+        except tkinter.TclError:
+            return ()  # Nobody owns the clipboard
+        if isinstance(targets, str):
+            targets = targets.split()
+        return tuple(str(target) for target in targets)
+
+    def change_marker(self):
+        self.targets = self._read_targets()
+        if 'TIMESTAMP' not in self.targets:
+            return None
+        try:
+            return (str(self._get('TIMESTAMP')), self.targets)
+        except tkinter.TclError:
+            return None
+
+    def grab_image(self):
+        target = next((t for t in IMAGE_TARGETS if t in self.targets), None)
+        if target is None:
+            return None
+        try:
+            data = self._get(target)
+        except tkinter.TclError:
+            return None
+        image = Image.open(io.BytesIO(selection_bytes(data)))
+        image.load()
+        return image
+
+    def paste_text(self):
+        # An owner that can't list its targets gets asked for plain STRING
+        for target in [t for t in TEXT_TARGETS if t in self.targets] or ['STRING']:
+            try:
+                data = self._get(target)
+            except tkinter.TclError:
+                continue
+            if target in TK_TEXT_TARGETS:
+                return str(data)
+            return _decode_text(selection_bytes(data))
+        return ''
+
+    def available_formats(self):
+        """Rich formats on offer; uses the TARGETS change_marker() just read, so it costs nothing"""
+        return [name for name, targets in RICH_TARGETS.items() if any(t in self.targets for t in targets)]
+
+    def format_size(self, name):
+        """X11 has no way to ask for the size without sending the data"""
+        return None
+
+    def read_format(self, name):
+        """Return one rich format as text (files as one path per line), or None"""
+        for target in RICH_TARGETS[name]:
+            if target not in self.targets:
+                continue
+            try:
+                text = _decode_text(selection_bytes(self._get(target)))
+            except tkinter.TclError:
+                continue
+            return uris_to_paths(text) if name == 'files' else text
+        return None
+
+# Function to pick the cheapest working clipboard reader for this platform
+def create(tk_root=None):
+    """tk_root is the app's Tk window; the daemon passes None and gets a hidden one"""
+    if not sys.platform.startswith('linux'):
+        return SystemClipboard()
+    try:
+        if tk_root is None:
+            tk_root = tkinter.Tk()
+            tk_root.withdraw()
+        backend = TkClipboard(tk_root)
+        backend.change_marker()  # Fails here if there is no display to talk to
+        return backend
+    except Exception as e:
+        print(f"In-process clipboard unavailable ({e}), using {SystemClipboard.name} clipboard")
+        return SystemClipboard()
@@ -1,45 +1,58 @@
 ﻿import tkinter as tk
-from tkinter import ttk, colorchooser, messagebox
+from tkinter import ttk, colorchooser, messagebox, filedialog
 import pyperclip
 import json
 import webbrowser
 from datetime import datetime
 import pystray
-from PIL import Image, ImageGrab, ImageDraw, ImageTk
+from PIL import Image, ImageDraw, ImageTk
 import threading
 import keyboard
-import base64
 import io
-import subprocess
 import os
 import sys
-from playwright.sync_api import sync_playwright
-import hashlib
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse
-import pytesseract
-
-# Get the correct path whether running as script or exe
-if getattr(sys, 'frozen', False):
-    # Running as compiled exe
-    base_path = sys._MEIPASS
-else:
-    # Running as script
-    base_path = os.path.dirname(os.path.abspath(__file__))
-
-tesseract_path = os.path.join(base_path, 'tesseract', 'tesseract.exe')
-pytesseract.pytesseract.tesseract_cmd = tesseract_path
+import history_core
+import capture
+import ipc_server
+import ipc_client
+import persistence
+import fuzzy_search
+import blob_store
+import archive
+import clipboard_backend
+import clipboard_trace
+import poll_scheduler
+import clipboard_writer
+import classify
+import maintenance
+import ocr_backfill
+import profiling
+import url_preview
 
 # List to store full clipboard items with timestamps and pin status
 full_history = []
 
-# Variable to remember the last thing we saw on clipboard
-last_clipboard = ""
-last_clipboard_image = None
+# Remembers the last thing we saw on clipboard
+capture_state = capture.new_capture_state()
+
+# Set when a capture daemon owns the history and this window only shows it
+attached_daemon = None
+
+# The items currently shown in the list, in list order
+displayed_items = []
+
+# While hidden to the tray the list isn't redrawn; it's redrawn once on show
+window_hidden = False
+display_dirty = False
+
+# Decides how often check_clipboard runs
+clipboard_poller = poll_scheduler.new_scheduler()
 
 # Settings
-MAX_HISTORY = 25
+MAX_HISTORY = history_core.MAX_HISTORY
 window_locked = False
 
 # Default theme settings
@@ -70,7 +83,7 @@ DEFAULT_THEME = {
 current_theme = DEFAULT_THEME.copy()
 
 # Screenshot cache directory
-SCREENSHOT_CACHE_DIR = "url_screenshots"
+SCREENSHOT_CACHE_DIR = url_preview.SCREENSHOT_CACHE_DIR
 if not os.path.exists(SCREENSHOT_CACHE_DIR):
     os.makedirs(SCREENSHOT_CACHE_DIR)
 
@@ -81,8 +94,8 @@ def save_window_settings():
         'locked': window_locked,
         'theme': current_theme
     }
-    with open("window_settings.json", "w") as file:
-        json.dump(settings, file, indent=2)
+    settings.update(capture.capture_settings())
+    persistence.schedule_write("window_settings.json", settings, indent=2)
 
 # Function to load window position and size
 def load_window_settings():
@@ -96,10 +109,16 @@ def load_window_settings():
             # Merge with defaults to handle new theme properties
             current_theme = DEFAULT_THEME.copy()
             current_theme.update(loaded_theme)
+            capture.configure(settings)
             if window_locked:
                 lock_window()
     except FileNotFoundError:
         pass
+    except ValueError as e:
+        # Start with the defaults; keep the damaged file for a look later
+        with open("window_settings.json", "r", errors="replace") as file:
+            saved = history_core.quarantine("window_settings.json", file.read())
+        print(f"window_settings.json is damaged ({e}), using defaults; original kept in {saved}")
 
 # Function to apply theme
 def apply_theme():
@@ -134,6 +153,8 @@ def apply_theme():
     
     search_frame.config(bg=current_theme['search_bg'])
     search_label.config(bg=current_theme['search_bg'], fg=current_theme['search_fg'])
+    fuzzy_check.config(bg=current_theme['search_bg'], fg=current_theme['search_fg'],
+                       activebackground=current_theme['search_bg'])
     search_entry.config(bg=current_theme['search_bg'], fg=current_theme['search_fg'])
     
     history_list.config(bg=current_theme['list_bg'], fg=current_theme['list_fg'],
@@ -148,74 +169,353 @@ def apply_theme():
 
 # Function to save history to a file
 def save_history():
-    with open("clipboard_history.json", "w") as file:
-        json.dump(full_history, file)
+    # The daemon writes the file while we're attached to it
+    if attached_daemon:
+        return
+    history_core.schedule_history_save(full_history)
 
 # Function to load history from file
 def load_history():
-    global last_clipboard, full_history
+    global capture_state, full_history
+    full_history = history_core.load_history_file()
+    refresh_display()
+    capture_state = capture.new_capture_state(full_history, clipboard_reader)
+    capture_state['on_classified'] = items_classified
+    capture_state['on_formats'] = lambda item: save_history()
+    clipboard_writer.warm(full_history)
+    # Items saved before items had a kind
+    unclassified = [item for item in full_history if 'kind' not in item]
+    if unclassified:
+        classify.submit(unclassified, items_classified)
+
+# Function called from the classifier thread once new items have their kind
+def items_classified(items):
+    root.after(0, classification_done)
+
+def classification_done():
+    history_core.invalidate_kinds()
+    save_history()
+    if kind_filter_var.get() != "All":
+        refresh_display()
+
+# Function to send an edit to the daemon when it owns the history
+def forward_to_daemon(op, **args):
+    """Return the daemon's answer, or False if it couldn't be reached"""
+    global full_history
     try:
-        with open("clipboard_history.json", "r") as file:
-            full_history = json.load(file)
-            refresh_display()
-            if full_history:
-                if full_history[0]['type'] == 'text':
-                    last_clipboard = full_history[0]['text']
-    except FileNotFoundError:
-        pass
+        with ipc_client.connect() as client:
+            result = client.request(op, **args)
+    except (ipc_client.ClientError, OSError) as e:
+        update_status(f"Couldn't reach the capture daemon: {e}")
+        return False
+    full_history = history_core.load_history_file()
+    refresh_display()
+    return result
+
+# Function to run something on the Tk thread from an IPC thread and wait for it (False if it timed out)
+def run_on_ui(func, *args):
+    try:
+        return ui_request(func, *args)
+    except TimeoutError:
+        return False
+
+# Function to run an API request on the Tk thread; a busy window is an error, not a "no"
+def ui_request(func, *args):
+    done = threading.Event()
+    result = {}
+    def call():
+        try:
+            result['value'] = func(*args)
+        finally:
+            done.set()
+    root.after(0, call)
+    if not done.wait(5):
+        raise TimeoutError("the window is busy and didn't respond in time (the change may still be made)")
+    return result.get('value', False)
+
+# IPC API callbacks (these run on the Tk thread via ui_request)
+def set_item_pinned(item_id, pinned):
+    item = history_core.find_item(full_history, item_id)
+    if item is None:
+        return False
+    item['pinned'] = pinned
+    save_history()
+    refresh_display()
+    return True
+
+def remove_item(item_id):
+    global full_history
+    item = history_core.find_item(full_history, item_id)
+    if item is None:
+        return False
+    full_history = [x for x in full_history if x is not item]
+    save_history()
+    refresh_display()
+    return True
+
+def batch_items(item_ids, action):
+    wanted = set(item_ids)
+    return apply_to_items([item for item in full_history if item.get('id') in wanted], action)
+
+def start_ipc_server():
+    ipc_server.start({
+        'snapshot': lambda: list(full_history),
+        'pin': lambda item_id, pinned: ui_request(set_item_pinned, item_id, pinned),
+        'delete': lambda item_id: ui_request(remove_item, item_id),
+        'batch': lambda item_ids, action: ui_request(batch_items, item_ids, action) or 0,
+        'clear': lambda: ui_request(clear_history),
+        'stats': lambda: {'persistence': persistence.write_stats(),
+                          'polling': poll_scheduler.stats(clipboard_poller),
+                          'profiling': profiling.status(),
+                          'maintenance': maintenance.last_report(),
+                          'reindex': ocr_backfill.status()},
+        'profile': lambda action, mode, memory: profiling.handle(action, mode, memory, profile_on_ui),
+        'reindex': lambda action, force, use_gate: ocr_backfill.handle(
+            action, lambda: list(full_history), reindexed_on_ui, force, use_gate, show_reindex_progress, reindex_done)
+    })
+
+# Function to run a profiling call on the Tk thread (cProfile only sees the thread that starts it)
+def profile_on_ui(func, *args):
+    def call():
+        try:
+            return ('ok', func(*args))
+        except ValueError as e:
+            return ('error', str(e))
+    outcome = run_on_ui(call)
+    if not outcome:
+        raise ValueError("the window didn't respond")
+    if outcome[0] == 'error':
+        raise ValueError(outcome[1])
+    return outcome[1]
+
+# Function to apply what the maintenance thread planned (runs on the Tk thread)
+def apply_maintenance(result):
+    global full_history
+    full_history, report, changed = maintenance.apply(result, full_history)
+    if changed:
+        save_history()
+        refresh_display()
+    return report
+
+def maintenance_done(report):
+    if report.get('bytes_reclaimed') or report.get('items_quarantined') or report.get('blobs_quarantined'):
+        root.after(0, lambda: update_status(
+            f"Maintenance reclaimed {report['bytes_reclaimed'] / 1024:.0f} KB, "
+            f"quarantined {report['items_quarantined'] + report['blobs_quarantined']} damaged entries"))
+
+# Function to write a batch of OCR re-index results into the history (runs on the Tk thread)
+def apply_reindexed(results):
+    changed = ocr_backfill.apply_results(full_history, results)
+    if changed:
+        save_history()
+        update_rows(changed)
+    return True
+
+# Called from the re-index thread; it waits so batches don't pile up behind a busy window
+def reindexed_on_ui(results):
+    run_on_ui(apply_reindexed, results)
+
+def show_reindex_progress(done, total):
+    show_archive_progress("Re-running OCR", done, total)
+
+def reindex_done(stats):
+    if 'error' in stats:
+        message = f"OCR re-index failed: {stats['error']}"
+    else:
+        message = (f"{'Stopped OCR re-index' if stats['stopped'] else 'Re-ran OCR'} on {stats['done']} of "
+                   f"{stats['total']} images ({stats['with_text']} with text, {stats['failed']} failed)")
+    root.after(0, lambda: update_status(message))
+
+# Function to start or stop the OCR re-index of image items
+def toggle_reindex():
+    if attached_daemon:
+        status = forward_to_daemon('reindex', action='status')
+        if status:
+            forward_to_daemon('reindex', action='stop' if status['running'] else 'start')
+            update_status("Asked the capture daemon to " +
+                          ("stop the OCR re-index" if status['running'] else "re-run OCR on its images"))
+        return
+    if ocr_backfill.stop():
+        update_status("Stopping OCR re-index...")
+    elif not ocr_backfill.start(list(full_history), reindexed_on_ui, show_reindex_progress, reindex_done):
+        update_status("An OCR re-index is already running")
+
+# Function to follow the daemon's history file while attached to it
+def watch_daemon_history(last_mtime=None):
+    global attached_daemon, full_history
+    if history_core.read_writer_lock() is None and history_core.acquire_writer_lock('gui'):
+        # The daemon went away, start capturing ourselves
+        attached_daemon = None
+        update_status("Capture daemon stopped - capturing in this window")
+        # Our copy can be behind the daemon's last save (and is older still if the window was hidden)
+        load_history()
+        start_ipc_server()
+        check_clipboard()
+        return
+
+    try:
+        mtime = os.path.getmtime(history_core.HISTORY_FILE)
+    except OSError:
+        mtime = None
+    if mtime != last_mtime and window_hidden:
+        # Nothing to show it in; pick the change up once the window is back
+        mtime = last_mtime
+    elif mtime != last_mtime:
+        # The daemon replaces the file in one go, and damaged records are quarantined on load
+        full_history = history_core.load_history_file()
+        refresh_display()
+    root.after(1000, lambda: watch_daemon_history(mtime))
+
+# Fuzzy searches run on a worker thread (one can take a few hundred ms on a huge
+# history) once typing pauses; the list shows the last finished search meanwhile
+FUZZY_DEBOUNCE_MS = 150
+fuzzy_state = {'source': None, 'snapshot': [], 'request': None, 'done': None, 'results': [],
+               'running': False, 'timer': None}
+
+def same_search(a, b):
+    # Compare the searched lists by identity, comparing them item by item would cost as much as searching
+    return a is not None and b is not None and a[0] == b[0] and a[1] is b[1]
+
+# Function to get a copy of the items to search that stays the same object until they change
+def fuzzy_snapshot(candidates):
+    if fuzzy_state['source'] is not candidates or len(fuzzy_state['snapshot']) != len(candidates):
+        # The worker gets a copy: the history list is edited in place when something is captured
+        fuzzy_state['source'] = candidates
+        fuzzy_state['snapshot'] = list(candidates)
+    return fuzzy_state['snapshot']
+
+# Function to ask for a fuzzy search (runs after FUZZY_DEBOUNCE_MS without a newer request)
+def request_fuzzy_search(candidates, search_term):
+    request = (search_term, fuzzy_snapshot(candidates))
+    if same_search(request, fuzzy_state['request']):
+        return
+    fuzzy_state['request'] = request
+    if fuzzy_state['timer'] is not None:
+        root.after_cancel(fuzzy_state['timer'])
+        fuzzy_state['timer'] = None
+    if not same_search(request, fuzzy_state['done']):
+        fuzzy_state['timer'] = root.after(FUZZY_DEBOUNCE_MS, run_fuzzy_search)
+
+def run_fuzzy_search():
+    fuzzy_state['timer'] = None
+    request = fuzzy_state['request']
+    if fuzzy_state['running'] or same_search(request, fuzzy_state['done']):
+        return  # A running search picks the latest request up when it finishes
+    fuzzy_state['running'] = True
+    
+    def search():
+        try:
+            results = fuzzy_search.fuzzy_search(request[1], request[0])
+        except Exception as e:
+            print(f"Fuzzy search failed: {e}")
+            results = []
+        root.after(0, lambda: fuzzy_search_done(request, results))
+    
+    threading.Thread(target=search, daemon=True).start()
+
+def fuzzy_search_done(request, results):
+    fuzzy_state['running'] = False
+    fuzzy_state['done'] = request
+    fuzzy_state['results'] = results
+    if not same_search(request, fuzzy_state['request']) and fuzzy_state['timer'] is None:
+        # Typed on while it ran
+        run_fuzzy_search()
+    if fuzzy_var.get():
+        refresh_display()
+
+# Function to work out which items the list shows, in order
+def visible_display_items():
+    search_term = search_var.get().lower()
+    
+    kind = KIND_FILTERS.get(kind_filter_var.get())
+    
+    if fuzzy_var.get() and search_term.strip():
+        # Best fuzzy matches first
+        candidates = full_history if kind is None else history_core.kind_index(full_history).get(kind, [])
+        request_fuzzy_search(candidates, search_term)
+        # Until the search for this exact text is done, show the last results still in the list
+        present = {id(item) for item in candidates}
+        return [item for item in fuzzy_state['results'] if id(item) in present]
+    # Pinned items first, then by timestamp, filtered by the search box and kind
+    return history_core.visible_items(full_history, search_term, kind)
 
 # Function to refresh the display
 def refresh_display():
+    global displayed_items, display_dirty
+    if window_hidden:
+        display_dirty = True
+        return
+    display_dirty = False
     history_list.delete(0, tk.END)
-    search_term = search_var.get().lower()
+    displayed_items = visible_display_items()
     
-    # Sort: pinned items first, then by timestamp
-    sorted_history = sorted(full_history, key=lambda x: (not x.get('pinned', False), -x.get('timestamp', 0)))
-    
-    for item in sorted_history:
-        item_type = item.get('type', 'text')
-        
-        if item_type == 'image':
-            ocr_text = item.get('ocr_text', '')
-            if ocr_text:
-                display_text = f"[IMAGE: {ocr_text[:25]}...]"
-            else:
-                display_text = "[IMAGE]"
-        else:
-            text = item['text']
-            # Apply search filter
-            if search_term and search_term not in text.lower():
-                continue
-            
-            # Format display
-            display_text = text.replace('\n', ' ').replace('\r', '')
-        
-        # Add pin indicator and timestamp
-        pin_indicator = "📌 " if item.get('pinned', False) else ""
-        time_str = datetime.fromtimestamp(item['timestamp']).strftime("%H:%M:%S")
-        display_line = f"{pin_indicator}[{time_str}] {display_text}"
-        
-        # Truncate to 50 characters total
-        if len(display_line) > 50:
-            display_line = display_line[:50] + "..."
-        
-        history_list.insert(tk.END, display_line)
-
-# Function to normalize URL
-def normalize_url(url):
-    """Add http:// if URL doesn't have a protocol"""
-    url = url.strip()
-    if not url.startswith(('http://', 'https://', 'ftp://')):
-        # Check if it looks like a URL (has a domain extension)
-        if '.' in url and ' ' not in url:
-            return 'http://' + url
-    return url
+    # Rows are cached per item, so a redraw is just one insert
+    history_core.prime_views(full_history)
+    lines = [history_core.display_line(item) for item in displayed_items]
+    if lines:
+        history_list.insert(tk.END, *lines)
+
+# Function to redraw only the rows of items a batch edit changed or removed
+def update_rows(changed):
+    global displayed_items, display_dirty
+    if window_hidden:
+        display_dirty = True
+        return
+    changed_ids = {id(item) for item in changed}
+    new_items = visible_display_items()
+    # Everything else must keep its order, otherwise just redraw the whole list
+    if ([id(x) for x in displayed_items if id(x) not in changed_ids] !=
+            [id(x) for x in new_items if id(x) not in changed_ids]):
+        refresh_display()
+        return
+    # Bottom up, so the rows above keep their positions
+    for row in range(len(displayed_items) - 1, -1, -1):
+        if id(displayed_items[row]) in changed_ids:
+            history_list.delete(row)
+    for row, item in enumerate(new_items):
+        if id(item) in changed_ids:
+            history_list.insert(row, history_core.display_line(item))
+    displayed_items = new_items
+
+# Function to get the items of all selected rows
+def selected_items():
+    return [displayed_items[row] for row in history_list.curselection() if row < len(displayed_items)]
+
+# Function to select every row the list shows (i.e. everything matching the search)
+def select_all(event=None):
+    history_list.selection_set(0, tk.END)
+    update_status(f"Selected {len(displayed_items)} items")
+    return "break"
+
+# Function to delete, pin or unpin the given items as one edit
+def apply_to_items(items, action):
+    """One save and one list update for the whole batch; returns the number of items changed"""
+    global full_history
+    item_ids = [item['id'] for item in items]
+    if attached_daemon:
+        return forward_to_daemon('batch', item_ids=item_ids, action=action) or 0
+    full_history, changed = history_core.apply_batch(full_history, item_ids, action)
+    if not changed:
+        return 0
+    save_history()
+    update_rows(changed)
+    if action == 'delete':
+        for item in changed:
+            clipboard_writer.forget(item['id'])
+    else:
+        clipboard_writer.warm(full_history)
+        # Keep the same items selected after they moved
+        moved = {id(item) for item in changed}
+        for row, item in enumerate(displayed_items):
+            if id(item) in moved:
+                history_list.selection_set(row)
+    return len(changed)
 
 # Function to fetch URL metadata
 def fetch_url_metadata(url):
     """Fetch page title, description, and favicon"""
     try:
-        url = normalize_url(url)
+        url = url_preview.normalize_url(url)
         
         headers = {'User-Agent': 'Mozilla/5.0'}
         response = requests.get(url, timeout=5, headers=headers)
@@ -256,28 +556,9 @@ def fetch_url_metadata(url):
 
 # Function to capture screenshot of URL
 def capture_url_screenshot(url):
-    """Capture a screenshot of the URL using Playwright"""
+    """Capture a thumbnail of the URL using Playwright (cached)"""
     try:
-        url = normalize_url(url)
-        
-        # Create cache filename based on URL hash
-        url_hash = hashlib.md5(url.encode()).hexdigest()
-        cache_path = os.path.join(SCREENSHOT_CACHE_DIR, f"{url_hash}.png")
-        
-        # Check if cached
-        if os.path.exists(cache_path):
-            return cache_path
-        
-        # Capture screenshot
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page(viewport={'width': 1280, 'height': 720})
-            page.goto(url, wait_until='networkidle', timeout=30000)  # Changed these
-            page.wait_for_timeout(1000)  # Extra wait for rendering
-            page.screenshot(path=cache_path)
-            browser.close()
-        
-        return cache_path
+        return url_preview.capture_screenshot(url)
     except Exception as e:
         print(f"Screenshot error: {e}")
         return None
@@ -306,7 +587,7 @@ def update_preview(event=None):
                 preview_metadata_frame.pack_forget()
                 preview_canvas.pack(fill=tk.BOTH, expand=True)
                 
-                img = base64_to_image(item['image_data'])
+                img = capture.base64_to_image(item['image_data'])
                 
                 # Resize image to fit preview pane (max 400x400)
                 img.thumbnail((400, 400), Image.Resampling.LANCZOS)
@@ -324,7 +605,7 @@ def update_preview(event=None):
                     preview_canvas.create_text(200, 380, text=f"Text: {ocr_text[:50]}...", 
                                               font=("Arial", 8), fill="blue", width=380)
                 
-            elif is_url(item['text']):
+            elif classify.kind_of(item) == 'url':
                 # Show preview for URLs
                 preview_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=False, ipadx=5, ipady=5)
                 preview_label.config(text="URL Preview")
@@ -393,6 +674,63 @@ def update_preview(event=None):
         # No selection, hide preview
         preview_frame.pack_forget()
 
+# Function to show archive progress in the status bar (called from worker threads)
+def show_archive_progress(label, done, total):
+    percent = done * 100 // max(total, 1)
+    root.after(0, lambda: status_label.config(text=f"{label}... {percent}%"))
+
+# Function to export the history to an archive file
+def export_history():
+    path = filedialog.asksaveasfilename(title="Export History", defaultextension=archive.ARCHIVE_EXTENSION,
+                                        filetypes=[("Clipboard archive", f"*{archive.ARCHIVE_EXTENSION}")])
+    if not path:
+        return
+    items = list(full_history)
+    
+    def run_export():
+        try:
+            count = archive.export_archive(path, items, lambda done, total: show_archive_progress("Exporting", done, total))
+            root.after(0, lambda: update_status(f"Exported {count} items"))
+        except Exception as e:
+            root.after(0, lambda e=e: update_status(f"Export failed: {e}"))
+    
+    threading.Thread(target=run_export, daemon=True).start()
+
+# Function to merge an archive file into the history
+def import_history():
+    if attached_daemon:
+        messagebox.showinfo("Import", "The capture daemon owns the history.\n"
+                            "Run 'clipboard_manager.py --import <file>' after stopping it.")
+        return
+    path = filedialog.askopenfilename(title="Import History",
+                                      filetypes=[("Clipboard archive", f"*{archive.ARCHIVE_EXTENSION}"),
+                                                 ("All files", "*.*")])
+    if not path:
+        return
+    snapshot = list(full_history)
+    
+    def finish_import(history, stats):
+        global full_history
+        # Merge into the live history, so captures, deletes and pins made while the import
+        # was running are kept
+        snapshot_ids = {item.get('id') for item in snapshot}
+        imported = [item for item in history if item.get('id') not in snapshot_ids]
+        full_history = history_core.merge_items(full_history, imported, MAX_HISTORY)
+        capture_state['near_index'] = None
+        save_history()
+        refresh_display()
+        update_status(archive.import_summary(stats))
+    
+    def run_import():
+        try:
+            history, stats = archive.import_archive(path, snapshot, MAX_HISTORY,
+                                                    lambda done, total: show_archive_progress("Importing", done, total))
+            root.after(0, lambda: finish_import(history, stats))
+        except Exception as e:
+            root.after(0, lambda e=e: update_status(f"Import failed: {e}"))
+    
+    threading.Thread(target=run_import, daemon=True).start()
+
 # Settings Window
 def open_settings():
     settings_window = tk.Toplevel(root)
@@ -609,15 +947,97 @@ def open_settings():
     tk.Label(actions_tab, text="Your theme will be saved\nautomatically when you close the app.",
             bg='white', fg='gray').pack(pady=20)
     
+    tk.Label(actions_tab, text="History Backup", font=("Arial", 12, "bold"), bg='white').pack(pady=10)
+    
+    tk.Button(actions_tab, text="📤 Export History...", command=export_history,
+             width=30, height=2).pack(pady=5)
+    tk.Button(actions_tab, text="📥 Import History...", command=import_history,
+             width=30, height=2).pack(pady=5)
+    tk.Button(actions_tab, text="🔍 Re-run OCR on Images", command=toggle_reindex,
+             width=30, height=2).pack(pady=5)
+    
+    # Profiling Tab
+    profiling_tab = tk.Frame(notebook, bg='white')
+    notebook.add(profiling_tab, text='Profiling')
+    
+    tk.Label(profiling_tab, text="Profile the Running App", font=("Arial", 12, "bold"), bg='white').pack(pady=10)
+    
+    profile_mode = tk.StringVar(value=profiling.status().get('mode') or 'sample')
+    for text, value in (("Sampling (all threads, low overhead)", 'sample'),
+                        ("cProfile (every call on the UI thread)", 'cprofile'),
+                        ("Memory only", 'none')):
+        tk.Radiobutton(profiling_tab, text=text, variable=profile_mode, value=value,
+                      bg='white', anchor=tk.W).pack(fill=tk.X, padx=40)
+    
+    profile_memory = tk.BooleanVar(value=True)
+    tk.Checkbutton(profiling_tab, text="Trace memory allocations (tracemalloc)", variable=profile_memory,
+                  bg='white', anchor=tk.W).pack(fill=tk.X, padx=40, pady=5)
+    
+    profile_status = tk.Label(profiling_tab, text="", bg='white', fg='gray', wraplength=400, justify=tk.LEFT)
+    
+    def show_profile_status(message=None):
+        running = profiling.status()['running']
+        profile_button.config(text="⏹ Stop Profiling" if running else "▶ Start Profiling")
+        profile_status.config(text=message or ("Profiling..." if running else
+                                               f"Reports are written to {os.path.abspath(profiling.PROFILE_DIR)}"))
+    
+    def toggle_profiling():
+        try:
+            if profiling.status()['running']:
+                reports = profiling.stop()
+                show_profile_status(f"Wrote {len(reports)} files, e.g.\n{reports[-1]}" if reports else
+                                    "Profiling stopped; nothing was recorded")
+            else:
+                mode = profile_mode.get()
+                profiling.start(None if mode == 'none' else mode, profile_memory.get())
+                show_profile_status()
+        except ValueError as e:
+            show_profile_status(str(e))
+    
+    def take_snapshot():
+        try:
+            reports = profiling.snapshot()
+            show_profile_status(f"Snapshot written:\n{reports[-1]}")
+        except ValueError as e:
+            show_profile_status(str(e))
+    
+    def open_profiles():
+        os.makedirs(profiling.PROFILE_DIR, exist_ok=True)
+        try:
+            os.startfile(os.path.abspath(profiling.PROFILE_DIR))
+        except:
+            update_status("Error opening profiles folder")
+    
+    profile_button = tk.Button(profiling_tab, text="", command=toggle_profiling, width=30, height=2)
+    profile_button.pack(pady=10)
+    tk.Button(profiling_tab, text="📸 Memory Snapshot", command=take_snapshot,
+             width=30).pack(pady=5)
+    tk.Button(profiling_tab, text="📂 Open Reports Folder", command=open_profiles,
+             width=30).pack(pady=5)
+    profile_status.pack(pady=10, padx=20)
+    show_profile_status()
+    
     # Close button
     tk.Button(settings_window, text="Close", command=settings_window.destroy,
              width=15).pack(pady=10)
 
+# Headless mode: run only the capture pipeline, no window/tray/hotkey
+if __name__ == "__main__" and '--daemon' in sys.argv:
+    import daemon
+    sys.exit(daemon.run(MAX_HISTORY))
+
+# Backup mode: --export <file> / --import <file>, then exit
+if __name__ == "__main__" and ('--export' in sys.argv or '--import' in sys.argv):
+    sys.exit(archive.run_cli(sys.argv, MAX_HISTORY))
+
 # Create the main window
 root = tk.Tk()
 root.title("Macs Clipboard Manager")
 root.geometry("800x500")
 
+# Read the clipboard through this window's own display connection where we can
+clipboard_reader = clipboard_trace.from_argv(clipboard_backend.create(root), sys.argv)
+
 # Make window stay on top (optional for widget-like behavior)
 root.attributes('-topmost', False)
 
@@ -660,6 +1080,11 @@ button_frame.pack(fill=tk.X, pady=5)
 # Function to clear all history
 def clear_history():
     global full_history
+    if attached_daemon:
+        if forward_to_daemon('clear'):
+            update_status("History cleared")
+            preview_frame.pack_forget()
+        return
     history_list.delete(0, tk.END)
     full_history = []
     save_history()
@@ -671,38 +1096,33 @@ clear_button = tk.Button(button_frame, text="Clear History", command=clear_histo
                          bg="#e74c3c", fg="white", font=("Arial", 9), padx=10)
 clear_button.pack(side=tk.LEFT, padx=5)
 
-def delete_selected():
-    global full_history
-    selection = history_list.curselection()
-    if selection:
-        index = get_actual_index(selection[0])
-        if index is not None:
-            item_type = full_history[index].get('type', 'text')
-            if item_type == 'image':
-                deleted_text = "[IMAGE]"
-            else:
-                deleted_text = full_history[index]['text'][:50]
-            full_history.pop(index)
-            save_history()
-            refresh_display()
-            update_status(f"Deleted: {deleted_text}...")
-            preview_frame.pack_forget()
+def delete_selected(event=None):
+    items = selected_items()
+    if not items:
+        return
+    count = apply_to_items(items, 'delete')
+    if count == 1:
+        deleted_text = "[IMAGE]" if items[0].get('type', 'text') == 'image' else items[0]['text'][:50]
+        update_status(f"Deleted: {deleted_text}...")
+    elif count:
+        update_status(f"Deleted {count} items")
+    preview_frame.pack_forget()
 
 delete_button = tk.Button(button_frame, text="Delete Selected", command=delete_selected,
                          bg="#e67e22", fg="white", font=("Arial", 9), padx=10)
 delete_button.pack(side=tk.LEFT, padx=5)
 
 def toggle_pin():
-    global full_history
-    selection = history_list.curselection()
-    if selection:
-        index = get_actual_index(selection[0])
-        if index is not None:
-            full_history[index]['pinned'] = not full_history[index].get('pinned', False)
-            save_history()
-            refresh_display()
-            status = "Pinned" if full_history[index]['pinned'] else "Unpinned"
-            update_status(f"{status} item")
+    items = selected_items()
+    if not items:
+        return
+    # Pin them all unless every selected item is pinned already
+    action = 'unpin' if all(item.get('pinned', False) for item in items) else 'pin'
+    count = apply_to_items(items, action)
+    if len(items) == 1:
+        update_status("Pinned item" if action == 'pin' else "Unpinned item")
+    else:
+        update_status(f"{'Pinned' if action == 'pin' else 'Unpinned'} {count} items")
 
 pin_button = tk.Button(button_frame, text="Pin/Unpin", command=toggle_pin,
                       bg="#9b59b6", fg="white", font=("Arial", 9), padx=10)
@@ -744,6 +1164,21 @@ search_var.trace('w', lambda *args: refresh_display())
 search_entry = tk.Entry(search_frame, textvariable=search_var, font=("Arial", 10))
 search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
 
+# Fuzzy mode: typo-tolerant, ranked results instead of exact substring matches
+fuzzy_var = tk.BooleanVar(value=False)
+fuzzy_check = tk.Checkbutton(search_frame, text="Fuzzy", variable=fuzzy_var,
+                             command=refresh_display, bg="#ecf0f1", font=("Arial", 9))
+fuzzy_check.pack(side=tk.LEFT, padx=5)
+
+# Show only one kind of content (kinds are set by classify when items are captured)
+KIND_FILTERS = {"All": None, "URLs": 'url', "Code": 'code', "JSON": 'json', "Paths": 'path',
+                "Emails": 'email', "Colors": 'color', "Text": 'text', "Images": 'image'}
+kind_filter_var = tk.StringVar(value="All")
+kind_filter = ttk.Combobox(search_frame, textvariable=kind_filter_var, values=list(KIND_FILTERS),
+                           state="readonly", width=8)
+kind_filter.pack(side=tk.LEFT, padx=5)
+kind_filter_var.trace('w', lambda *args: refresh_display())
+
 # Main content frame
 main_content_frame = tk.Frame(root)
 main_content_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -764,13 +1199,17 @@ h_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
 history_list = tk.Listbox(list_frame, font=("Courier", 10),
                           yscrollcommand=v_scrollbar.set,
                           xscrollcommand=h_scrollbar.set,
-                          bg="#ecf0f1", selectbackground="#3498db")
+                          bg="#ecf0f1", selectbackground="#3498db",
+                          selectmode=tk.EXTENDED)
 history_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
 v_scrollbar.config(command=history_list.yview)
 h_scrollbar.config(command=history_list.xview)
 
 history_list.bind('<<ListboxSelect>>', update_preview)
+# Shift/Ctrl+click select ranges; Ctrl+A selects everything matching the search
+history_list.bind('<Control-a>', select_all)
+history_list.bind('<Delete>', delete_selected)
 
 # Right side: Preview pane
 preview_frame = tk.Frame(main_content_frame, bg="#ecf0f1", relief=tk.RAISED, borderwidth=2)
@@ -823,137 +1262,56 @@ def update_current_clipboard(text, item_type='text'):
     if item_type == 'image':
         current_clipboard_label.config(text=f"Currently copied: [IMAGE] at {timestamp}")
     else:
-        display_text = text.replace('\n', ' ').replace('\r', '')[:40]
+        display_text = text[:200].replace('\n', ' ').replace('\r', '')[:40]
         if len(display_text) > 40:
             display_text = display_text[:40] + "..."
         current_clipboard_label.config(text=f"Currently copied: {display_text} at {timestamp}")
 
+# Attach to a running capture daemon instead of writing the history ourselves
+if not history_core.acquire_writer_lock('gui'):
+    attached_daemon = history_core.read_writer_lock()
+
 load_history()
 load_window_settings()
 apply_theme()
 
-def image_to_base64(image):
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode()
-
-def base64_to_image(base64_string):
-    image_data = base64.b64decode(base64_string)
-    return Image.open(io.BytesIO(image_data))
-
 def check_clipboard():
-    global last_clipboard, last_clipboard_image, full_history
+    global full_history
     
-    try:
-        img = ImageGrab.grabclipboard()
-        if img and img != last_clipboard_image:
-            last_clipboard_image = img
-            
-            # Try to extract text from image using OCR
-            ocr_text = ""
-            try:
-                ocr_text = pytesseract.image_to_string(img).strip()
-                print(f"OCR extracted: {ocr_text[:50]}...")
-            except Exception as e:
-                print(f"OCR error: {e}")
-            
-            item = {
-                'type': 'image',
-                'image_data': image_to_base64(img),
-                'ocr_text': ocr_text,
-                'timestamp': datetime.now().timestamp(),
-                'pinned': False
-            }
-            full_history.insert(0, item)
-            
-            unpinned = [x for x in full_history if not x.get('pinned', False)]
-            pinned = [x for x in full_history if x.get('pinned', False)]
-            
-            if len(unpinned) > MAX_HISTORY:
-                unpinned = unpinned[:MAX_HISTORY]
-            
-            full_history = pinned + unpinned
-            
-            save_history()
-            refresh_display()
-            
+    full_history, item = capture.poll_clipboard(capture_state, full_history, MAX_HISTORY)
+    interval = poll_scheduler.next_interval(clipboard_poller, captured=item is not None)
+    
+    if item:
+        save_history()
+        refresh_display()
+        ipc_server.publish_capture(item)
+        clipboard_writer.warm(full_history)
+        
+        if item['type'] == 'image':
+            ocr_text = item['ocr_text']
             if ocr_text:
                 update_status(f"Captured: [IMAGE with text: {ocr_text[:30]}...]")
             else:
                 update_status("Captured: [IMAGE]")
             update_current_clipboard("[IMAGE]", 'image')
-                
-            root.after(500, check_clipboard)
-            return
-    except:
-        pass
-    
-    current = pyperclip.paste()
-    
-    if current != last_clipboard and current.strip():
-        last_clipboard = current
-        
-        duplicate_found = False
-        for item in full_history:
-            if item.get('type', 'text') == 'text' and item.get('text') == current:
-                duplicate_found = True
-                break
-        
-        if not duplicate_found:
-            item = {
-                'type': 'text',
-                'text': current,
-                'timestamp': datetime.now().timestamp(),
-                'pinned': False
-            }
-            full_history.insert(0, item)
-            
-            unpinned = [x for x in full_history if not x.get('pinned', False)]
-            pinned = [x for x in full_history if x.get('pinned', False)]
-            
-            if len(unpinned) > MAX_HISTORY:
-                unpinned = unpinned[:MAX_HISTORY]
-            
-            full_history = pinned + unpinned
-            
-            save_history()
-            refresh_display()
-            
-            display_text = current.replace('\n', ' ').replace('\r', '')[:50]
+        else:
+            current = item['text']
+            display_text = current[:200].replace('\n', ' ').replace('\r', '')[:50]
             update_status(f"Captured: {display_text}...")
             update_current_clipboard(current)
+    elif maintenance.due(poll_scheduler.idle_seconds(clipboard_poller)):
+        maintenance.start(list(full_history), lambda result: run_on_ui(apply_maintenance, result),
+                          maintenance_done)
     
-    root.after(500, check_clipboard)
-
-def is_url(text):
-    text = text.strip().lower()
-    # Check for URL patterns (http://, https://, www., or domain.extension format)
-    if text.startswith(('http://', 'https://', 'www.', 'ftp://')):
-        return True
-    # Check if it looks like a domain (has a dot and no spaces)
-    if '.' in text and ' ' not in text and len(text.split('.')) >= 2:
-        # Make sure it has a valid TLD-like ending
-        parts = text.split('.')
-        if len(parts[-1]) >= 2:  # TLD should be at least 2 characters
-            return True
-    return False
+    root.after(int(interval * 1000), check_clipboard)
 
 def get_actual_index(display_index):
-    search_term = search_var.get().lower()
-    sorted_history = sorted(full_history, key=lambda x: (not x.get('pinned', False), -x.get('timestamp', 0)))
-    
-    current_display = 0
-    for idx, item in enumerate(sorted_history):
-        if item.get('type', 'text') == 'text':
-            if search_term and search_term not in item.get('text', '').lower():
-                continue
-        if current_display == display_index:
-            return full_history.index(item)
-        current_display += 1
-    return None
+    if display_index >= len(displayed_items):
+        return None
+    return history_core.index_of(full_history, displayed_items[display_index])
 
 def item_clicked(event):
-    global full_history, last_clipboard, last_clipboard_image
+    global full_history
     selection = history_list.curselection()
     if selection:
         index = get_actual_index(selection[0])
@@ -967,42 +1325,39 @@ def item_clicked(event):
                 if ocr_text:
                     # Copy OCR text to clipboard
                     pyperclip.copy(ocr_text)
-                    last_clipboard = ocr_text
+                    capture.remember_text(capture_state, ocr_text)
                     update_status(f"Copied OCR text: {ocr_text[:50]}...")
                     update_current_clipboard(ocr_text)
                 else:
-                    # Copy image to clipboard
-                    img = base64_to_image(item['image_data'])
-                    output = io.BytesIO()
-                    img.convert('RGB').save(output, 'BMP')
-                    data = output.getvalue()[14:]
-                    output.close()
-                    
-                    import win32clipboard
-                    win32clipboard.OpenClipboard()
-                    win32clipboard.EmptyClipboard()
-                    win32clipboard.SetClipboardData(win32clipboard.CF_DIB, data)
-                    win32clipboard.CloseClipboard()
+                    # Copy image to clipboard (offered as the PNG we stored)
+                    try:
+                        clipboard_writer.copy_item(item)
+                    except clipboard_writer.ClipboardWriteError as e:
+                        update_status(f"Couldn't copy image: {e}")
+                        return
                     
-                    last_clipboard_image = img
+                    capture.remember_image(capture_state, item['image_data'])
                     update_status("Copied image to clipboard")
                     update_current_clipboard("[IMAGE]", 'image')
             else:
-                full_text = item['text']
-                if is_url(full_text):
-                    full_text = normalize_url(full_text)
+                # Large texts are read from their blob ahead of time for pinned/recent items
+                full_text = clipboard_writer.payload_for(item)['text']
+                if classify.kind_of(item) == 'url':
+                    full_text = url_preview.normalize_url(full_text)
                     webbrowser.open(full_text)
                     update_status(f"Opening URL: {full_text[:50]}...")
                 else:
                     pyperclip.copy(full_text)
-                    last_clipboard = full_text
+                    capture.remember_text(capture_state, full_text)
                     update_status(f"Copied: {full_text[:50]}...")
                     update_current_clipboard(full_text)
 
 def show_context_menu(event):
     index = history_list.nearest(event.y)
-    history_list.selection_clear(0, tk.END)
-    history_list.selection_set(index)
+    # Right-clicking inside a multi-selection keeps it, so it can be pinned or deleted as a whole
+    if index not in history_list.curselection():
+        history_list.selection_clear(0, tk.END)
+        history_list.selection_set(index)
     history_list.activate(index)
     
     update_preview()
@@ -1021,6 +1376,20 @@ def show_context_menu(event):
         else:
             context_menu.entryconfig("Open Image", state="disabled")
             context_menu.entryconfig("Copy OCR Text", state="disabled")
+        
+        # Large texts only keep a preview in the list, open the full text in an editor
+        if full_history[actual_index].get('blob'):
+            context_menu.entryconfig("Open Full Text", state="normal")
+        else:
+            context_menu.entryconfig("Open Full Text", state="disabled")
+        
+        # Copy As lists the rich formats kept with this copy, and the ones offered but not read
+        # (they can still be fetched while the clipboard holds this copy)
+        item = full_history[actual_index]
+        formats = set(item.get('formats', {})) | set(item.get('formats_offered', []))
+        for name, label in clipboard_writer.FORMAT_LABELS.items():
+            copy_as_submenu.entryconfig(label, state="normal" if name in formats else "disabled")
+        context_menu.entryconfig("Copy As", state="normal" if formats else "disabled")
     
     context_menu.post(event.x_root, event.y_root)
 
@@ -1045,11 +1414,32 @@ def copy_menu():
         if index is not None:
             item = full_history[index]
             if item.get('type', 'text') == 'text':
-                full_text = item['text']
+                full_text = clipboard_writer.payload_for(item)['text']
                 pyperclip.copy(full_text)
                 update_status(f"Copied: {full_text[:50]}...")
                 update_current_clipboard(full_text)
 
+def copy_as_menu(name):
+    selection = history_list.curselection()
+    if selection:
+        index = get_actual_index(selection[0])
+        if index is not None:
+            item = full_history[index]
+            label = clipboard_writer.FORMAT_LABELS[name]
+            if not capture.fetch_format(capture_state, item, name):
+                update_status(f"The {label} version of this copy wasn't kept (its size couldn't be "
+                              f"checked) and is no longer on the clipboard")
+                return
+            try:
+                plain = clipboard_writer.copy_format(item, name)
+            except clipboard_writer.ClipboardWriteError as e:
+                update_status(f"Couldn't copy: {e}")
+                return
+            if plain:
+                capture.remember_text(capture_state, plain)
+            update_status(f"Copied as {label}")
+            update_current_clipboard(plain or f"[{label}]")
+
 def copy_ocr_text_menu():
     global full_history
     selection = history_list.curselection()
@@ -1072,7 +1462,7 @@ def open_image_menu():
         if index is not None:
             item = full_history[index]
             if item.get('type') == 'image':
-                img = base64_to_image(item['image_data'])
+                img = capture.base64_to_image(item['image_data'])
                 temp_path = os.path.abspath("temp_clipboard_image.png")
                 img.save(temp_path)
                 
@@ -1082,13 +1472,38 @@ def open_image_menu():
                 except:
                     update_status("Error opening image")
 
+def open_text_menu():
+    selection = history_list.curselection()
+    if selection:
+        index = get_actual_index(selection[0])
+        if index is not None:
+            item = full_history[index]
+            if item.get('blob'):
+                temp_path = os.path.abspath("temp_clipboard_text.txt")
+                # Stream the blob out so the whole text is never held in memory
+                with open(temp_path, "w", encoding="utf-8") as file:
+                    for chunk in blob_store.iter_text(item['blob']):
+                        file.write(chunk)
+                
+                try:
+                    os.startfile(temp_path)
+                    update_status("Opening full text...")
+                except:
+                    update_status("Error opening text")
+
 context_menu = tk.Menu(root, tearoff=0)
 context_menu.add_command(label="Copy", command=copy_menu)
+copy_as_submenu = tk.Menu(context_menu, tearoff=0)
+for format_name, format_label in clipboard_writer.FORMAT_LABELS.items():
+    copy_as_submenu.add_command(label=format_label, command=lambda name=format_name: copy_as_menu(name))
+context_menu.add_cascade(label="Copy As", menu=copy_as_submenu)
 context_menu.add_command(label="Copy OCR Text", command=copy_ocr_text_menu)
 context_menu.add_command(label="Google This", command=google_search_menu)
 context_menu.add_command(label="Open Image", command=open_image_menu)
+context_menu.add_command(label="Open Full Text", command=open_text_menu)
 context_menu.add_command(label="Pin/Unpin", command=toggle_pin)
 context_menu.add_command(label="Delete", command=delete_selected)
+context_menu.add_command(label="Select All", command=select_all)
 
 history_list.bind("<Double-Button-1>", item_clicked)
 history_list.bind("<Button-3>", show_context_menu)
@@ -1120,11 +1535,22 @@ def create_image():
         return image
 
 def show_window(icon=None, item=None):
+    root.after(0, window_shown)
     root.after(0, root.deiconify)
     root.after(0, root.lift)
     root.after(0, root.focus_force)
 
+# Function to catch up on whatever happened while the window was hidden
+def window_shown():
+    global window_hidden
+    window_hidden = False
+    poll_scheduler.note_activity(clipboard_poller)
+    if display_dirty:
+        refresh_display()
+
 def hide_window():
+    global window_hidden
+    window_hidden = True
     root.withdraw()
 
 def quit_app(icon=None, item=None):
@@ -1132,6 +1558,9 @@ def quit_app(icon=None, item=None):
         icon.stop()
     save_history()
     save_window_settings()
+    persistence.flush()
+    ipc_server.stop()
+    history_core.release_writer_lock()
     root.quit()
     os._exit(0)  # Force complete exit
 
@@ -1152,6 +1581,10 @@ def on_closing():
 
 root.protocol("WM_DELETE_WINDOW", on_closing)
 
+# Using the window counts as activity, so the clipboard is polled quickly again
+root.bind_all('<KeyPress>', lambda event: poll_scheduler.note_activity(clipboard_poller), add='+')
+root.bind_all('<ButtonPress>', lambda event: poll_scheduler.note_activity(clipboard_poller), add='+')
+
 def hotkey_callback():
     show_window()
 
@@ -1160,6 +1593,11 @@ keyboard.add_hotkey('ctrl+shift+v', hotkey_callback)
 tray_thread = threading.Thread(target=setup_tray_icon, daemon=True)
 tray_thread.start()
 
-check_clipboard()
+if attached_daemon:
+    update_status(f"Attached to capture daemon (pid {attached_daemon['pid']})")
+    watch_daemon_history()
+else:
+    start_ipc_server()
+    check_clipboard()
 
 root.mainloop()
\ No newline at end of file
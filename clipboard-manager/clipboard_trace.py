@@ -0,0 +1,374 @@
+# Recording and replaying clipboard activity.
+#
+# A trace is a file of newline-delimited JSON records, one per clipboard change:
+#
+#   {"format": "macs-clipboard-trace", "version": 1, "created": ...}   header, always first
+#   {"t": 1.25, "type": "text", "size": 120, "digest": "...", "text": ...}
+#   {"t": 3.5, "type": "image", "width": 800, "height": 600, "digest": "...", "image": <base64 PNG>}
+#
+# "t" is seconds since recording started. The content ("text"/"image") is only
+# recorded with --trace-content; without it the replay makes up content of the
+# same size, using the digest so repeated copies stay repeats.
+#
+# Record while using the app:
+#
+#     python clipboard_manager.py --record-trace trace.jsonl [--trace-content]
+#     python clipboard_manager.py --daemon --record-trace trace.jsonl
+#
+# Replay a trace, or synthetic bursts, through the capture pipeline headlessly:
+#
+#     python clipboard_trace.py replay trace.jsonl --speed 4
+#     python clipboard_trace.py synth --events 500 --rate 50 --burst 20 --pause 2
+#
+# The replay runs in a scratch folder with a fake clipboard, so the real history
+# and clipboard are never touched, and reports capture throughput, changes the
+# poller never saw, capture latency and how long each poll blocked the UI thread.
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from PIL import Image
+import blob_store
+import capture
+import history_core
+import persistence
+import poll_scheduler
+
+TRACE_FORMAT = "macs-clipboard-trace"
+TRACE_VERSION = 1
+# A poll longer than one 60 Hz frame is a visible stall
+FRAME_SECONDS = 1 / 60
+
+WORDS = ("clipboard", "manager", "copy", "paste", "history", "def", "return", "import", "http://example.com",
+         "value", "error", "json", "token", "select", "from", "where", "lorem", "ipsum")
+
+# Function to fingerprint the content of one clipboard change
+def text_fingerprint(text):
+    return blob_store.text_digest(text)[:16]
+
+def image_fingerprint(image):
+    return hashlib.sha256(image.tobytes()).hexdigest()[:16]
+
+class RecordingClipboard:
+    """Wraps a clipboard reader and logs every change it reads to a trace file"""
+
+    def __init__(self, backend, path, include_content=False):
+        self.backend = backend
+        self.name = f"{backend.name}+trace"
+        self.include_content = include_content
+        self.started = time.monotonic()
+        self.last_text = None
+        self.last_image = None
+        self.lock = threading.Lock()
+        self.file = open(path, "w", encoding="utf-8", errors="surrogatepass")
+        self._write({'format': TRACE_FORMAT, 'version': TRACE_VERSION,
+                     'created': datetime.now().isoformat(timespec='seconds'), 'backend': backend.name,
+                     'content': include_content})
+
+    def _write(self, record):
+        with self.lock:
+            self.file.write(json.dumps(record, separators=(',', ':')))
+            self.file.write("\n")
+            self.file.flush()
+
+    def change_marker(self):
+        return self.backend.change_marker()
+
+    def grab_image(self):
+        image = self.backend.grab_image()
+        if isinstance(image, Image.Image) and image != self.last_image:
+            self.last_image = image
+            record = {'t': round(time.monotonic() - self.started, 4), 'type': 'image',
+                      'width': image.width, 'height': image.height, 'digest': image_fingerprint(image)}
+            if self.include_content:
+                record['image'] = capture.image_to_base64(image)
+            self._write(record)
+        return image
+
+    def paste_text(self):
+        text = self.backend.paste_text()
+        if text != self.last_text:
+            self.last_text = text
+            if text.strip():
+                record = {'t': round(time.monotonic() - self.started, 4), 'type': 'text',
+                          'size': len(text), 'digest': text_fingerprint(text)}
+                if self.include_content:
+                    record['text'] = text
+                self._write(record)
+        return text
+
+    def available_formats(self):
+        return getattr(self.backend, 'available_formats', list)()
+
+    def format_size(self, name):
+        return getattr(self.backend, 'format_size', lambda name: None)(name)
+
+    def read_format(self, name):
+        return self.backend.read_format(name)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+# Function to wrap a clipboard reader in a recorder if --record-trace was given
+def from_argv(backend, argv):
+    if '--record-trace' not in argv:
+        return backend
+    position = argv.index('--record-trace') + 1
+    if position >= len(argv):
+        print("Usage: --record-trace <file> [--trace-content]; not recording")
+        return backend
+    print(f"Recording clipboard trace to {argv[position]}")
+    return RecordingClipboard(backend, argv[position], '--trace-content' in argv)
+
+class FakeClipboard:
+    """A clipboard the replayer writes to; remembers which changes were ever read"""
+    name = 'fake'
+
+    def __init__(self, use_marker=True):
+        self.use_marker = use_marker
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.text = ""
+        self.image = None
+        # One entry per change: when it was made and when it was first read (None if never)
+        self.changes = []
+
+    def _set(self, text, image):
+        with self.lock:
+            self.text = text
+            self.image = image
+            self.sequence += 1
+            self.changes.append({'set': time.perf_counter(), 'read': None})
+
+    def set_text(self, text):
+        self._set(text, None)
+
+    def set_image(self, image):
+        self._set("", image)
+
+    def _mark_read(self):
+        if self.changes and self.changes[-1]['read'] is None:
+            self.changes[-1]['read'] = time.perf_counter()
+        return self.sequence
+
+    def current_change(self):
+        with self.lock:
+            return self.changes[-1] if self.changes else None
+
+    def change_marker(self):
+        return self.sequence if self.use_marker else None
+
+    def grab_image(self):
+        with self.lock:
+            self._mark_read()
+            return self.image
+
+    def paste_text(self):
+        with self.lock:
+            self._mark_read()
+            return self.text
+
+# Function to read the events of a trace file
+def read_trace(path):
+    with open(path, "r", encoding="utf-8", errors="surrogatepass") as file:
+        header = json.loads(file.readline() or "{}")
+        if header.get('format') != TRACE_FORMAT:
+            raise ValueError(f"{path} is not a clipboard trace")
+        if header.get('version', 0) > TRACE_VERSION:
+            raise ValueError(f"{path} was written by a newer version (trace version {header['version']})")
+        return [json.loads(line) for line in file if line.strip()]
+
+# Function to make up a burst pattern of clipboard changes
+def synthetic_events(count, rate=20.0, burst=10, pause=1.0, image_ratio=0.05, duplicate_ratio=0.1,
+                     large_ratio=0.02, seed=1):
+    """Bursts of `burst` changes `rate` per second apart, with `pause` seconds between bursts"""
+    rng = random.Random(seed)
+    events = []
+    t = 0.0
+    for index in range(count):
+        if index and index % burst == 0:
+            t += pause
+        if events and rng.random() < duplicate_ratio:
+            event = dict(rng.choice(events))
+        elif rng.random() < image_ratio:
+            width, height = rng.choice(((400, 300), (1280, 720), (1920, 1080)))
+            event = {'type': 'image', 'width': width, 'height': height, 'digest': f"synth-{index}"}
+        else:
+            size = capture.LARGE_TEXT_THRESHOLD * 2 if rng.random() < large_ratio else rng.choice((20, 200, 2000))
+            event = {'type': 'text', 'size': size, 'digest': f"synth-{index}"}
+        event['t'] = round(t, 4)
+        events.append(event)
+        t += 1.0 / rate
+    return events
+
+# Function to turn trace events into clipboard content (made up where it wasn't recorded)
+def materialize(events):
+    """Return a list of (seconds, 'text' or 'image', content), built before the replay starts"""
+    made = {}
+    changes = []
+    for event in events:
+        key = (event.get('type'), event.get('digest'))
+        content = made.get(key)
+        if content is None:
+            rng = random.Random(str(key))
+            if event.get('type') == 'image':
+                if 'image' in event:
+                    content = capture.base64_to_image(event['image'])
+                    content.load()
+                else:
+                    width, height = event.get('width', 800), event.get('height', 600)
+                    content = Image.frombytes('RGB', (width // 8, height // 8), rng.randbytes(width // 8 * (height // 8) * 3))
+                    content = content.resize((width, height))
+            else:
+                content = event.get('text')
+                if content is None:
+                    words = []
+                    length = 0
+                    while length < event.get('size', 20):
+                        words.append(rng.choice(WORDS))
+                        length += len(words[-1]) + 1
+                    content = " ".join(words)[:max(1, event.get('size', 20))]
+            made[key] = content
+        changes.append((float(event.get('t', 0)), 'image' if event.get('type') == 'image' else 'text', content))
+    return changes
+
+def _percentiles(values):
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+    return {'count': len(ordered), 'p50_ms': pick(50) * 1000, 'p95_ms': pick(95) * 1000,
+            'p99_ms': pick(99) * 1000, 'max_ms': ordered[-1] * 1000}
+
+# Function to feed changes through the capture pipeline the way check_clipboard does
+def replay(changes, speed=1.0, interval=None, max_history=history_core.MAX_HISTORY, use_marker=True):
+    """interval=None polls on the app's adaptive schedule; returns the report"""
+    clipboard = FakeClipboard(use_marker)
+    state = capture.new_capture_state([], clipboard)
+    scheduler = poll_scheduler.new_scheduler()
+    history = []
+    latencies = []
+    stalls = []
+    captured = 0
+    finished = threading.Event()
+
+    def feed():
+        start = time.perf_counter()
+        for at, kind, content in changes:
+            delay = start + at / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if kind == 'image':
+                clipboard.set_image(content)
+            else:
+                clipboard.set_text(content)
+        finished.set()
+
+    started = time.perf_counter()
+    feeder = threading.Thread(target=feed, name="trace-feeder", daemon=True)
+    feeder.start()
+    while True:
+        done = finished.is_set()
+        poll_start = time.perf_counter()
+        history, item = capture.poll_clipboard(state, history, max_history)
+        if item:
+            history_core.schedule_history_save(history)
+        poll_end = time.perf_counter()
+        stalls.append(poll_end - poll_start)
+        if item:
+            captured += 1
+            change = clipboard.current_change()
+            if change is not None:
+                latencies.append(poll_end - change['set'])
+        # One more poll after the last change, so it gets its chance to be captured
+        if done:
+            break
+        wait = interval if interval is not None else poll_scheduler.next_interval(scheduler, captured=item is not None)
+        finished.wait(wait)
+    elapsed = time.perf_counter() - started
+    persistence.flush()
+
+    never_read = sum(1 for change in clipboard.changes if change['read'] is None)
+    return {
+        'changes': len(clipboard.changes),
+        'captured': captured,
+        'missed': never_read,
+        'read_not_captured': len(clipboard.changes) - never_read - captured,
+        'seconds': elapsed,
+        'captures_per_second': captured / elapsed if elapsed else 0.0,
+        'polls': len(stalls),
+        'capture_latency': _percentiles(latencies),
+        'ui_stall': dict(_percentiles(stalls), total_ms=sum(stalls) * 1000,
+                         over_one_frame=sum(1 for stall in stalls if stall > FRAME_SECONDS)),
+        'history_items': len(history),
+        'persistence': persistence.write_stats()
+    }
+
+def print_report(report):
+    latency = report['capture_latency']
+    stall = report['ui_stall']
+    print(f"{report['changes']} clipboard changes in {report['seconds']:.1f} s, {report['polls']} polls")
+    print(f"captured    {report['captured']} ({report['captures_per_second']:.1f}/s)")
+    print(f"missed      {report['missed']} (overwritten before any poll read them)")
+    print(f"not added   {report['read_not_captured']} (read, but duplicates or empty)")
+    if latency['count']:
+        print(f"latency     p50 {latency['p50_ms']:.1f} ms  p95 {latency['p95_ms']:.1f} ms  max {latency['max_ms']:.1f} ms")
+    print(f"UI stall    p50 {stall['p50_ms']:.2f} ms  p95 {stall['p95_ms']:.2f} ms  max {stall['max_ms']:.1f} ms, "
+          f"{stall['over_one_frame']} polls over one frame, {stall['total_ms']:.0f} ms total")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay clipboard activity through the capture pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+    replay_cmd = sub.add_parser("replay", help="replay a recorded trace")
+    replay_cmd.add_argument("trace")
+    replay_cmd.add_argument("--speed", type=float, default=1.0, help="replay this many times faster")
+    synth = sub.add_parser("synth", help="replay synthetic bursts")
+    synth.add_argument("--events", type=int, default=200)
+    synth.add_argument("--rate", type=float, default=20.0, help="changes per second within a burst")
+    synth.add_argument("--burst", type=int, default=10, help="changes per burst")
+    synth.add_argument("--pause", type=float, default=1.0, help="seconds between bursts")
+    synth.add_argument("--image-ratio", type=float, default=0.05)
+    synth.add_argument("--duplicate-ratio", type=float, default=0.1)
+    synth.add_argument("--large-ratio", type=float, default=0.02)
+    synth.add_argument("--seed", type=int, default=1)
+    for cmd in (replay_cmd, synth):
+        cmd.add_argument("--interval", type=float, help="poll every N seconds (default: the app's adaptive schedule)")
+        cmd.add_argument("--max-history", type=int, default=history_core.MAX_HISTORY)
+        cmd.add_argument("--no-marker", action="store_true",
+                         help="clipboard without a change counter (pyperclip on Linux/macOS): read it every poll")
+        cmd.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        events = read_trace(args.trace)
+        speed = args.speed
+    else:
+        events = synthetic_events(args.events, args.rate, args.burst, args.pause, args.image_ratio,
+                                  args.duplicate_ratio, args.large_ratio, args.seed)
+        speed = 1.0
+    changes = materialize(events)
+
+    # Blobs, the OCR cache and the history file go to a scratch folder
+    workdir = tempfile.mkdtemp(prefix="clipboard-replay-")
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        report = replay(changes, speed, args.interval, args.max_history, not args.no_marker)
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
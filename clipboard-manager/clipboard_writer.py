@@ -0,0 +1,279 @@
+# Putting history items back on the clipboard.
+#
+# Images are stored as PNG, so they are offered as PNG as-is instead of being
+# decoded and re-encoded on every copy:
+#
+#   * Windows: the registered "PNG" format, plus CF_DIB for older apps
+#   * Linux:   image/png through wl-copy (Wayland) or xclip (X11)
+#   * macOS:   PNG through osascript
+#
+# Rich formats kept with an item (HTML, RTF, copied files) can be copied back
+# as that format with copy_format() ("Copy As" in the context menu).
+#
+# Anything that still needs work before it can be copied (base64 decoding, the
+# DIB for Windows, reading a large text blob) is prepared ahead of time for
+# pinned and recent items and kept in a small LRU cache, so copying them back
+# is instant.
+import base64
+import io
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+import pyperclip
+from PIL import Image
+import blob_store
+import history_core
+
+# How many prepared payloads to keep, and how much memory they may use in total
+PAYLOAD_CACHE_ITEMS = 32
+PAYLOAD_CACHE_BYTES = 128 * 1024 * 1024
+# Recent items (besides pinned ones) to prepare in the background
+WARM_RECENT = 5
+# Menu labels of the rich formats items can keep
+FORMAT_LABELS = {'html': "HTML", 'rtf': "Rich Text", 'files': "Files"}
+LINUX_FORMAT_TYPES = {'html': 'text/html', 'rtf': 'text/rtf', 'files': 'text/uri-list'}
+
+_cache = OrderedDict()  # item id -> payload, least recently used first
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+stats = {
+    'copies': 0,
+    'cache_hits': 0,
+    'prepared': 0,
+    'prepare_seconds': 0.0,
+    'write_seconds': 0.0
+}
+
+class ClipboardWriteError(Exception):
+    pass
+
+def _payload_size(payload):
+    if payload['kind'] == 'image':
+        return len(payload['png']) + len(payload.get('dib') or b'')
+    return len(payload['text']) * 2
+
+# Function to convert PNG bytes to a CF_DIB (a BMP without its file header)
+def png_to_dib(png):
+    output = io.BytesIO()
+    Image.open(io.BytesIO(png)).convert('RGB').save(output, 'BMP')
+    return output.getvalue()[14:]
+
+# Function to turn an item into what gets written to the clipboard
+def prepare(item):
+    start = time.perf_counter()
+    if item.get('type', 'text') == 'image':
+        png = base64.b64decode(item['image_data'])
+        payload = {'kind': 'image', 'png': png, 'dib': png_to_dib(png) if sys.platform == 'win32' else None}
+    else:
+        payload = {'kind': 'text', 'text': history_core.item_text(item)}
+    stats['prepared'] += 1
+    stats['prepare_seconds'] += time.perf_counter() - start
+    return payload
+
+def _remember(item_id, payload):
+    global _cache_bytes
+    with _cache_lock:
+        if item_id in _cache:
+            return
+        _cache[item_id] = payload
+        _cache_bytes += _payload_size(payload)
+        while len(_cache) > PAYLOAD_CACHE_ITEMS or (_cache_bytes > PAYLOAD_CACHE_BYTES and len(_cache) > 1):
+            _, old = _cache.popitem(last=False)
+            _cache_bytes -= _payload_size(old)
+
+# Function to get an item's payload, preparing it if it isn't cached
+def payload_for(item):
+    item_id = item.get('id')
+    with _cache_lock:
+        payload = _cache.get(item_id)
+        if payload is not None:
+            _cache.move_to_end(item_id)
+            stats['cache_hits'] += 1
+            return payload
+    payload = prepare(item)
+    if item_id is not None:
+        _remember(item_id, payload)
+    return payload
+
+# Function to drop cached payloads of items that are gone
+def forget(item_id):
+    global _cache_bytes
+    with _cache_lock:
+        payload = _cache.pop(item_id, None)
+        if payload is not None:
+            _cache_bytes -= _payload_size(payload)
+
+# Function to prepare payloads for pinned and recent items in the background
+def warm(history, recent=WARM_RECENT):
+    # Only items that need real work: images and large (blob) texts
+    costly = [x for x in history if x.get('type', 'text') == 'image' or x.get('blob')]
+    wanted = [x for x in costly if x.get('pinned', False)]
+    wanted += [x for x in costly if not x.get('pinned', False)][:recent]
+    wanted = [x for x in wanted if x.get('id') not in _cache]
+    if not wanted:
+        return
+
+    def run():
+        for item in wanted:
+            try:
+                _remember(item['id'], prepare(item))
+            except Exception as e:
+                print(f"Couldn't prepare {item.get('id')} for copying: {e}")
+
+    threading.Thread(target=run, daemon=True).start()
+
+# Function to turn a failed win32clipboard call (e.g. another program has the clipboard open) into our error
+def _windows_error(e):
+    return ClipboardWriteError(f"couldn't write to the clipboard ({e.strerror or e})")
+
+def _copy_png_windows(png, dib):
+    import pywintypes
+    import win32clipboard
+    try:
+        png_format = win32clipboard.RegisterClipboardFormat("PNG")
+        win32clipboard.OpenClipboard()
+        try:
+            win32clipboard.EmptyClipboard()
+            win32clipboard.SetClipboardData(png_format, png)
+            if dib:
+                win32clipboard.SetClipboardData(win32clipboard.CF_DIB, dib)
+        finally:
+            win32clipboard.CloseClipboard()
+    except pywintypes.error as e:
+        raise _windows_error(e)
+
+def _copy_linux(data, mime_type):
+    if os.environ.get('WAYLAND_DISPLAY'):
+        command = ['wl-copy', '--type', mime_type]
+    else:
+        command = ['xclip', '-selection', 'clipboard', '-target', mime_type, '-in']
+    # Both fork into the background to serve the clipboard once they've read stdin, and the
+    # fork inherits our handles: a pipe for stderr would stay open until the next copy
+    with tempfile.TemporaryFile() as errors:
+        try:
+            subprocess.run(command, input=data, check=True, timeout=5, stdout=subprocess.DEVNULL, stderr=errors)
+        except FileNotFoundError:
+            raise ClipboardWriteError(f"{command[0]} is needed to copy images and formats, please install it")
+        except subprocess.TimeoutExpired:
+            raise ClipboardWriteError(f"{command[0]} didn't respond")
+        except subprocess.CalledProcessError:
+            errors.seek(0)
+            raise ClipboardWriteError(errors.read().decode(errors='replace').strip() or f"{command[0]} failed")
+
+def _copy_png_mac(png):
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as file:
+        file.write(png)
+    try:
+        script = f'set the clipboard to (read (POSIX file "{file.name}") as «class PNGf»)'
+        subprocess.run(['osascript', '-e', script], check=True, timeout=5, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        raise ClipboardWriteError(e.stderr.decode(errors='replace').strip() or "osascript failed")
+    except subprocess.TimeoutExpired:
+        raise ClipboardWriteError("osascript didn't respond")
+    finally:
+        os.remove(file.name)
+
+# Function to put PNG bytes on the clipboard
+def copy_png(png, dib=None):
+    if sys.platform == 'win32':
+        _copy_png_windows(png, dib if dib is not None else png_to_dib(png))
+    elif sys.platform == 'darwin':
+        _copy_png_mac(png)
+    else:
+        _copy_linux(png, 'image/png')
+
+# Function to copy a history item back to the clipboard
+def copy_item(item):
+    """Return the payload that was written"""
+    payload = payload_for(item)
+    start = time.perf_counter()
+    if payload['kind'] == 'image':
+        copy_png(payload['png'], payload.get('dib'))
+    else:
+        pyperclip.copy(payload['text'])
+    stats['copies'] += 1
+    stats['write_seconds'] += time.perf_counter() - start
+    return payload
+
+# Function to wrap HTML in the header Windows' "HTML Format" needs (byte offsets of the page and fragment)
+def cf_html(html):
+    if '<!--StartFragment-->' not in html:
+        html = f"<html><body><!--StartFragment-->{html}<!--EndFragment--></body></html>"
+    header = ("Version:0.9\r\nStartHTML:{:010d}\r\nEndHTML:{:010d}\r\n"
+              "StartFragment:{:010d}\r\nEndFragment:{:010d}\r\n")
+    offset = len(header.format(0, 0, 0, 0))
+    body = html.encode('utf-8')
+    start = offset + body.index(b'<!--StartFragment-->') + len(b'<!--StartFragment-->')
+    end = offset + body.index(b'<!--EndFragment-->')
+    return header.format(offset, offset + len(body), start, end).encode('ascii') + body
+
+# Function to build a CF_HDROP (a DROPFILES header, then NUL-separated wide paths)
+def drop_files(paths):
+    return struct.pack('<IiiII', 20, 0, 0, 0, 1) + ("\0".join(paths) + "\0\0").encode('utf-16-le')
+
+def _copy_format_windows(name, data, plain):
+    import pywintypes
+    import win32clipboard
+    try:
+        win32clipboard.OpenClipboard()
+        try:
+            win32clipboard.EmptyClipboard()
+            if name == 'html':
+                win32clipboard.SetClipboardData(win32clipboard.RegisterClipboardFormat("HTML Format"), cf_html(data))
+            elif name == 'rtf':
+                win32clipboard.SetClipboardData(win32clipboard.RegisterClipboardFormat("Rich Text Format"),
+                                                data.encode('latin-1', errors='replace'))
+            else:
+                win32clipboard.SetClipboardData(win32clipboard.CF_HDROP, drop_files(data.splitlines()))
+            # Plain text too, for apps that don't take the rich format
+            if plain:
+                win32clipboard.SetClipboardText(plain, win32clipboard.CF_UNICODETEXT)
+        finally:
+            win32clipboard.CloseClipboard()
+    except pywintypes.error as e:
+        raise _windows_error(e)
+
+def _copy_format_mac(name, data):
+    if name == 'files':
+        paths = [path.replace('\\', '\\\\').replace('"', '\\"') for path in data.splitlines()]
+        script = "set the clipboard to {" + ", ".join(f'POSIX file "{path}"' for path in paths) + "}"
+    else:
+        code = 'HTML' if name == 'html' else 'RTF '
+        raw = data.encode('utf-8' if name == 'html' else 'latin-1', errors='replace')
+        script = f"set the clipboard to «data {code}{raw.hex().upper()}»"
+    try:
+        subprocess.run(['osascript', '-e', script], check=True, timeout=5, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        raise ClipboardWriteError(e.stderr.decode(errors='replace').strip() or "osascript failed")
+    except subprocess.TimeoutExpired:
+        raise ClipboardWriteError("osascript didn't respond")
+
+# Function to copy one of an item's rich formats back to the clipboard
+def copy_format(item, name):
+    """name is 'html', 'rtf' or 'files'; returns the plain text that went with it"""
+    digest = item.get('formats', {}).get(name)
+    if digest is None:
+        raise ClipboardWriteError(f"this item has no {FORMAT_LABELS.get(name, name)} version")
+    data = blob_store.read_text(digest)
+    plain = history_core.item_text(item) if item.get('type', 'text') == 'text' else ""
+    start = time.perf_counter()
+    if sys.platform == 'win32':
+        _copy_format_windows(name, data, plain)
+    elif sys.platform == 'darwin':
+        _copy_format_mac(name, data)
+    elif name == 'files':
+        uris = "\r\n".join(Path(path).as_uri() for path in data.splitlines() if path)
+        _copy_linux(uris.encode('utf-8'), LINUX_FORMAT_TYPES[name])
+    else:
+        _copy_linux(data.encode('utf-8' if name == 'html' else 'latin-1', errors='replace'),
+                    LINUX_FORMAT_TYPES[name])
+    stats['copies'] += 1
+    stats['write_seconds'] += time.perf_counter() - start
+    return plain
@@ -0,0 +1,153 @@
+# Headless capture daemon.
+#
+# Runs only the capture -> dedupe -> OCR -> save pipeline, with no Tk window,
+# tray icon or hotkey. Start it with:
+#
+#     python clipboard_manager.py --daemon
+#
+# While it runs it owns clipboard_history.json and serves the IPC API; a window
+# opened at the same time attaches to the daemon's history and sends its edits
+# through the API instead of capturing and writing on its own.
+import json
+import signal
+import sys
+import threading
+import capture
+import classify
+import clipboard_backend
+import clipboard_trace
+import history_core
+import ipc_server
+import maintenance
+import ocr_backfill
+import persistence
+import poll_scheduler
+import profiling
+
+stop_event = threading.Event()
+
+# The history is shared between the capture loop and IPC threads
+history = []
+history_lock = threading.Lock()
+
+def request_stop(*args):
+    stop_event.set()
+
+def snapshot():
+    with history_lock:
+        return list(history)
+
+def pin_item(item_id, pinned):
+    with history_lock:
+        item = history_core.find_item(history, item_id)
+        if item is None:
+            return False
+        item['pinned'] = pinned
+        history_core.schedule_history_save(history)
+    return True
+
+def delete_item(item_id):
+    global history
+    with history_lock:
+        item = history_core.find_item(history, item_id)
+        if item is None:
+            return False
+        history = [x for x in history if x is not item]
+        history_core.schedule_history_save(history)
+    return True
+
+def batch(item_ids, action):
+    global history
+    with history_lock:
+        history, changed = history_core.apply_batch(history, item_ids, action)
+        if changed:
+            history_core.schedule_history_save(history)
+    return len(changed)
+
+def clear():
+    global history
+    with history_lock:
+        history = []
+        history_core.schedule_history_save(history)
+
+# Called from the maintenance thread with the changes it planned on a snapshot
+def apply_maintenance(result):
+    global history
+    with history_lock:
+        history, report, changed = maintenance.apply(result, history)
+        if changed:
+            history_core.schedule_history_save(history)
+    return report
+
+# Called from the OCR re-index thread with a batch of (item id, text)
+def apply_reindexed(results):
+    with history_lock:
+        if ocr_backfill.apply_results(history, results):
+            history_core.schedule_history_save(history)
+
+def reindex(action, force, use_gate):
+    return ocr_backfill.handle(action, snapshot, apply_reindexed, force, use_gate)
+
+# Called from the classifier thread once items have their kind
+def items_classified(items):
+    with history_lock:
+        history_core.schedule_history_save(history)
+
+def run(max_history=history_core.MAX_HISTORY):
+    global history
+    if not history_core.acquire_writer_lock('daemon'):
+        owner = history_core.read_writer_lock() or {}
+        print(f"History is already owned by {owner.get('role', 'another process')} "
+              f"(pid {owner.get('pid', '?')}), not starting the daemon")
+        return 1
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    try:
+        with open("window_settings.json", "r") as file:
+            capture.configure(json.load(file))
+    except (FileNotFoundError, ValueError):
+        pass
+
+    history = history_core.load_history_file()
+    state = capture.new_capture_state(history, clipboard_trace.from_argv(clipboard_backend.create(), sys.argv))
+    state['on_classified'] = items_classified
+    # Called from the capture loop (which holds the lock) once rich formats were stored
+    state['on_formats'] = lambda item: history_core.schedule_history_save(history)
+    unclassified = [item for item in history if 'kind' not in item]
+    if unclassified:
+        classify.submit(unclassified, items_classified)
+    # Poll quickly right after a capture, slow down once the clipboard goes quiet
+    scheduler = poll_scheduler.new_scheduler()
+    ipc_server.start({'snapshot': snapshot, 'pin': pin_item, 'delete': delete_item, 'batch': batch, 'clear': clear,
+                      'stats': lambda: {'persistence': persistence.write_stats(),
+                                        'polling': poll_scheduler.stats(scheduler),
+                                        'profiling': profiling.status(),
+                                        'maintenance': maintenance.last_report(),
+                                        'reindex': ocr_backfill.status()},
+                      'profile': profiling.handle, 'reindex': reindex})
+    print(f"Capture daemon running ({len(history)} items in history)")
+
+    try:
+        while not stop_event.is_set():
+            with history_lock:
+                history, item = capture.poll_clipboard(state, history, max_history)
+                if item:
+                    history_core.schedule_history_save(history)
+            if item:
+                ipc_server.publish_capture(item)
+            elif maintenance.due(poll_scheduler.idle_seconds(scheduler)):
+                maintenance.start(snapshot(), apply_maintenance)
+            stop_event.wait(poll_scheduler.next_interval(scheduler, captured=item is not None))
+    finally:
+        ipc_server.stop()
+        with history_lock:
+            history_core.schedule_history_save(history)
+        persistence.flush()
+        history_core.release_writer_lock()
+        print("Capture daemon stopped")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(run())
@@ -0,0 +1,194 @@
+# Fuzzy, ranked search over the clipboard history.
+#
+# Matches the query as a subsequence of an item's text (or an image's OCR text),
+# tolerating one dropped character for longer queries. Exact substrings score
+# best, then tight subsequence spans and matches at word starts. The score is
+# weighted by recency and pin state and only the top k results are kept with a
+# bounded heap.
+#
+# The per-item work is kept to C-level string operations: a 64-bit character
+# mask rejects most non-matches, and str.find / str.rfind (one call per query
+# character) locate substrings and subsequence spans in linear time.
+#
+# Searches over the same history share an index: every item's key, mask and
+# timestamp in parallel lists, newest first. A query picks its candidates with
+# one pass over the masks, then scores them newest first and stops once no
+# older item could reach the top k even with a perfect match, so a common
+# query touches a few hundred items instead of the whole history. Queries that
+# match little but scatter over long texts still score every candidate, which
+# is why the window runs searches off the Tk thread.
+import heapq
+import time
+import history_core
+
+TOP_K = 50
+# Queries at least this long may skip one character (typo tolerance)
+TYPO_MIN_QUERY = 4
+TYPO_PENALTY = 0.6
+PIN_BONUS = 0.25
+RECENCY_WEIGHT = 0.5
+RECENCY_HALF_LIFE = 24 * 3600  # seconds
+WORD_BOUNDARY = set(" \t\n/\\_-.:,;()[]{}'\"")
+
+# item id -> (lowercase key, character mask)
+_mask_cache = {}
+# The index of the last history searched (see history_index)
+_index = {'history': None, 'length': -1, 'version': -1}
+# Best possible match score (an exact substring at the very start)
+MAX_SCORE = 2.0
+
+item_source_text = history_core.item_source_text
+
+# Function to turn a string into a 64-bit mask of the characters it contains
+def char_mask(text):
+    mask = 0
+    for ch in set(text):
+        mask |= 1 << (ord(ch) & 63)
+    return mask
+
+# Function to get the normalized key (cached by history_core) and character mask of an item
+def search_key(item):
+    key = history_core.search_key(item)
+    item_id = item.get('id')
+    cached = _mask_cache.get(item_id) if item_id is not None else None
+    if cached is not None and cached[0] is key:
+        return key, cached[1]
+    mask = char_mask(key)
+    if item_id is not None:
+        _mask_cache[item_id] = (key, mask)
+    return key, mask
+
+def forget_item(item):
+    _mask_cache.pop(item.get('id'), None)
+
+# Function to find the tightest-ending span of query as a subsequence of key
+def subsequence_span(query, key):
+    """Return (start, end) of the match, or None. Linear in len(key): a forward
+    pass finds where the first full match ends, a backward pass from there finds
+    the latest start, which keeps the span tight."""
+    find = key.find
+    pos = -1
+    for ch in query:
+        pos = find(ch, pos + 1)
+        if pos < 0:
+            return None
+    end = pos
+    rfind = key.rfind
+    for ch in reversed(query[:-1]):
+        pos = rfind(ch, 0, pos)
+    return pos, end
+
+# Function to compile everything needed to score one query
+def prepare_query(query):
+    prepared = {'query': query, 'mask': char_mask(query), 'typo_variants': {}}
+    if len(query) >= TYPO_MIN_QUERY:
+        # The query with one character dropped, grouped by the dropped character's bit
+        for skip in range(len(query)):
+            bit = 1 << (ord(query[skip]) & 63)
+            prepared['typo_variants'].setdefault(bit, []).append(query[:skip] + query[skip + 1:])
+    return prepared
+
+# Function to score a subsequence match: tight spans and matches at word starts are best
+def span_score(key, span, length):
+    start, end = span
+    score = length / (end - start + 1)
+    if start == 0 or key[start - 1] in WORD_BOUNDARY:
+        score += 0.25
+    return score * 0.7  # always below an exact substring match
+
+# Function to score one key against a prepared query (0 means no match)
+def match_score(prepared, key, key_mask):
+    query = prepared['query']
+    missing = prepared['mask'] & ~key_mask
+    if not missing:
+        substring_at = key.find(query)
+        if substring_at >= 0:
+            # Exact substring: best score, a little better near the start
+            return 1.0 + 1.0 / (1 + substring_at / 100)
+        span = subsequence_span(query, key)
+        if span:
+            return span_score(key, span, len(query))
+        candidates = [v for variants in prepared['typo_variants'].values() for v in variants]
+    elif missing & (missing - 1):
+        # More than one distinct character of the query never appears in the text
+        return 0.0
+    else:
+        # Exactly one character is missing: only dropping that one can help
+        candidates = prepared['typo_variants'].get(missing, [])
+        if len(candidates) != 1:
+            return 0.0
+
+    best = 0.0
+    for variant in candidates:
+        span = subsequence_span(variant, key)
+        if span:
+            best = max(best, span_score(key, span, len(variant)))
+    return best * TYPO_PENALTY
+
+# Function to weight a match by how recent and whether pinned the item is
+def rank(item, score, now):
+    age = max(0.0, now - item.get('timestamp', 0))
+    recency = 0.5 ** (age / RECENCY_HALF_LIFE)
+    weighted = score * (1 + RECENCY_WEIGHT * recency)
+    if item.get('pinned', False):
+        weighted += PIN_BONUS
+    return weighted
+
+# Function to get the highest rank an item of this age could reach
+def best_rank(timestamp, now):
+    recency = 0.5 ** (max(0.0, now - timestamp) / RECENCY_HALF_LIFE)
+    return MAX_SCORE * (1 + RECENCY_WEIGHT * recency) + PIN_BONUS
+
+# Function to get the search index of a history (rebuilt only when it changed)
+def history_index(history):
+    global _index
+    index = _index
+    if (index['history'] is history and index['length'] == len(history)
+            and index['version'] == history_core.views_version):
+        return index
+    order = sorted(range(len(history)), key=lambda position: -history[position].get('timestamp', 0))
+    keys_and_masks = [search_key(history[position]) for position in order]
+    _index = {
+        'history': history,
+        'length': len(history),
+        # Read after the keys: building them may have refreshed some views
+        'version': history_core.views_version,
+        'order': order,
+        'keys': [key for key, _ in keys_and_masks],
+        'masks': [mask for _, mask in keys_and_masks],
+        'timestamps': [history[position].get('timestamp', 0) for position in order]
+    }
+    return _index
+
+# Function to get the best k matches for a query, best first
+def fuzzy_search(history, query, k=TOP_K, now=None):
+    query = query.lower().strip()
+    if not query or k <= 0:
+        return []
+    now = time.time() if now is None else now
+    prepared = prepare_query(query)
+    index = history_index(history)
+    order, keys, masks, timestamps = index['order'], index['keys'], index['masks'], index['timestamps']
+
+    # All rows at once: which query characters may be missing (none, or the one a typo variant drops)
+    allowed = {0} | {bit for bit, variants in prepared['typo_variants'].items() if len(variants) == 1}
+    query_mask = prepared['mask']
+    candidates = [row for row, mask in enumerate(masks) if query_mask & ~mask in allowed]
+
+    heap = []  # min-heap of (rank, order, item), never more than k entries
+    for row in candidates:
+        # Newest first: once even a perfect match can't make the top k, no older item can
+        if len(heap) == k and best_rank(timestamps[row], now) < heap[0][0]:
+            break
+        score = match_score(prepared, keys[row], masks[row])
+        if not score:
+            continue
+        item = history[order[row]]
+        entry = (rank(item, score, now), -order[row], item)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+
+    heap.sort(key=lambda entry: entry[:2], reverse=True)
+    return [item for _, _, item in heap]
@@ -0,0 +1,437 @@
+# GUI-free clipboard history operations.
+#
+# Everything in here works on plain lists of item dicts (the same shape that is
+# stored in clipboard_history.json), so it can be driven by the Tk window, the
+# benchmarks or any other front end without needing a display.
+import hashlib
+import json
+import os
+import sys
+import uuid
+from datetime import datetime
+import persistence
+import blob_store
+
+HISTORY_FILE = "clipboard_history.json"
+# Only the process holding this lock may write the history file
+WRITER_LOCK_FILE = "clipboard_history.lock"
+MAX_HISTORY = 25
+# Large text items keep only this much text inline (the rest lives in blob_store)
+PREVIEW_CHARS = 2000
+# Only this much of the text is looked at when building a list row
+DISPLAY_SCAN_CHARS = 200
+# Damaged files and records are moved here instead of being thrown away
+QUARANTINE_DIR = "quarantine"
+
+# Function to create a stable id for an item (used by the IPC API)
+def new_item_id():
+    return uuid.uuid4().hex[:16]
+
+# Function to give ids to items saved before items had them
+def ensure_ids(history):
+    for item in history:
+        if 'id' not in item:
+            item['id'] = new_item_id()
+    return history
+
+# Function to find an item by its id
+def find_item(history, item_id):
+    for item in history:
+        if item.get('id') == item_id:
+            return item
+    return None
+
+# Function to build a new text item
+def make_text_item(text, timestamp=None):
+    return {
+        'id': new_item_id(),
+        'type': 'text',
+        'text': text,
+        'timestamp': timestamp if timestamp is not None else datetime.now().timestamp(),
+        'pinned': False
+    }
+
+# Function to build a text item whose full text is stored out of line
+def make_large_text_item(text, digest, timestamp=None):
+    item = make_text_item(text[:PREVIEW_CHARS], timestamp)
+    item['blob'] = digest
+    item['size'] = len(text)
+    return item
+
+# Function to get the full text of a text item (reads the blob for large ones)
+def item_text(item):
+    if item.get('blob'):
+        return blob_store.read_text(item['blob'])
+    return item.get('text', '')
+
+# Function to list the blobs an item refers to (its full text and any rich formats)
+def item_blobs(item):
+    digests = list(item.get('formats', {}).values())
+    if item.get('blob'):
+        digests.append(item['blob'])
+    return digests
+
+# Function to build a new image item
+def make_image_item(image_data, ocr_text="", timestamp=None):
+    return {
+        'id': new_item_id(),
+        'type': 'image',
+        'image_data': image_data,
+        'ocr_text': ocr_text,
+        'timestamp': timestamp if timestamp is not None else datetime.now().timestamp(),
+        'pinned': False
+    }
+
+# Function to identify an item by its content (sha256), independent of id and timestamp
+def content_hash(item):
+    if item.get('type', 'text') == 'image':
+        return hashlib.sha256(item.get('image_data', '').encode('ascii')).hexdigest()
+    if item.get('blob'):
+        return item['blob']
+    return blob_store.text_digest(item.get('text', ''))
+
+# Function to check if a text is already in the history
+def is_duplicate_text(history, text):
+    for item in history:
+        if item.get('type', 'text') == 'text' and item.get('text') == text:
+            return True
+    return False
+
+# Function to check if a large text (by digest) is already in the history
+def is_duplicate_blob(history, digest):
+    for item in history:
+        if item.get('blob') == digest:
+            return True
+    return False
+
+# Function to keep all pinned items and only the newest unpinned ones
+def trim_history(history, max_history=MAX_HISTORY):
+    pinned = [x for x in history if x.get('pinned', False)]
+    unpinned = [x for x in history if not x.get('pinned', False)]
+    return pinned + unpinned[:max_history]
+
+# Function to add a captured item to the front of the history
+def add_item(history, item, max_history=MAX_HISTORY):
+    """Insert item as the newest entry and return the trimmed history"""
+    item.setdefault('checksum', content_hash(item))
+    history.insert(0, item)
+    _item_view(item)
+    history_changed()
+    return trim_history(history, max_history)
+
+# Function to merge items (e.g. from an archive) into a history by timestamp
+def merge_items(history, items, max_history=MAX_HISTORY):
+    merged = sorted(history + list(items), key=lambda x: -x.get('timestamp', 0))
+    for item in items:
+        item.setdefault('checksum', content_hash(item))
+        _item_view(item)
+    history_changed()
+    return trim_history(merged, max_history)
+
+BATCH_ACTIONS = ('delete', 'pin', 'unpin')
+
+# Function to delete, pin or unpin many items in one go
+def apply_batch(history, item_ids, action):
+    """Return (history, changed items); the caller saves and redraws once for the whole batch"""
+    if action not in BATCH_ACTIONS:
+        raise ValueError(f"unknown batch action {action!r}")
+    wanted = set(item_ids)
+    if action == 'delete':
+        changed = [item for item in history if item.get('id') in wanted]
+        if changed:
+            history = [item for item in history if item.get('id') not in wanted]
+            for item in changed:
+                invalidate_item(item)
+            history_changed()
+        return history, changed
+    pinned = action == 'pin'
+    changed = [item for item in history
+               if item.get('id') in wanted and item.get('pinned', False) != pinned]
+    for item in changed:
+        item['pinned'] = pinned
+    return history, changed
+
+# Sort key: pinned items first, then by timestamp (newest first)
+def sort_key(item):
+    return (not item.get('pinned', False), -item.get('timestamp', 0))
+
+def sorted_history(history):
+    return sorted(history, key=sort_key)
+
+# Function to check if an item passes the search filter
+def matches_search(item, search_term):
+    """search_term must already be lowercase; images are never filtered out"""
+    if not search_term or item.get('type', 'text') != 'text':
+        return True
+    return search_term in search_key(item)
+
+# Bumped by everything that adds, removes or re-kinds items (see history_changed)
+history_version = 0
+# kind -> items of that kind, for the history list and version it was built from (see kind_index)
+_kind_index = {'history': None, 'version': -1, 'kinds': {}}
+
+# Function to note that a history's items changed, so indexes over it get rebuilt
+def history_changed():
+    global history_version
+    history_version += 1
+
+# Function to get the items of each content kind (item['kind'], set by classify)
+def kind_index(history):
+    # The list itself is kept (not its id, which a new list can reuse once the old one is
+    # gone); a different list or a changed version means rebuilding
+    if _kind_index['history'] is not history or _kind_index['version'] != history_version:
+        kinds = {}
+        for item in history:
+            kinds.setdefault(item.get('kind'), []).append(item)
+        _kind_index.update(history=history, version=history_version, kinds=kinds)
+    return _kind_index['kinds']
+
+# Function to rebuild the kind index next time (after items got their kind)
+def invalidate_kinds():
+    history_changed()
+
+# Function to get the items in the order they are shown in the list
+def visible_items(history, search_term="", kind=None):
+    """kind limits the list to one content kind ('url', 'code', ..., see classify.KINDS)"""
+    if kind is not None:
+        history = kind_index(history).get(kind, [])
+    return [item for item in sorted_history(history) if matches_search(item, search_term)]
+
+# Function to build the text of one list row
+def format_display_line(item):
+    if item.get('type', 'text') == 'image':
+        ocr_text = item.get('ocr_text', '')
+        if ocr_text:
+            display_text = f"[IMAGE: {ocr_text[:25]}...]"
+        else:
+            display_text = "[IMAGE]"
+    else:
+        display_text = item['text'][:DISPLAY_SCAN_CHARS].replace('\n', ' ').replace('\r', '')
+
+    # Add pin indicator and timestamp
+    pin_indicator = "📌 " if item.get('pinned', False) else ""
+    time_str = datetime.fromtimestamp(item['timestamp']).strftime("%H:%M:%S")
+    display_line = f"{pin_indicator}[{time_str}] {display_text}"
+
+    # Truncate to 50 characters total
+    if len(display_line) > 50:
+        display_line = display_line[:50] + "..."
+    return display_line
+
+# Per-item view cache: item id -> (pinned, source text, display line, search key).
+# Built once when an item is captured or loaded; an entry is rebuilt only when
+# the item's pin state changes or its text/OCR text is replaced.
+_view_cache = {}
+# Bumped whenever a cached view is built or dropped, so search indexes know when to rebuild
+views_version = 0
+
+# Function to get the text an item is displayed and searched by
+def item_source_text(item):
+    if item.get('type', 'text') == 'image':
+        return item.get('ocr_text', '')
+    return item.get('text', '')
+
+def _item_view(item):
+    global views_version
+    pinned = item.get('pinned', False)
+    source = item_source_text(item)
+    item_id = item.get('id')
+    cached = _view_cache.get(item_id)
+    if cached is not None and cached[0] == pinned and cached[1] is source:
+        return cached
+    view = (pinned, source, format_display_line(item), source.lower())
+    if item_id is not None:
+        _view_cache[item_id] = view
+        views_version += 1
+    return view
+
+# Function to get the cached list row of an item
+def display_line(item):
+    return _item_view(item)[2]
+
+# Function to get the cached lowercase text used by search
+def search_key(item):
+    return _item_view(item)[3]
+
+# Function to drop an item's cached row and key (call after editing it in place)
+def invalidate_item(item):
+    global views_version
+    _view_cache.pop(item.get('id'), None)
+    views_version += 1
+
+# Function to build the cached rows for a whole history (e.g. right after loading)
+def prime_views(history):
+    for item in history:
+        _item_view(item)
+    # Forget items that are gone once the cache has grown well past the history
+    if len(_view_cache) > 2 * len(history) + 100:
+        live = {item.get('id') for item in history}
+        for item_id in [x for x in _view_cache if x not in live]:
+            del _view_cache[item_id]
+
+# Function to map a row of the (sorted, filtered) list back to the history
+def get_actual_index(history, display_index, search_term=""):
+    """Return the position in history of the item shown at display_index, or None"""
+    current_display = 0
+    for item in sorted_history(history):
+        if not matches_search(item, search_term):
+            continue
+        if current_display == display_index:
+            return index_of(history, item)
+        current_display += 1
+    return None
+
+# Function to find the position of this exact item object in the history
+def index_of(history, item):
+    for idx, candidate in enumerate(history):
+        if candidate is item:
+            return idx
+    return None
+
+# Function to save history to a file right away (atomically)
+def save_history_file(history, path=HISTORY_FILE):
+    persistence.atomic_write_json(path, history)
+
+# Function to queue a save on the background writer
+def schedule_history_save(history, path=HISTORY_FILE):
+    persistence.schedule_write(path, history)
+
+# Function to check that an item has the fields and types the app relies on
+def item_problem(item, verify_checksum=False):
+    """Return a description of what's wrong with item, or None if it's usable"""
+    if not isinstance(item, dict):
+        return "not an object"
+    item_type = item.get('type', 'text')
+    if item_type == 'text':
+        if not isinstance(item.get('text'), str):
+            return "text item without text"
+    elif item_type == 'image':
+        if not isinstance(item.get('image_data'), str) or not item['image_data']:
+            return "image item without image data"
+    else:
+        return f"unknown item type {item_type!r}"
+    if not isinstance(item.get('timestamp', 0), (int, float)):
+        return "bad timestamp"
+    if verify_checksum and 'checksum' in item and content_hash(item) != item['checksum']:
+        return "checksum mismatch"
+    return None
+
+# Function to keep a copy of something damaged in the quarantine folder
+def quarantine(name, text):
+    os.makedirs(QUARANTINE_DIR, exist_ok=True)
+    path = os.path.join(QUARANTINE_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{name}")
+    with open(path, "w", encoding="utf-8", errors="surrogatepass") as file:
+        file.write(text)
+    return path
+
+# Function to recover the readable items from a damaged history file
+def salvage_items(raw):
+    """Decode array elements one by one and stop at the first broken one"""
+    decoder = json.JSONDecoder()
+    items = []
+    position = raw.find('[') + 1
+    if position == 0:
+        return items
+    while True:
+        while position < len(raw) and raw[position] in ' \t\r\n,':
+            position += 1
+        if position >= len(raw) or raw[position] == ']':
+            return items
+        try:
+            item, position = decoder.raw_decode(raw, position)
+        except ValueError:
+            return items
+        items.append(item)
+
+# Function to load history from a file (missing file means empty history)
+def load_history_file(path=HISTORY_FILE):
+    """Damaged files and records are quarantined; whatever can be read is returned"""
+    try:
+        with open(path, "r") as file:
+            raw = file.read()
+    except FileNotFoundError:
+        return []
+    try:
+        records = json.loads(raw)
+        if not isinstance(records, list):
+            raise ValueError("history is not a list")
+    except ValueError as e:
+        records = salvage_items(raw)
+        saved = quarantine(os.path.basename(path), raw)
+        print(f"{path} is damaged ({e}); recovered {len(records)} items, original kept in {saved}")
+
+    history = []
+    bad = []
+    for record in records:
+        problem = item_problem(record)
+        if problem:
+            bad.append({'problem': problem, 'record': record})
+        else:
+            history.append(record)
+    if bad:
+        saved = quarantine("bad-items.json", json.dumps(bad))
+        print(f"Quarantined {len(bad)} damaged history items in {saved}")
+    history_changed()
+
+    ensure_ids(history)
+    prime_views(history)
+    return history
+
+# Function to check if a process is still running
+def pid_alive(pid):
+    if sys.platform == 'win32':
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        handle = ctypes.windll.kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return exit_code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# Function to see who owns the history file (None if nobody does)
+def read_writer_lock(path=WRITER_LOCK_FILE):
+    try:
+        with open(path, "r") as file:
+            owner = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+    pid = owner.get('pid')
+    if not isinstance(pid, int) or pid <= 0 or not pid_alive(pid):
+        return None
+    return owner
+
+# Function to become the only writer of the history file
+def acquire_writer_lock(role, path=WRITER_LOCK_FILE):
+    """Return True if this process now owns the history, False if another live process does"""
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            owner = read_writer_lock(path)
+            if owner is not None and owner.get('pid') != os.getpid():
+                return False
+            # Stale lock from a process that died (or our own), take it over
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, "w") as file:
+            json.dump({'pid': os.getpid(), 'role': role}, file)
+        return True
+    return False
+
+# Function to give up ownership of the history file
+def release_writer_lock(path=WRITER_LOCK_FILE):
+    owner = read_writer_lock(path)
+    if owner is not None and owner.get('pid') == os.getpid():
+        os.remove(path)
@@ -0,0 +1,141 @@
+# Client for the local query API served by the window or the daemon.
+#
+# Usable as a library:
+#
+#     with ipc_client.connect() as client:
+#         recent = client.request('list', limit=10)
+#
+# or from the command line:
+#
+#     python ipc_client.py list --limit 10
+#     python ipc_client.py list --kind url
+#     python ipc_client.py search "def main"
+#     python ipc_client.py get <id>
+#     python ipc_client.py pin <id>   /  unpin <id>  /  delete <id>
+#     python ipc_client.py delete <id> <id> ...   (one save for the whole batch)
+#     python ipc_client.py watch
+#     python ipc_client.py stats
+#     python ipc_client.py profile start --mode sample   /  snapshot  /  stop
+#     python ipc_client.py reindex start --force   /  status  /  stop
+import argparse
+import json
+import os
+import socket
+import ipc_server
+
+class ClientError(Exception):
+    pass
+
+class Client:
+    def __init__(self, sock):
+        self.sock = sock
+        self.next_id = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.sock.close()
+
+    def request(self, op, **args):
+        message = dict(args, op=op, id=self.next_id)
+        self.next_id += 1
+        ipc_server.send_frame(self.sock, message)
+        reply = ipc_server.recv_frame(self.sock)
+        if reply is None:
+            raise ClientError("connection closed by server")
+        if not reply.get('ok'):
+            raise ClientError(reply.get('error', 'request failed'))
+        return reply.get('result')
+
+    def subscribe(self):
+        """Yield capture events until the server goes away"""
+        self.request('subscribe')
+        while True:
+            event = ipc_server.recv_frame(self.sock)
+            if event is None:
+                return
+            if event.get('event') != 'ping':
+                yield event
+
+# Function to connect to whichever process owns the history
+def connect(timeout=5.0):
+    if ipc_server.UnixServer is not None and os.path.exists(ipc_server.SOCKET_FILE):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(ipc_server.SOCKET_FILE)
+        sock.settimeout(None)
+        return Client(sock)
+
+    try:
+        with open(ipc_server.PORT_FILE, "r") as file:
+            info = json.load(file)
+    except FileNotFoundError:
+        raise ClientError("the clipboard manager is not running") from None
+    sock = socket.create_connection(("127.0.0.1", info['port']), timeout=timeout)
+    sock.settimeout(None)
+    client = Client(sock)
+    client.request('auth', token=info['token'])
+    return client
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the running clipboard manager")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("list", "search"):
+        cmd = sub.add_parser(name)
+        if name == "search":
+            cmd.add_argument("query")
+        else:
+            cmd.add_argument("--kind", help="only url, email, color, path, json, code, text or image items")
+        cmd.add_argument("--offset", type=int, default=0)
+        cmd.add_argument("--limit", type=int, default=20)
+    sub.add_parser("get").add_argument("item_id")
+    for name in ("pin", "unpin", "delete"):
+        sub.add_parser(name).add_argument("item_ids", nargs="+")
+    sub.add_parser("clear")
+    sub.add_parser("stats")
+    sub.add_parser("watch")
+    profile = sub.add_parser("profile", help="profile the running app; reports go to its profiles/ folder")
+    profile.add_argument("action", choices=("start", "stop", "snapshot", "status"))
+    profile.add_argument("--mode", choices=("sample", "cprofile", "none"), default="sample",
+                         help="CPU profiler (cprofile only works with the window, not the daemon)")
+    profile.add_argument("--no-memory", action="store_true", help="don't trace allocations")
+    reindex = sub.add_parser("reindex", help="run OCR again on image items (see ocr_backfill.py)")
+    reindex.add_argument("action", choices=("start", "stop", "status"))
+    reindex.add_argument("--force", action="store_true", help="also images that already have OCR text")
+    reindex.add_argument("--no-gate", action="store_true", help="run Tesseract even on images that look text-free")
+    args = parser.parse_args()
+
+    with connect() as client:
+        if args.command == "list":
+            result = client.request('list', offset=args.offset, limit=args.limit, kind=args.kind)
+        elif args.command == "search":
+            result = client.request('search', query=args.query, offset=args.offset, limit=args.limit)
+        elif args.command in ("pin", "unpin", "delete") and len(args.item_ids) > 1:
+            result = client.request('batch', item_ids=args.item_ids, action=args.command)
+        elif args.command in ("pin", "unpin"):
+            result = client.request('pin', item_id=args.item_ids[0], pinned=args.command == "pin")
+        elif args.command == "delete":
+            result = client.request('delete', item_id=args.item_ids[0])
+        elif args.command == "get":
+            result = client.request('get', item_id=args.item_id)
+        elif args.command in ("clear", "stats"):
+            result = client.request(args.command)
+        elif args.command == "profile":
+            result = client.request('profile', action=args.action, mode=args.mode, memory=not args.no_memory)
+        elif args.command == "reindex":
+            result = client.request('reindex', action=args.action, force=args.force, gate=not args.no_gate)
+        else:
+            for event in client.subscribe():
+                print(json.dumps(event), flush=True)
+            return
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    try:
+        main()
+    except (ClientError, OSError) as e:
+        raise SystemExit(f"Error: {e}")
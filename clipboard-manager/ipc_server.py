@@ -0,0 +1,287 @@
+# Local query API for scripts and editor plugins.
+#
+# Whoever owns the history (the window or the daemon) serves it on a Unix domain
+# socket, or on a loopback TCP port where Unix sockets aren't available (Windows).
+# Every message is one frame: a 4-byte big-endian length followed by UTF-8 JSON.
+#
+# Requests look like {"id": 1, "op": "list", "offset": 0, "limit": 20} and get
+# {"id": 1, "ok": true, "result": ...} back. Supported ops:
+#   list      offset, limit          -> recent items (pinned first), paged
+#   search    query, offset, limit   -> items whose text or OCR text contains query
+#   get       item_id                -> full item, including text / image_data
+#                                       (large texts are read back from blob_store)
+#   pin       item_id, pinned        -> set pin state
+#   delete    item_id                -> remove an item
+#   clear                            -> remove everything
+#   stats                            -> performance counters of the serving process
+#   subscribe                        -> turns the connection into a stream of
+#                                       {"event": "capture", "item": {...}} frames
+import json
+import os
+import queue
+import secrets
+import socket
+import socketserver
+import struct
+import threading
+import history_core
+
+SOCKET_FILE = "clipboard_manager.sock"
+# Written instead of the socket when we fall back to TCP: {"port": ..., "token": ...}
+PORT_FILE = "clipboard_manager.port"
+
+MAX_FRAME = 64 * 1024 * 1024
+MAX_PAGE = 500
+PREVIEW_CHARS = 200
+SUBSCRIBER_QUEUE = 1000
+HEARTBEAT_SECONDS = 30
+
+HEADER = struct.Struct(">I")
+
+def send_frame(sock, message):
+    data = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def recv_frame(sock):
+    """Return the next message, or None when the other side closed the connection"""
+    header = _recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    (size,) = HEADER.unpack(header)
+    if size > MAX_FRAME:
+        raise ValueError(f"frame of {size} bytes is too large")
+    data = _recv_exact(sock, size)
+    if data is None:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+# Function to build the short form of an item used in lists and events
+def summarize_item(item):
+    if item.get('type', 'text') == 'image':
+        preview = item.get('ocr_text', '')[:PREVIEW_CHARS]
+        size = len(item.get('image_data', ''))
+    else:
+        preview = item.get('text', '')[:PREVIEW_CHARS]
+        size = item.get('size', len(item.get('text', '')))
+    return {
+        'id': item.get('id'),
+        'type': item.get('type', 'text'),
+        'timestamp': item.get('timestamp'),
+        'pinned': item.get('pinned', False),
+        'kind': item.get('kind'),
+        'formats': sorted(item.get('formats', {})),
+        'preview': preview,
+        'size': size
+    }
+
+def matches_query(item, query):
+    if item.get('type', 'text') == 'image':
+        return query in item.get('ocr_text', '').lower()
+    return query in item.get('text', '').lower()
+
+def _page(items, message):
+    offset = max(0, int(message.get('offset', 0)))
+    limit = max(1, min(MAX_PAGE, int(message.get('limit', 50))))
+    page = items[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < len(items) else None
+    return {'items': [summarize_item(x) for x in page], 'total': len(items), 'next_offset': next_offset}
+
+# Function to answer one request
+def handle_request(host, message):
+    """host is a dict of callables supplied by the window or the daemon:
+    snapshot() -> list of items, pin(item_id, pinned) -> bool,
+    delete(item_id) -> bool, clear() -> None,
+    batch(item_ids, action) -> number of items changed, and optionally stats() -> dict,
+    profile(action, mode, memory) -> session status or report paths,
+    reindex(action, force, use_gate) -> OCR re-index status"""
+    op = message.get('op')
+    if op == 'list':
+        return _page(history_core.visible_items(host['snapshot'](), kind=message.get('kind')), message)
+    if op == 'search':
+        query = str(message.get('query', '')).lower()
+        items = [x for x in history_core.sorted_history(host['snapshot']()) if matches_query(x, query)]
+        return _page(items, message)
+    if op == 'get':
+        item = history_core.find_item(host['snapshot'](), message.get('item_id'))
+        if item is None:
+            raise ValueError(f"no item with id {message.get('item_id')!r}")
+        full = dict(item)
+        if full.get('blob'):
+            full['text'] = history_core.item_text(item)
+        return full
+    if op == 'pin':
+        if not host['pin'](message.get('item_id'), bool(message.get('pinned', True))):
+            raise ValueError(f"no item with id {message.get('item_id')!r}")
+        return True
+    if op == 'delete':
+        if not host['delete'](message.get('item_id')):
+            raise ValueError(f"no item with id {message.get('item_id')!r}")
+        return True
+    if op == 'batch':
+        item_ids = message.get('item_ids')
+        if not isinstance(item_ids, list):
+            raise ValueError("item_ids must be a list")
+        action = str(message.get('action'))
+        if action not in history_core.BATCH_ACTIONS:
+            raise ValueError(f"unknown batch action {action!r}")
+        return host['batch']([str(x) for x in item_ids], action)
+    if op == 'clear':
+        host['clear']()
+        return True
+    if op == 'stats':
+        return host['stats']() if 'stats' in host else {}
+    if op == 'profile':
+        if 'profile' not in host:
+            raise ValueError("profiling isn't available here")
+        return host['profile'](str(message.get('action', 'status')), message.get('mode', 'sample'),
+                               bool(message.get('memory', True)))
+    if op == 'reindex':
+        if 'reindex' not in host:
+            raise ValueError("OCR re-index isn't available here")
+        return host['reindex'](str(message.get('action', 'status')), bool(message.get('force', False)),
+                               bool(message.get('gate', True)))
+    raise ValueError(f"unknown op {op!r}")
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        authed = server.token is None
+        try:
+            while True:
+                message = recv_frame(self.request)
+                if message is None:
+                    return
+                reply = {'id': message.get('id')}
+
+                # TCP connections have to prove they can read our port file first
+                if not authed:
+                    if message.get('op') == 'auth' and secrets.compare_digest(
+                            str(message.get('token', '')), server.token):
+                        authed = True
+                        reply.update(ok=True, result=True)
+                        send_frame(self.request, reply)
+                        continue
+                    reply.update(ok=False, error="not authenticated")
+                    send_frame(self.request, reply)
+                    return
+
+                if message.get('op') == 'subscribe':
+                    reply.update(ok=True, result=True)
+                    send_frame(self.request, reply)
+                    self.stream_events()
+                    return
+
+                try:
+                    reply.update(ok=True, result=handle_request(server.host, message))
+                except Exception as e:
+                    reply.update(ok=False, error=str(e))
+                send_frame(self.request, reply)
+        except (OSError, ValueError):
+            # Client went away or sent garbage
+            return
+
+    def stream_events(self):
+        events = queue.Queue(SUBSCRIBER_QUEUE)
+        self.server.add_subscriber(events)
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    event = {'event': 'ping'}
+                if event is None:
+                    return
+                send_frame(self.request, event)
+        finally:
+            self.server.remove_subscriber(events)
+
+class _ServerMixin:
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def setup_api(self, host, token):
+        self.host = host
+        self.token = token
+        self.subscribers = set()
+        self.subscribers_lock = threading.Lock()
+
+    def add_subscriber(self, events):
+        with self.subscribers_lock:
+            self.subscribers.add(events)
+
+    def remove_subscriber(self, events):
+        with self.subscribers_lock:
+            self.subscribers.discard(events)
+
+    def publish(self, event):
+        with self.subscribers_lock:
+            subscribers = list(self.subscribers)
+        for events in subscribers:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                # Client stopped reading, drop it rather than buffering forever
+                self.remove_subscriber(events)
+
+if hasattr(socket, 'AF_UNIX') and hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class UnixServer(_ServerMixin, socketserver.ThreadingUnixStreamServer):
+        pass
+else:
+    UnixServer = None
+
+class TCPServer(_ServerMixin, socketserver.ThreadingTCPServer):
+    pass
+
+# The running server, if any
+server = None
+
+# Function to start serving the history in a background thread
+def start(host):
+    global server
+    if UnixServer is not None:
+        if os.path.exists(SOCKET_FILE):
+            os.remove(SOCKET_FILE)  # Left over from a crash; we own the history now
+        server = UnixServer(SOCKET_FILE, RequestHandler)
+        os.chmod(SOCKET_FILE, 0o600)
+        server.setup_api(host, None)
+    else:
+        server = TCPServer(("127.0.0.1", 0), RequestHandler)
+        token = secrets.token_hex(16)
+        server.setup_api(host, token)
+        with open(PORT_FILE, "w") as file:
+            json.dump({'port': server.server_address[1], 'token': token}, file)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# Function to push an event to every subscriber
+def publish(event):
+    if server is not None:
+        server.publish(event)
+
+def publish_capture(item):
+    publish({'event': 'capture', 'item': summarize_item(item)})
+
+def stop():
+    global server
+    if server is None:
+        return
+    server.publish(None)
+    server.shutdown()
+    server.server_close()
+    for path in (SOCKET_FILE, PORT_FILE):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    server = None
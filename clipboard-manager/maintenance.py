@@ -0,0 +1,348 @@
+# Idle-time storage maintenance.
+#
+# Once a day, when nobody has touched the clipboard or the window for a while,
+# the history and the folders around it are checked and tidied up:
+#
+#   * every item is checked for the fields the app relies on and against the
+#     checksum stamped on it when it was captured; damaged items are moved to
+#     quarantine/ instead of being kept (or crashing the next load)
+#   * every blob in clip_blobs/ is decompressed and hashed against its name;
+#     a damaged blob is quarantined and its item falls back to the preview text
+#   * blobs and URL screenshots no item refers to any more are deleted, as are
+#     old temp_clipboard_* files, our own *.tmp leftovers and old quarantine files
+#   * window_settings.json is checked, and the history file is rewritten if it
+#     takes more space on disk than it needs
+#
+# The expensive part (hashing everything) runs on a background thread against a
+# snapshot of the history and only plans the changes; they are applied by the
+# owner of the history (the Tk thread, or the daemon under its lock), which
+# re-checks each one against the live history first. The report of the last run
+# is kept in maintenance.json and shown in the API stats.
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+import blob_store
+import classify
+import history_core
+import persistence
+import url_preview
+
+MAINTENANCE_FILE = "maintenance.json"
+SETTINGS_FILE = "window_settings.json"
+TEMP_FILES = ("temp_clipboard_image.png", "temp_clipboard_text.txt")
+# Files written with persistence.atomic_write, which leaves <name>.tmp behind if interrupted.
+# Only these: the data folder is often the home or a project folder, and other programs' *.tmp aren't ours
+ATOMIC_FILES = (history_core.HISTORY_FILE, SETTINGS_FILE, MAINTENANCE_FILE, "ocr_cache.json", "ocr_backfill.json")
+# Run at most this often, and only after this long without activity
+RUN_EVERY = 24 * 3600
+IDLE_SECONDS = 600
+# Files younger than this are never deleted (they may belong to a capture in flight)
+ORPHAN_MIN_AGE = 3600
+TEMP_MIN_AGE = 600
+QUARANTINE_KEEP_DAYS = 30
+# Short pauses so a run never competes with the app for the disk or the GIL
+PAUSE_EVERY_BYTES = 4 * 1024 * 1024
+PAUSE_SECONDS = 0.01
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+_running = threading.Lock()
+# When the last run finished (0 = never); read from maintenance.json once, then kept up to date by record()
+_last_finished = None
+
+# Function to read the report of the last run (None if it never ran)
+def last_report():
+    try:
+        with open(MAINTENANCE_FILE, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+# Function to check if a run is due, given how long the app has been idle
+def due(idle_seconds):
+    global _last_finished
+    if idle_seconds < IDLE_SECONDS or _running.locked():
+        return False
+    if _last_finished is None:
+        _last_finished = (last_report() or {}).get('finished', 0)
+    return time.time() - _last_finished >= RUN_EVERY
+
+def _pause(counter, size):
+    counter[0] += size
+    if counter[0] >= PAUSE_EVERY_BYTES:
+        counter[0] = 0
+        time.sleep(PAUSE_SECONDS)
+
+# Function to check a blob's contents against its name
+def blob_problem(digest, counter=None):
+    counter = counter or [0]
+    hasher = hashlib.sha256()
+    try:
+        for chunk in blob_store.iter_text(digest):
+            data = chunk.encode('utf-8', 'surrogatepass')
+            hasher.update(data)
+            _pause(counter, len(data))
+    except FileNotFoundError:
+        return "missing"
+    except (OSError, EOFError, zlib.error, UnicodeDecodeError) as e:
+        return f"unreadable ({e})"
+    if hasher.hexdigest() != digest:
+        return "checksum mismatch"
+    return None
+
+def _image_problem(item):
+    try:
+        png = base64.b64decode(item['image_data'], validate=True)
+    except ValueError:
+        return "image data is not base64"
+    if not png.startswith(PNG_SIGNATURE):
+        return "image data is not a PNG"
+    return None
+
+def _files(directory, suffix=""):
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in names if name.endswith(suffix)]
+
+def _age(path, now):
+    try:
+        return now - os.path.getmtime(path)
+    except OSError:
+        return 0
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _is_url_item(item):
+    if item.get('type', 'text') != 'text' or item.get('blob'):
+        return False
+    return (item.get('kind') or classify.classify_item(item)) == 'url'
+
+# Function to find what the history refers to on disk
+def referenced_files(history):
+    blobs = {digest for item in history for digest in history_core.item_blobs(item)}
+    screenshots = {os.path.normcase(url_preview.screenshot_path(item['text'], mode))
+                   for item in history if _is_url_item(item) for mode in url_preview.SCREENSHOT_MODES}
+    return blobs, screenshots
+
+# Function to inspect a snapshot of the history and the folders around it
+def plan(history, history_path=history_core.HISTORY_FILE):
+    """Read-only; returns the changes for apply() to make"""
+    started = time.time()
+    now = started
+    counter = [0]
+    result = {
+        'started': started,
+        'bad_items': {},      # item id -> problem
+        'bad_blobs': {},      # digest -> problem
+        'checksums': {},      # item id -> checksum for items saved without one
+        'delete': [],         # files safe to delete if nothing refers to them by then
+        'bad_settings': None,
+        'compact': False,
+        'items_checked': 0,
+        'blobs_checked': 0
+    }
+
+    for item in history:
+        problem = history_core.item_problem(item, verify_checksum=True)
+        if problem is None and item.get('type') == 'image':
+            problem = _image_problem(item)
+            _pause(counter, len(item['image_data']))
+        if problem:
+            result['bad_items'][item.get('id')] = problem
+        elif 'checksum' not in item:
+            result['checksums'][item.get('id')] = history_core.content_hash(item)
+        result['items_checked'] += 1
+
+    blobs, screenshots = referenced_files(history)
+    for digest in sorted(blobs):
+        problem = blob_problem(digest, counter)
+        if problem:
+            result['bad_blobs'][digest] = problem
+        result['blobs_checked'] += 1
+
+    # Orphans: anything unreferenced that is old enough not to belong to a capture in flight
+    for path in _files(blob_store.BLOB_DIR, ".txt.gz"):
+        digest = os.path.basename(path)[:-len(".txt.gz")]
+        if digest not in blobs and _age(path, now) > ORPHAN_MIN_AGE:
+            result['delete'].append(('blob', path))
+    for path in _files(url_preview.SCREENSHOT_CACHE_DIR):
+        if os.path.normcase(path) not in screenshots and _age(path, now) > ORPHAN_MIN_AGE:
+            result['delete'].append(('screenshot', path))
+    leftovers = list(TEMP_FILES) + [f"{name}.tmp" for name in ATOMIC_FILES] + _files(blob_store.BLOB_DIR, ".tmp")
+    for path in leftovers:
+        if os.path.exists(path) and _age(path, now) > TEMP_MIN_AGE:
+            result['delete'].append(('temp', path))
+    for path in _files(history_core.QUARANTINE_DIR):
+        if _age(path, now) > QUARANTINE_KEEP_DAYS * 86400:
+            result['delete'].append(('quarantine', path))
+
+    result['bad_settings'] = settings_problem()
+
+    # A file written by an older version (or with damaged items) can be bigger than needed
+    compact_size = len(json.dumps(history))
+    result['compact'] = _size(history_path) > compact_size
+    result['planned_seconds'] = time.time() - started
+    return result
+
+# Function to check that window_settings.json can be read (None if it's fine or missing)
+def settings_problem():
+    try:
+        with open(SETTINGS_FILE, "r") as file:
+            json.load(file)
+    except FileNotFoundError:
+        pass
+    except ValueError as e:
+        return str(e)
+    return None
+
+def _quarantine_file(path):
+    os.makedirs(history_core.QUARANTINE_DIR, exist_ok=True)
+    target = os.path.join(history_core.QUARANTINE_DIR,
+                          f"{datetime.now():%Y%m%d-%H%M%S}-{os.path.basename(path)}")
+    os.replace(path, target)
+    return target
+
+# Function to make the planned changes to the live history
+def apply(result, history):
+    """Call on the thread that owns history; returns (history, report, changed)"""
+    report = {
+        'started': datetime.fromtimestamp(result['started']).isoformat(timespec='seconds'),
+        'items_checked': result['items_checked'],
+        'blobs_checked': result['blobs_checked'],
+        'items_quarantined': 0,
+        'blobs_quarantined': 0,
+        'checksums_added': 0,
+        'files_deleted': 0,
+        'bytes_reclaimed': 0,
+        'settings_quarantined': False,
+        'compacted': False,
+        'errors': []
+    }
+    changed = False
+
+    bad = [item for item in history if item.get('id') in result['bad_items']]
+    if bad:
+        history_core.quarantine("bad-items.json", json.dumps(
+            [{'problem': result['bad_items'][item.get('id')], 'record': item} for item in bad]))
+        history = [item for item in history if item.get('id') not in result['bad_items']]
+        for item in bad:
+            history_core.invalidate_item(item)
+        report['items_quarantined'] = len(bad)
+        changed = True
+
+    for digest, problem in result['bad_blobs'].items():
+        for item in history:
+            formats = item.get('formats', {})
+            for name in [name for name, format_digest in formats.items() if format_digest == digest]:
+                # A rich format is only an extra; the plain text is still there
+                del formats[name]
+                item.get('format_sizes', {}).pop(name, None)
+                changed = True
+            if item.get('blob') != digest:
+                continue
+            # Keep what we still have: the preview stored with the item
+            del item['blob']
+            item.pop('size', None)
+            item['checksum'] = history_core.content_hash(item)
+            item['damaged'] = problem
+            history_core.invalidate_item(item)
+            changed = True
+        if blob_store.has_blob(digest):
+            try:
+                _quarantine_file(blob_store.blob_path(digest))
+            except OSError as e:
+                report['errors'].append(f"{digest}: {e}")
+        report['blobs_quarantined'] += 1
+
+    for item in history:
+        checksum = result['checksums'].get(item.get('id'))
+        if checksum and 'checksum' not in item:
+            item['checksum'] = checksum
+            report['checksums_added'] += 1
+            changed = True
+
+    # Re-check against the live history: something may have been captured since the plan
+    blobs, screenshots = referenced_files(history)
+    for kind, path in result['delete']:
+        if kind == 'blob' and os.path.basename(path)[:-len(".txt.gz")] in blobs:
+            continue
+        if kind == 'screenshot' and os.path.normcase(path) in screenshots:
+            continue
+        try:
+            # Skip anything touched since the plan was made
+            if os.path.getmtime(path) > result['started']:
+                continue
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            continue
+        report['files_deleted'] += 1
+        report['bytes_reclaimed'] += size
+
+    # The app may have written a good file since the plan
+    if result['bad_settings'] and settings_problem():
+        try:
+            _quarantine_file(SETTINGS_FILE)
+            report['settings_quarantined'] = True
+        except OSError as e:
+            report['errors'].append(f"{SETTINGS_FILE}: {e}")
+
+    if result['compact'] or changed:
+        before = _size(history_core.HISTORY_FILE)
+        report['bytes_reclaimed'] += max(0, before - len(json.dumps(history)))
+        report['compacted'] = result['compact']
+        changed = True
+    return history, report, changed
+
+# Function to save the report of a run
+def record(report):
+    global _last_finished
+    _last_finished = report.get('finished', time.time())
+    persistence.atomic_write_json(MAINTENANCE_FILE, report, indent=2)
+
+# Function to run maintenance in the background
+def start(snapshot, apply_on_owner, on_done=None):
+    """snapshot is a copy of the history list. apply_on_owner(result) runs on the
+    background thread and must call apply() on the thread that owns the history,
+    save the history if it changed and return the report. on_done(report) is
+    called from the background thread at the end. Returns False if a run is
+    already going."""
+    if not _running.acquire(blocking=False):
+        return False
+
+    def run():
+        started = time.time()
+        try:
+            report = apply_on_owner(plan(snapshot))
+            if not report:
+                raise RuntimeError("the history owner didn't apply the changes")
+        except Exception as e:
+            print(f"Maintenance failed: {e}")
+            # Still counts as a run, so a persistent problem isn't retried on every poll
+            report = {'error': str(e)}
+        try:
+            report['seconds'] = round(time.time() - started, 3)
+            report['finished'] = time.time()
+            record(report)
+            if 'error' not in report:
+                print(f"Maintenance: reclaimed {report['bytes_reclaimed']} bytes, "
+                      f"quarantined {report['items_quarantined']} items and {report['blobs_quarantined']} blobs, "
+                      f"deleted {report['files_deleted']} files in {report['seconds']:.1f} s")
+            if on_done:
+                on_done(report)
+        finally:
+            _running.release()
+
+    threading.Thread(target=run, name="maintenance", daemon=True).start()
+    return True
@@ -0,0 +1,171 @@
+# Near-duplicate detection for captured text.
+#
+# Exact dedupe misses the same paragraph with different whitespace, or the same
+# link with tracking parameters. Every text gets:
+#
+#   * a normalized key (runs of spaces collapsed, URLs canonicalized) for
+#     copies that only differ in formatting. Case is kept ("ABC123" and
+#     "abc123" can be different tokens), and so is each line's indentation in
+#     multi-line text, where it can matter (code)
+#   * a 64-bit SimHash of its words for copies with small edits. Only texts
+#     with enough distinct words get one: on short values (card numbers, paths,
+#     IP addresses, passwords) a one-character change is the whole point and
+#     barely moves a SimHash, so those only ever match by normalized key
+#
+# SimHashes are indexed in bands (locality-sensitive hashing): two hashes at most
+# max_distance bits apart must agree on at least one of max_distance + 1 bands,
+# so a lookup only compares against the few items sharing a band instead of the
+# whole history.
+import hashlib
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Only this much of a text is sketched, so the cost per capture is bounded
+SKETCH_CHARS = 8192
+MAX_FEATURES = 1024
+# Texts with fewer distinct words than this are never matched by SimHash
+MIN_FEATURES = 32
+
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'igshid',
+                   'yclid', '_hsenc', '_hsmi', 'ref_src', 'si'}
+TRACKING_PREFIXES = ('utm_', 'pk_', 'vero_')
+URL_PATTERN = re.compile(r'^[a-z][a-z0-9+.-]*://\S+$', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+INDENT = re.compile(r'^[ \t]*')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# byte -> the byte's 8 bits spread into 16-bit lanes (see simhash)
+_SPREAD = [sum(1 << (16 * bit) for bit in range(8) if value >> bit & 1) for value in range(256)]
+_LANE = (1 << 16) - 1
+
+# Function to drop tracking parameters and cosmetic differences from a URL
+def canonical_url(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port in (None, DEFAULT_PORTS.get(scheme)) else f"{host}:{port}"
+    if parts.username:
+        netloc = f"{parts.username}@{netloc}"
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)]
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((scheme, netloc, path, urlencode(query), ''))
+
+def is_url(text):
+    return bool(URL_PATTERN.match(text.strip()))
+
+# Function to get the key two copies share when they only differ in formatting
+def normalized_key(text):
+    if is_url(text):
+        return canonical_url(text)
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) <= 1:
+        return WHITESPACE.sub(' ', text).strip()
+    # Blank lines and trailing spaces go, indentation stays
+    return "\n".join(INDENT.match(line).group() + WHITESPACE.sub(' ', line.strip()) for line in lines)
+
+def _features(key):
+    # Words, ignoring case: only a change of a few of them is a small edit
+    return list(set(key.lower().split()))[:MAX_FEATURES]
+
+# Function to compute the 64-bit SimHash of a normalized key
+def simhash(key, features=None):
+    features = features if features is not None else _features(key[:SKETCH_CHARS])
+    # Add up every feature hash with each bit in its own 16-bit lane, so the
+    # per-bit vote counts come out of one big integer sum (8 lookups per
+    # feature instead of 64 bit tests)
+    total = 0
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+        for index, byte in enumerate(digest):
+            total += _SPREAD[byte] << (128 * index)
+    half = len(features) / 2
+    value = 0
+    for bit in range(64):
+        if (total >> (16 * bit)) & _LANE > half:
+            value |= 1 << bit
+    return value
+
+# Function to get (normalized key, simhash) of a text; URLs and short texts only use the key
+def sketch(text):
+    key = normalized_key(text)
+    if is_url(text):
+        return key, None
+    features = _features(key[:SKETCH_CHARS])
+    if len(features) < MIN_FEATURES:
+        return key, None
+    return key, simhash(key, features)
+
+# Function to create an empty index
+def new_index(max_distance=6):
+    bands = max_distance + 1
+    return {
+        'max_distance': max_distance,
+        'band_bits': 64 // bands,
+        'bands': [{} for _ in range(bands)],  # band value -> set of item ids
+        'keys': {},                           # normalized key -> item id
+        'items': {}                           # item id -> (item, key, simhash)
+    }
+
+def _band_values(index, value):
+    width = index['band_bits']
+    mask = (1 << width) - 1
+    return [(value >> (width * band)) & mask for band in range(len(index['bands']))]
+
+# Function to add an item to the index under its sketch
+def add(index, item, text_sketch):
+    key, value = text_sketch
+    item_id = item['id']
+    index['keys'][key] = item_id
+    index['items'][item_id] = (item, key, value)
+    if value is not None:
+        for band, band_value in zip(index['bands'], _band_values(index, value)):
+            band.setdefault(band_value, set()).add(item_id)
+
+def remove(index, item_id):
+    entry = index['items'].pop(item_id, None)
+    if entry is None:
+        return
+    item, key, value = entry
+    if index['keys'].get(key) == item_id:
+        del index['keys'][key]
+    if value is not None:
+        for band, band_value in zip(index['bands'], _band_values(index, value)):
+            ids = band.get(band_value)
+            if ids:
+                ids.discard(item_id)
+                if not ids:
+                    del band[band_value]
+
+# Function to find the indexed item closest to a sketch (None if nothing is near)
+def find(index, text_sketch):
+    key, value = text_sketch
+    item_id = index['keys'].get(key)
+    if item_id is not None:
+        return index['items'][item_id][0]
+    if value is None:
+        return None
+
+    best = None
+    best_distance = index['max_distance'] + 1
+    candidates = set()
+    for band, band_value in zip(index['bands'], _band_values(index, value)):
+        candidates.update(band.get(band_value, ()))
+    for candidate in candidates:
+        item, _, other = index['items'][candidate]
+        distance = (value ^ other).bit_count()
+        if distance < best_distance:
+            best, best_distance = item, distance
+    return best
+
+# Function to index every text item of a history
+def build_index(history, max_distance=6):
+    index = new_index(max_distance)
+    for item in reversed(history):
+        if item.get('type', 'text') == 'text' and not item.get('blob') and 'id' in item:
+            add(index, item, sketch(item.get('text', '')))
+    return index
@@ -0,0 +1,224 @@
+# OCR stage for captured images.
+#
+#   1. Cache: results are kept by image fingerprint, so copying the same image
+#      again never runs Tesseract twice.
+#   2. Gate: a cheap text-likelihood check on a small thumbnail skips photos and
+#      flat UI screenshots that almost never contain useful text.
+#   3. Preprocess: grayscale, capped resolution and Otsu binarization, which is
+#      what Tesseract reads fastest and most reliably.
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+from PIL import Image, ImageFilter, ImageOps
+import pytesseract
+import persistence
+
+OCR_CACHE_FILE = "ocr_cache.json"
+OCR_CACHE_SIZE = 500
+
+# Images scoring below this are assumed to have no text
+TEXT_LIKELIHOOD_THRESHOLD = 0.35
+GATE_THUMBNAIL = 512
+GATE_BLOCK = (32, 16)
+# Tesseract time grows with pixel count; beyond this we downscale first
+MAX_OCR_PIXELS = 4_000_000
+# Tiny crops read better slightly enlarged
+MIN_OCR_HEIGHT = 40
+
+_cache = None  # fingerprint -> text, oldest first
+
+stats = {
+    'images': 0,
+    'cache_hits': 0,
+    'gated': 0,
+    'ocr_runs': 0,
+    'ocr_seconds': 0.0,
+    'ocr_cpu_seconds': 0.0,
+    'gate_seconds': 0.0
+}
+
+# Function to identify an image by its encoded (PNG/base64) data
+def fingerprint(image_data):
+    if isinstance(image_data, str):
+        image_data = image_data.encode('ascii')
+    return hashlib.sha1(image_data).hexdigest()
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        _cache = OrderedDict()
+        try:
+            with open(OCR_CACHE_FILE, "r") as file:
+                _cache.update(json.load(file))
+        except (FileNotFoundError, ValueError):
+            pass
+    return _cache
+
+def cached_text(key):
+    cache = _load_cache()
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    return None
+
+def remember(key, text):
+    cache = _load_cache()
+    cache[key] = text
+    cache.move_to_end(key)
+    while len(cache) > OCR_CACHE_SIZE:
+        cache.popitem(last=False)
+    persistence.schedule_write(OCR_CACHE_FILE, dict(cache))
+
+# Function to estimate how likely an image is to contain text (0..1)
+def text_likelihood(img):
+    small = img.convert('L')
+    small.thumbnail((GATE_THUMBNAIL, GATE_THUMBNAIL))
+    width, height = small.size
+    if width < GATE_BLOCK[0] or height < GATE_BLOCK[1]:
+        return 1.0  # Too small to judge, let Tesseract decide
+
+    # Text sits on a dominant, mostly flat background
+    histogram = small.histogram()
+    bins = [sum(histogram[i:i + 16]) for i in range(0, 256, 16)]
+    background = max(bins) / (width * height)
+    background_score = min(1.0, max(0.0, (background - 0.3) / 0.4))
+
+    # Glyph strokes give many short edges per row inside a small block, while
+    # panels, borders and smooth photos give at most one or two
+    edges = small.filter(ImageFilter.FIND_EDGES).point(lambda v: 255 if v > 60 else 0).tobytes()
+    block_width, block_height = GATE_BLOCK
+    busy_blocks = 0
+    text_blocks = 0
+    for top in range(0, height - block_height + 1, block_height):
+        for left in range(0, width - block_width + 1, block_width):
+            transitions = 0
+            lit = 0
+            for row in range(top, top + block_height):
+                segment = edges[row * width + left:row * width + left + block_width]
+                transitions += segment.count(b'\x00\xff')
+                lit += segment.count(b'\xff')
+            if lit:
+                busy_blocks += 1
+                if transitions / block_height >= 1.5:
+                    text_blocks += 1
+    if not busy_blocks:
+        return 0.0
+    text_score = min(1.0, (text_blocks / busy_blocks) / 0.25)
+    return text_score * (0.5 + 0.5 * background_score)
+
+# Function to prepare an image for Tesseract
+def preprocess(img):
+    gray = img.convert('L')
+
+    if gray.width * gray.height > MAX_OCR_PIXELS:
+        scale = (MAX_OCR_PIXELS / (gray.width * gray.height)) ** 0.5
+        gray = gray.resize((max(1, int(gray.width * scale)), max(1, int(gray.height * scale))),
+                           Image.Resampling.BILINEAR)
+    elif gray.height < MIN_OCR_HEIGHT:
+        scale = MIN_OCR_HEIGHT / max(1, gray.height)
+        gray = gray.resize((max(1, int(gray.width * scale)), MIN_OCR_HEIGHT), Image.Resampling.BICUBIC)
+
+    threshold = otsu_threshold(gray.histogram())
+    binary = gray.point(lambda v: 255 if v > threshold else 0, mode='1').convert('L')
+    # Tesseract wants dark text on a light background
+    if binary.histogram()[0] > (binary.width * binary.height) / 2:
+        binary = ImageOps.invert(binary)
+    return binary
+
+# Function to pick the threshold that best separates dark and light pixels
+def otsu_threshold(histogram):
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_background = 0
+    weight_background = 0
+    best_threshold = 127
+    best_variance = 0.0
+    for threshold, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += threshold * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_threshold = threshold
+    return best_threshold
+
+def _child_cpu_seconds():
+    times = os.times()
+    return times.children_user + times.children_system
+
+# Function to run Tesseract with its own thread count limited (OMP_THREAD_LIMIT)
+def _tesseract_limited(img, threads):
+    # pytesseract always hands Tesseract this process's environment, so run it
+    # directly to set the limit for this one child only
+    png = io.BytesIO()
+    img.save(png, 'PNG')
+    env = dict(os.environ, OMP_THREAD_LIMIT=str(threads))
+    # No console window flashing up in the packaged app
+    flags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+    try:
+        result = subprocess.run([pytesseract.pytesseract.tesseract_cmd, 'stdin', 'stdout'], input=png.getvalue(),
+                                capture_output=True, env=env, creationflags=flags)
+    except FileNotFoundError:
+        raise pytesseract.TesseractNotFoundError() from None
+    if result.returncode:
+        raise pytesseract.TesseractError(result.returncode, result.stderr.decode(errors='replace').strip())
+    return result.stdout.decode('utf-8', errors='replace')
+
+# Function to run Tesseract on an image (no cache, no gate)
+def run_tesseract(img, threads=None):
+    """threads limits Tesseract's own threads, for running several at once"""
+    wall_start = time.perf_counter()
+    cpu_start = _child_cpu_seconds()
+    try:
+        if threads is not None:
+            return _tesseract_limited(preprocess(img), threads).strip()
+        return pytesseract.image_to_string(preprocess(img)).strip()
+    finally:
+        stats['ocr_runs'] += 1
+        stats['ocr_seconds'] += time.perf_counter() - wall_start
+        stats['ocr_cpu_seconds'] += _child_cpu_seconds() - cpu_start
+
+# Function to extract text from a captured image
+def extract_text(img, key=None, use_gate=True):
+    """key is the image fingerprint; pass it to enable the result cache"""
+    stats['images'] += 1
+    if key is not None:
+        text = cached_text(key)
+        # Without the gate an empty result isn't trusted: caches written by older
+        # versions also hold "" for images the gate skipped
+        if text is not None and (text or use_gate):
+            stats['cache_hits'] += 1
+            return text
+
+    if use_gate:
+        gate_start = time.perf_counter()
+        likelihood = text_likelihood(img)
+        stats['gate_seconds'] += time.perf_counter() - gate_start
+        if likelihood < TEXT_LIKELIHOOD_THRESHOLD:
+            stats['gated'] += 1
+            # Not cached, so a run without the gate still gets to try Tesseract
+            print(f"OCR skipped (text likelihood {likelihood:.2f})")
+            return ""
+
+    try:
+        text = run_tesseract(img)
+        print(f"OCR extracted: {text[:50]}...")
+    except Exception as e:
+        # Don't cache failures (e.g. Tesseract missing) so a later run can retry
+        print(f"OCR error: {e}")
+        return ""
+    if key is not None:
+        remember(key, text)
+    return text
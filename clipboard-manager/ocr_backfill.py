@@ -0,0 +1,286 @@
+# Bulk OCR re-index of image items.
+#
+# Images captured while OCR wasn't working (Tesseract missing, timeouts) or
+# imported from old history files keep an empty ocr_text, so search can't find
+# them. This runs OCR over them in parallel:
+#
+#   * one Tesseract process per available core at a time. Tesseract already runs
+#     as its own process, so the pool is a thread pool that drives them; a pool
+#     of Python processes would re-import the Tk app in every worker on Windows
+#     and in the packaged .exe
+#   * results go to a checkpoint file (ocr_backfill.json) as they arrive, so an
+#     interrupted run resumes where it stopped instead of starting over
+#   * results are written back to the history in batches, one save per batch
+#
+# From the app: Settings -> Actions -> Re-run OCR on Images. From a terminal:
+#
+#     python ocr_backfill.py               # images without OCR text
+#     python ocr_backfill.py --force       # every image
+#     python ocr_backfill.py --stop        # stop a run inside the app/daemon
+#
+# While the app or the daemon owns the history the command asks it to do the
+# work (see the 'reindex' API op) instead of writing the file itself.
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import capture  # sets the bundled tesseract path
+import history_core
+import ocr
+import persistence
+
+CHECKPOINT_FILE = "ocr_backfill.json"
+CHECKPOINT_VERSION = 2
+# Results are written back (and checkpointed) this many at a time, or at least this often
+BATCH_SIZE = 25
+BATCH_SECONDS = 5.0
+
+_job = None
+_job_lock = threading.Lock()
+
+# Function to count the cores this process may use
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+# Function to check if an image item should be (re-)OCRed
+def needs_ocr(item, force=False):
+    if item.get('type') != 'image':
+        return False
+    return force or not (item.get('ocr_text') or item.get('ocr_backfilled'))
+
+# Function to load the results of an interrupted run with the same options
+def load_checkpoint(force=False, use_gate=True):
+    options = {'version': CHECKPOINT_VERSION, 'force': force, 'use_gate': use_gate}
+    try:
+        with open(CHECKPOINT_FILE, "r") as file:
+            checkpoint = json.load(file)
+        # A run with other options would get different answers (e.g. --no-gate OCRs what the gate skipped)
+        if all(checkpoint.get(name) == value for name, value in options.items()):
+            return checkpoint
+    except (FileNotFoundError, ValueError):
+        pass
+    return dict(options, results={})
+
+def _save_checkpoint(checkpoint):
+    persistence.atomic_write_json(CHECKPOINT_FILE, checkpoint)
+
+def clear_checkpoint():
+    try:
+        os.remove(CHECKPOINT_FILE)
+    except FileNotFoundError:
+        pass
+
+# Function to OCR one image (runs on a pool thread; Tesseract itself is a child process)
+def ocr_image(image_data, use_gate=True):
+    """Return the text ("" if the gate says there is none); raises if Tesseract fails"""
+    img = capture.base64_to_image(image_data)
+    if use_gate and ocr.text_likelihood(img) < ocr.TEXT_LIKELIHOOD_THRESHOLD:
+        return ""
+    # One Tesseract per core already; its own threads would only compete with the others
+    return ocr.run_tesseract(img, threads=1)
+
+# Function to write OCR results into the live history
+def apply_results(history, results):
+    """results is a list of (item id, text); returns the items that changed"""
+    wanted = dict(results)
+    changed = []
+    for item in history:
+        if item.get('id') in wanted:
+            item['ocr_text'] = wanted[item['id']]
+            item['ocr_backfilled'] = True
+            history_core.invalidate_item(item)
+            changed.append(item)
+    return changed
+
+# Function to OCR every image that needs it
+def run(snapshot, apply_batch, progress=None, stop_event=None, force=False, use_gate=True, workers=None):
+    """snapshot is a copy of the history. apply_batch(results) must write a list of
+    (item id, text) into the live history and save it once; it's called from this
+    thread. progress(done, total) is called as images finish. Returns the stats."""
+    stop_event = stop_event or threading.Event()
+    workers = workers or available_cores()
+    targets = [item for item in snapshot if needs_ocr(item, force)]
+    checkpoint = load_checkpoint(force, use_gate)
+    done_before = checkpoint['results']
+    stats = {'total': len(targets), 'done': 0, 'resumed': 0, 'with_text': 0, 'failed': 0,
+             'workers': workers, 'stopped': False, 'seconds': 0.0}
+    started = time.perf_counter()
+    batch = []
+    last_flush = time.monotonic()
+
+    def flush():
+        nonlocal batch, last_flush
+        if batch:
+            _save_checkpoint(checkpoint)
+            apply_batch(batch)
+            batch = []
+        last_flush = time.monotonic()
+
+    def finished(item, key, text):
+        checkpoint['results'][key] = text
+        # Also answers the capture path if the same image is copied again
+        ocr.remember(key, text)
+        batch.append((item['id'], text))
+        stats['done'] += 1
+        stats['with_text'] += bool(text)
+        if progress:
+            progress(stats['done'], stats['total'])
+        if len(batch) >= BATCH_SIZE or time.monotonic() - last_flush > BATCH_SECONDS:
+            flush()
+
+    queue = []
+    for item in targets:
+        key = ocr.fingerprint(item['image_data'])
+        if key in done_before:
+            # Finished before the last run was interrupted
+            stats['resumed'] += 1
+            finished(item, key, done_before[key])
+        else:
+            queue.append((item, key))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-backfill") as pool:
+        running = {}
+        position = 0
+        while (position < len(queue) or running) and not stop_event.is_set():
+            # Only a few images in flight, so memory stays flat however many there are
+            while position < len(queue) and len(running) < workers * 2:
+                item, key = queue[position]
+                running[pool.submit(ocr_image, item['image_data'], use_gate)] = (item, key)
+                position += 1
+            completed, _ = wait(running, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in completed:
+                item, key = running.pop(future)
+                try:
+                    finished(item, key, future.result())
+                except Exception as e:
+                    stats['failed'] += 1
+                    print(f"OCR failed for image {item.get('id')}: {e}")
+                    if stats['failed'] >= workers * 2 and stats['done'] == stats['resumed']:
+                        # Nothing has worked yet: most likely Tesseract is missing, don't try every image
+                        stats['error'] = f"OCR isn't working: {e}"
+                        stop_event.set()
+        if stop_event.is_set():
+            stats['stopped'] = True
+            for future in running:
+                future.cancel()
+
+    flush()
+    if not stats['stopped'] and not stats['failed']:
+        clear_checkpoint()
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+# Function to run the re-index in the background (one at a time)
+def start(snapshot, apply_batch, progress=None, on_done=None, force=False, use_gate=True):
+    """Like run(), on its own thread; on_done(stats) is called from it at the end.
+    Returns False if a run is already going."""
+    global _job
+    with _job_lock:
+        if _job is not None:
+            return False
+        job = _job = {'stop': threading.Event(), 'done': 0, 'total': 0, 'started': time.time()}
+
+    def report(done, total):
+        job['done'], job['total'] = done, total
+        if progress:
+            progress(done, total)
+
+    def work():
+        global _job
+        try:
+            stats = run(snapshot, apply_batch, report, job['stop'], force, use_gate)
+        except Exception as e:
+            print(f"OCR re-index failed: {e}")
+            stats = {'error': str(e)}
+        finally:
+            with _job_lock:
+                _job = None
+        if on_done:
+            on_done(stats)
+
+    threading.Thread(target=work, name="ocr-backfill", daemon=True).start()
+    return True
+
+# Function to ask a running re-index to stop (it can be resumed later)
+def stop():
+    job = _job
+    if job is None:
+        return False
+    job['stop'].set()
+    return True
+
+def status():
+    job = _job
+    if job is None:
+        return {'running': False}
+    return {'running': True, 'done': job['done'], 'total': job['total'],
+            'seconds': time.time() - job['started']}
+
+# Function to serve the "reindex" API op
+def handle(action, snapshot, apply_batch, force=False, use_gate=True, progress=None, on_done=None):
+    if action == 'start':
+        if not start(snapshot(), apply_batch, progress, on_done, force, use_gate):
+            raise ValueError("an OCR re-index is already running")
+        return status()
+    if action == 'stop':
+        return stop()
+    if action == 'status':
+        return status()
+    raise ValueError(f"unknown reindex action {action!r}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run OCR again on images in the clipboard history")
+    parser.add_argument("--force", action="store_true", help="also images that already have OCR text")
+    parser.add_argument("--no-gate", action="store_true", help="run Tesseract even on images that look text-free")
+    parser.add_argument("--workers", type=int, help=f"parallel Tesseract processes (default {available_cores()})")
+    parser.add_argument("--stop", action="store_true", help="stop a re-index running in the app or daemon")
+    args = parser.parse_args()
+
+    if args.stop or not history_core.acquire_writer_lock('ocr-backfill'):
+        # Someone else owns the history: let it do the work
+        import ipc_client
+        try:
+            with ipc_client.connect() as client:
+                result = client.request('reindex', action='stop' if args.stop else 'start',
+                                        force=args.force, gate=not args.no_gate)
+        except (ipc_client.ClientError, OSError) as e:
+            print(f"Error: {e}")
+            return 1
+        print(json.dumps(result, indent=2))
+        return 0
+
+    def show_progress(done, total):
+        print(f"\r{done}/{total}", end="", flush=True)
+
+    try:
+        history = history_core.load_history_file()
+
+        def apply_batch(results):
+            apply_results(history, results)
+            history_core.save_history_file(history)
+
+        stats = run(list(history), apply_batch, show_progress, force=args.force,
+                    use_gate=not args.no_gate, workers=args.workers)
+    except KeyboardInterrupt:
+        print("\nStopped; run again to continue where it left off")
+        return 1
+    finally:
+        persistence.flush()
+        history_core.release_writer_lock()
+    if 'error' in stats:
+        print(f"\n{stats['error']}")
+        return 1
+    print(f"\nOCR on {stats['done']} of {stats['total']} images in {stats['seconds']:.1f} s "
+          f"with {stats['workers']} workers: {stats['with_text']} have text, {stats['failed']} failed")
+    return 0
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except OSError as e:
+        raise SystemExit(f"Error: {e}")
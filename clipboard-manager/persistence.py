@@ -0,0 +1,108 @@
+# Background persistence for the history and window settings.
+#
+# Saves are handed to one writer thread instead of being written on the caller's
+# thread. Saves to the same file that arrive within COALESCE_SECONDS of each
+# other collapse into a single write, and every write goes to a temp file that
+# is fsynced and then renamed over the real one, so a crash never leaves a
+# half-written clipboard_history.json behind.
+import json
+import os
+import threading
+import time
+
+COALESCE_SECONDS = 0.25
+
+_pending = {}  # path -> (data, indent)
+_condition = threading.Condition()
+# Held while a batch is being written so the writer thread and flush() never overlap
+_write_lock = threading.Lock()
+_writer_thread = None
+
+# Counters for write_stats()
+_stats = {'save_requests': 0, 'writes': 0, 'bytes_written': 0, 'write_errors': 0}
+
+# Function to replace a file with new contents without ever leaving it half written
+def atomic_write(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    # Make the rename itself durable (not possible/needed on Windows)
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    return len(text)
+
+def atomic_write_json(path, data, indent=None):
+    return atomic_write(path, json.dumps(data, indent=indent))
+
+# Function to snapshot data so later edits on the caller's thread don't race the writer
+def _snapshot(data):
+    """Copies every dict and list, however deep (items keep formats/format_sizes dicts the
+    capture and classifier threads still add to); strings and numbers are shared"""
+    if isinstance(data, list):
+        return [_snapshot(x) if isinstance(x, (dict, list)) else x for x in data]
+    if isinstance(data, dict):
+        return {key: _snapshot(value) if isinstance(value, (dict, list)) else value for key, value in data.items()}
+    return data
+
+# Function to queue a save; returns immediately
+def schedule_write(path, data, indent=None):
+    with _condition:
+        _pending[path] = (_snapshot(data), indent)
+        _stats['save_requests'] += 1
+        _ensure_writer()
+        _condition.notify_all()
+
+def _ensure_writer():
+    global _writer_thread
+    if _writer_thread is None or not _writer_thread.is_alive():
+        _writer_thread = threading.Thread(target=_writer_loop, name="persistence-writer", daemon=True)
+        _writer_thread.start()
+
+def _write_pending():
+    with _write_lock:
+        with _condition:
+            batch = dict(_pending)
+            _pending.clear()
+        for path, (data, indent) in batch.items():
+            try:
+                written = atomic_write_json(path, data, indent)
+                with _condition:
+                    _stats['writes'] += 1
+                    _stats['bytes_written'] += written
+            except Exception as e:
+                print(f"Save error for {path}: {e}")
+                with _condition:
+                    _stats['write_errors'] += 1
+
+def _writer_loop():
+    while True:
+        with _condition:
+            while not _pending:
+                _condition.wait()
+        # Let a burst of saves pile up, then write each file once
+        time.sleep(COALESCE_SECONDS)
+        _write_pending()
+
+# Function to write everything that is queued right now and wait for it
+def flush():
+    _write_pending()
+
+# Function to report how much disk writing the saves caused
+def write_stats():
+    with _condition:
+        stats = dict(_stats)
+    writes = stats['writes']
+    requests = stats['save_requests']
+    # Full-file rewrites per save request: 1.0 means nothing was coalesced
+    stats['writes_per_request'] = writes / requests if requests else 0.0
+    stats['bytes_per_request'] = stats['bytes_written'] / requests if requests else 0.0
+    stats['pending'] = len(_pending)
+    return stats
@@ -0,0 +1,61 @@
+# Adaptive clipboard polling.
+#
+# Polls quickly for a little while after something was captured or the user
+# touched the window, then backs off step by step while nothing happens. Every
+# wakeup is counted so the effect on battery life can be measured (see stats()).
+import time
+
+# (seconds since last activity, poll interval in seconds), checked in order
+SCHEDULE = (
+    (30, 0.5),      # just copied something / using the window
+    (300, 1.0),     # quiet for a bit
+    (1800, 2.0),    # idle
+    (None, 4.0)     # idle for a long time
+)
+
+# Function to create the state of one polling loop
+def new_scheduler():
+    now = time.monotonic()
+    return {
+        'started': now,
+        'last_activity': now,
+        'polls': 0,
+        'captures': 0,
+        'interval': SCHEDULE[0][1],
+        'polls_by_interval': {}
+    }
+
+# Function to go back to fast polling (a capture, a keypress in the window, ...)
+def note_activity(scheduler):
+    scheduler['last_activity'] = time.monotonic()
+
+# Function to record one poll and get the delay until the next one (seconds)
+def next_interval(scheduler, captured=False):
+    scheduler['polls'] += 1
+    if captured:
+        scheduler['captures'] += 1
+        note_activity(scheduler)
+    idle = time.monotonic() - scheduler['last_activity']
+    for limit, interval in SCHEDULE:
+        if limit is None or idle < limit:
+            break
+    scheduler['interval'] = interval
+    counts = scheduler['polls_by_interval']
+    counts[interval] = counts.get(interval, 0) + 1
+    return interval
+
+# Function to get how long nothing has happened (seconds)
+def idle_seconds(scheduler):
+    return time.monotonic() - scheduler['last_activity']
+
+# Function to report how often we woke up
+def stats(scheduler):
+    minutes = max(time.monotonic() - scheduler['started'], 1e-9) / 60
+    return {
+        'polls': scheduler['polls'],
+        'captures': scheduler['captures'],
+        'wakeups_per_minute': scheduler['polls'] / minutes,
+        'current_interval': scheduler['interval'],
+        'idle_seconds': idle_seconds(scheduler),
+        'polls_by_interval': {str(k): v for k, v in sorted(scheduler['polls_by_interval'].items())}
+    }
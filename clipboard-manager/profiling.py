@@ -0,0 +1,233 @@
+# On-demand profiling of the running app (or daemon).
+#
+# A session is started and stopped in the live process, from Settings ->
+# Profiling or with "python ipc_client.py profile start/stop", so the app keeps
+# capturing exactly as it normally does. Two CPU modes:
+#
+#   * cprofile - deterministic profile of the Tk thread (every call counted)
+#   * sample   - a background thread records the stacks of all threads every
+#                few milliseconds (low overhead, wall-clock, works in the daemon)
+#
+# With memory on, tracemalloc runs for the session and a snapshot is written at
+# the start, at the end and whenever snapshot() is called; each one is diffed
+# against the one before it. Everything goes to profiles/<timestamp>-*.
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+PROFILE_DIR = "profiles"
+SAMPLE_INTERVAL = 0.005
+MAX_STACK_DEPTH = 64
+TRACEMALLOC_FRAMES = 25
+REPORT_LINES = 40
+
+_session = None
+_lock = threading.Lock()
+
+def _stamp():
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+def _path(session, suffix):
+    return os.path.join(PROFILE_DIR, f"{session['stamp']}-{suffix}")
+
+def _write(path, text):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text)
+    return path
+
+# Function to record the stacks of all other threads until the session stops
+def _sample_loop(session):
+    own = threading.get_ident()
+    counts = session['samples']
+    while not session['stop'].wait(session['interval']):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            counts[';'.join(reversed(stack))] += 1
+
+# Function to write the report of a sampling session
+def _sample_report(session):
+    counts = session['samples']
+    total = sum(counts.values()) or 1
+    own_time = Counter()
+    total_time = Counter()
+    for stack, count in counts.items():
+        frames = stack.split(';')
+        own_time[frames[-1]] += count
+        for frame in set(frames[1:]):
+            total_time[frame] += count
+
+    collapsed = _write(_path(session, "samples.folded"),
+                       "".join(f"{stack} {count}\n" for stack, count in counts.most_common()))
+    lines = [f"{total} samples every {session['interval'] * 1000:.1f} ms over "
+             f"{time.time() - session['started']:.1f} s (wall clock, all threads)", "",
+             "Own time (where threads were when sampled):"]
+    lines += [f"{count * 100 / total:6.1f}%  {frame}" for frame, count in own_time.most_common(REPORT_LINES)]
+    lines += ["", "Total time (function was on the stack):"]
+    lines += [f"{count * 100 / total:6.1f}%  {frame}" for frame, count in total_time.most_common(REPORT_LINES)]
+    lines += ["", f"Full stacks (flame graph / speedscope input): {collapsed}"]
+    return [_write(_path(session, "samples.txt"), "\n".join(lines) + "\n"), collapsed]
+
+# Function to write a tracemalloc snapshot and its diff against the previous one
+def _memory_snapshot(session, label):
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+    ))
+    index = len(session['snapshots'])
+    path = _path(session, f"mem-{index}-{label}.snap")
+    snapshot.dump(path)
+    reports = [path]
+    current, peak = tracemalloc.get_traced_memory()
+    top = [f"Traced memory: {current / 1e6:.1f} MB now, {peak / 1e6:.1f} MB peak", "",
+           "Largest allocation sites:"]
+    top += [str(stat) for stat in snapshot.statistics('lineno')[:REPORT_LINES]]
+    reports.append(_write(_path(session, f"mem-{index}-{label}-top.txt"), "\n".join(top) + "\n"))
+    if session['snapshots']:
+        reports.append(write_diff(session['snapshots'][-1], path,
+                                  _path(session, f"mem-{index}-{label}-diff.txt"), snapshot))
+    session['snapshots'].append(path)
+    return reports
+
+# Function to compare two saved tracemalloc snapshots
+def write_diff(old_path, new_path, report_path=None, new_snapshot=None):
+    """Return the path of a report of the allocation sites that grew or shrank the most"""
+    old = tracemalloc.Snapshot.load(old_path)
+    new = new_snapshot or tracemalloc.Snapshot.load(new_path)
+    stats = new.compare_to(old, 'lineno')
+    growth = sum(stat.size_diff for stat in stats)
+    lines = [f"{os.path.basename(old_path)} -> {os.path.basename(new_path)}: {growth / 1e6:+.2f} MB", ""]
+    lines += [str(stat) for stat in stats[:REPORT_LINES]]
+    if report_path is None:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        report_path = os.path.join(PROFILE_DIR, f"{_stamp()}-mem-compare.txt")
+    return _write(report_path, "\n".join(lines) + "\n")
+
+# Function to start a profiling session
+def start(mode='sample', memory=True, interval=SAMPLE_INTERVAL):
+    """mode is 'cprofile' (profiles the calling thread), 'sample' or None (memory only)"""
+    global _session
+    with _lock:
+        if _session is not None:
+            raise ValueError("a profiling session is already running")
+        if mode not in ('cprofile', 'sample', None):
+            raise ValueError(f"unknown profiling mode {mode!r}")
+        if mode is None and not memory:
+            raise ValueError("nothing to record: pick a profiling mode or turn on memory tracing")
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        session = {
+            'stamp': _stamp(),
+            'started': time.time(),
+            'mode': mode,
+            'memory': memory,
+            'interval': interval,
+            'snapshots': [],
+            'reports': [],
+            'stop': threading.Event(),
+            'samples': Counter()
+        }
+        if memory:
+            session['started_tracemalloc'] = not tracemalloc.is_tracing()
+            if session['started_tracemalloc']:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            session['reports'] += _memory_snapshot(session, "start")
+        if mode == 'cprofile':
+            session['profiler'] = cProfile.Profile()
+            session['profiler'].enable()
+        elif mode == 'sample':
+            session['sampler'] = threading.Thread(target=_sample_loop, args=(session,),
+                                                  name="profiling-sampler", daemon=True)
+            session['sampler'].start()
+        _session = session
+    return status()
+
+# Function to write a memory snapshot in the middle of a session
+def snapshot():
+    with _lock:
+        if _session is None or not _session['memory']:
+            raise ValueError("no profiling session with memory tracing is running")
+        reports = _memory_snapshot(_session, "mid")
+        _session['reports'] += reports
+    return reports
+
+# Function to stop the session and write its reports
+def stop():
+    """Return the paths of every report written by the session"""
+    global _session
+    with _lock:
+        session = _session
+        if session is None:
+            raise ValueError("no profiling session is running")
+        _session = None
+        reports = session['reports']
+        if session['mode'] == 'cprofile':
+            profiler = session['profiler']
+            profiler.disable()
+            raw = _path(session, "cpu.prof")
+            profiler.dump_stats(raw)
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(REPORT_LINES)
+            reports += [_write(_path(session, "cpu.txt"), output.getvalue()), raw]
+        elif session['mode'] == 'sample':
+            session['stop'].set()
+            session['sampler'].join()
+            reports += _sample_report(session)
+        if session['memory']:
+            reports += _memory_snapshot(session, "end")
+            if session['started_tracemalloc']:
+                tracemalloc.stop()
+    return reports
+
+# Function to describe the running session (if any)
+def status():
+    session = _session
+    if session is None:
+        return {'running': False}
+    return {
+        'running': True,
+        'mode': session['mode'],
+        'memory': session['memory'],
+        'seconds': time.time() - session['started'],
+        'reports': list(session['reports'])
+    }
+
+# Function to serve the "profile" API op
+def handle(action, mode='sample', memory=True, on_ui=None):
+    """on_ui(func, *args) runs func on the thread cprofile should watch (the Tk thread)"""
+    mode = None if mode in (None, 'none') else mode
+    if action == 'start':
+        if mode == 'cprofile':
+            if on_ui is None:
+                raise ValueError("cprofile mode needs the window; use --mode sample with the daemon")
+            return on_ui(start, mode, memory)
+        return start(mode, memory)
+    if action == 'stop':
+        if status().get('mode') == 'cprofile':
+            return on_ui(stop)
+        return stop()
+    if action == 'snapshot':
+        return snapshot()
+    if action == 'status':
+        return status()
+    raise ValueError(f"unknown profile action {action!r}")
+
+if __name__ == "__main__":
+    # python profiling.py compare old.snap new.snap
+    if len(sys.argv) == 4 and sys.argv[1] == "compare":
+        print(open(write_diff(sys.argv[2], sys.argv[3]), encoding="utf-8").read())
+    else:
+        print("Usage: python profiling.py compare <old.snap> <new.snap>")
@@ -0,0 +1,68 @@
+# Checks for history_core's kind index: the filtered view has to follow every
+# change to the history, not just the ones that replace its first item.
+#
+#     python -m pytest tests
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import history_core
+
+def make_item(text, timestamp, kind, pinned=False):
+    item = history_core.make_text_item(text, timestamp)
+    item['kind'] = kind
+    item['pinned'] = pinned
+    return item
+
+def expected_view(history, kind):
+    return [item for item in history_core.sorted_history(history) if item.get('kind') == kind]
+
+class KindIndexTest(unittest.TestCase):
+    def setUp(self):
+        # A pinned first item stays first whatever is captured after it
+        self.history = [make_item("pinned", 1, 'text', pinned=True)]
+        self.history += [make_item(f"https://example.com/{n}", 10 + n, 'url') for n in range(5)]
+
+    def check(self, history):
+        for kind in ('text', 'url', 'code'):
+            self.assertEqual(history_core.visible_items(history, kind=kind), expected_view(history, kind))
+
+    def test_capture_into_full_history(self):
+        history = self.history
+        self.check(history)
+        rng = random.Random(1)
+        for n in range(500):
+            # Trimming keeps the length and the pinned first item the same, and the lists it
+            # replaces are freed, so a later one often gets the id() the index was built for
+            kind = rng.choice(['code', 'url'])
+            history = history_core.add_item(history, make_item(f"clip {n}", 100 + n, kind), max_history=5)
+            if rng.random() < 0.4:
+                # Like switching the filter back after a few captures with "All" shown
+                self.check(history)
+
+    def test_delete_and_merge(self):
+        history = self.history
+        self.check(history)
+        url_ids = [item['id'] for item in history if item['kind'] == 'url']
+        history, _ = history_core.apply_batch(history, url_ids[:2], 'delete')
+        self.check(history)
+        history = history_core.merge_items(history, [make_item("x = 1", 50, 'code')])
+        self.check(history)
+
+    def test_other_list_with_same_shape(self):
+        self.check(self.history)
+        # Same length and same first item, different contents
+        other = self.history[:1] + [make_item(f"print({n})", 10 + n, 'code') for n in range(5)]
+        self.check(other)
+
+    def test_reclassified(self):
+        self.check(self.history)
+        self.history[1]['kind'] = 'code'
+        history_core.invalidate_kinds()
+        self.check(self.history)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+# URL helpers shared by the preview pane and storage maintenance.
+#
+# Screenshots for the preview pane are taken by one long-lived headless
+# Chromium, owned by a worker thread (Playwright's sync API must stay on the
+# thread that started it) and closed again after a minute without requests.
+#
+# The default 'fast' mode only needs a thumbnail for a 400x400 pane, so it:
+#   * blocks media, fonts and known tracker/analytics hosts
+#   * renders a 1024x768 page at half device scale (a quarter of the pixels)
+#   * returns once the DOM is loaded and something has been painted, instead of
+#     waiting for the network to go idle
+#   * stores a small JPEG (url_screenshots/<hash>.jpg)
+# 'full' is the old behaviour (network idle + 1 s, 1280x720 PNG), kept for
+# pages that need it and for benchmarks/bench_screenshot.py.
+import hashlib
+import io
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from urllib.parse import urlparse
+
+# Screenshot cache directory
+SCREENSHOT_CACHE_DIR = "url_screenshots"
+SCREENSHOT_MODES = ('fast', 'full')
+SCREENSHOT_EXTENSIONS = {'fast': '.jpg', 'full': '.png'}
+THUMBNAIL_SIZE = (400, 400)
+THUMBNAIL_QUALITY = 75
+FAST_VIEWPORT = {'width': 1024, 'height': 768}
+FAST_SCALE = 0.5
+FAST_TIMEOUT_MS = 10000
+PAINT_TIMEOUT_MS = 2000
+# Close the browser after this long without screenshot requests
+BROWSER_IDLE_SECONDS = 60
+
+BLOCKED_RESOURCE_TYPES = ('media', 'font', 'websocket', 'eventsource', 'manifest', 'texttrack')
+TRACKER_HOSTS = ('google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googlesyndication.com',
+                 'adservice.google.com', 'facebook.net', 'connect.facebook.com', 'hotjar.com', 'segment.io',
+                 'segment.com', 'mixpanel.com', 'amplitude.com', 'newrelic.com', 'nr-data.net', 'scorecardresearch.com',
+                 'quantserve.com', 'taboola.com', 'outbrain.com', 'criteo.com', 'adnxs.com', 'clarity.ms')
+
+# Function to normalize URL
+def normalize_url(url):
+    """Add http:// if URL doesn't have a protocol"""
+    url = url.strip()
+    if not url.startswith(('http://', 'https://', 'ftp://')):
+        # Check if it looks like a URL (has a domain extension)
+        if '.' in url and ' ' not in url:
+            return 'http://' + url
+    return url
+
+# Function to get where the screenshot of a URL is cached
+def screenshot_path(url, mode='fast'):
+    # Cache filename based on URL hash
+    url_hash = hashlib.md5(normalize_url(url).encode()).hexdigest()
+    return os.path.join(SCREENSHOT_CACHE_DIR, f"{url_hash}{SCREENSHOT_EXTENSIONS[mode]}")
+
+def is_tracker(url):
+    host = (urlparse(url).hostname or '').lower()
+    return any(host == tracker or host.endswith('.' + tracker) for tracker in TRACKER_HOSTS)
+
+def _block_heavy(route):
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or is_tracker(request.url):
+        route.abort()
+    else:
+        route.continue_()
+
+# Function to take a screenshot with an already running browser
+def take_screenshot(browser, url, path, mode='fast'):
+    if mode == 'full':
+        page = browser.new_page(viewport={'width': 1280, 'height': 720})
+        try:
+            page.goto(url, wait_until='networkidle', timeout=30000)
+            page.wait_for_timeout(1000)  # Extra wait for rendering
+            page.screenshot(path=path)
+        finally:
+            page.close()
+        return path
+
+    from PIL import Image
+    from playwright.sync_api import TimeoutError as PlaywrightTimeout
+    context = browser.new_context(viewport=FAST_VIEWPORT, device_scale_factor=FAST_SCALE,
+                                  service_workers='block')
+    try:
+        context.route("**/*", _block_heavy)
+        page = context.new_page()
+        try:
+            page.goto(url, wait_until='domcontentloaded', timeout=FAST_TIMEOUT_MS)
+        except PlaywrightTimeout:
+            pass  # Slow page: the screenshot shows what has loaded so far
+        try:
+            page.wait_for_function("performance.getEntriesByType('paint').length > 0",
+                                   timeout=PAINT_TIMEOUT_MS)
+        except Exception:
+            pass  # Take whatever is there
+        png = page.screenshot(animations='disabled', caret='initial')
+    finally:
+        context.close()
+    img = Image.open(io.BytesIO(png)).convert('RGB')
+    img.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+    tmp_path = f"{path}.tmp"
+    img.save(tmp_path, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+    os.replace(tmp_path, path)
+    return path
+
+# The screenshot worker: requests waiting for the browser
+_requests = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+def _fail_waiting(error):
+    while True:
+        try:
+            future = _requests.get_nowait()[3]
+        except queue.Empty:
+            return
+        if future.set_running_or_notify_cancel():
+            future.set_exception(error)
+
+def _run():
+    try:
+        from playwright.sync_api import sync_playwright
+        p = sync_playwright().start()
+    except Exception as e:
+        # The next request starts a new worker
+        _fail_waiting(e)
+        return
+    browser = None
+    while True:
+        try:
+            url, path, mode, future = _requests.get(timeout=BROWSER_IDLE_SECONDS)
+        except queue.Empty:
+            if browser is not None:
+                browser.close()
+                browser = None
+            continue
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            if browser is None or not browser.is_connected():
+                browser = p.chromium.launch(headless=True)
+            future.set_result(take_screenshot(browser, url, path, mode))
+        except Exception as e:
+            future.set_exception(e)
+
+# Function to get a screenshot of a URL (cached); blocks until it's taken
+def capture_screenshot(url, mode='fast', timeout=60):
+    """Return the path of the screenshot"""
+    global _worker
+    url = normalize_url(url)
+    path = screenshot_path(url, mode)
+    if os.path.exists(path):
+        return path
+    os.makedirs(SCREENSHOT_CACHE_DIR, exist_ok=True)
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="screenshot-worker", daemon=True)
+            _worker.start()
+    future = Future()
+    _requests.put((url, path, mode, future))
+    return future.result(timeout)